@@ -0,0 +1,271 @@
+"""
+Benchmark the message pipeline and the stats commands against synthetic data.
+
+Seeds a temporary SQLite database with the requested number of credits, then
+drives MessageEvents.on_message and the /profile, /leaderboard, /timer and
+/chain handlers with fake discord.py objects. Reports throughput, p50/p99
+latency and SQL queries per operation, and writes the results as JSON so runs
+from different revisions can be compared.
+
+Usage:
+    python -m benchmarks.bench_bot --credits 100000 --messages 2000
+    python -m benchmarks.bench_bot --rate 50 --discord-latency-ms 80
+    python -m benchmarks.bench_bot --compare benchmarks/results/abc1234.json
+    python -m benchmarks.bench_bot --guilds 8 --shard --rate 400
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+COMMANDS = ['profile', 'leaderboard', 'timer', 'chain']
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark message handling and stats commands")
+    parser.add_argument('--credits', type=int, default=1000, help="Credits to seed (1k to 1M)")
+    parser.add_argument('--users', type=int, default=None, help="Users to seed (default: credits / 50, at least 10)")
+    parser.add_argument('--messages', type=int, default=1000, help="Messages to send through on_message")
+    parser.add_argument('--rate', type=float, default=0,
+                        help="Messages per second; 0 sends them back to back as fast as possible")
+    parser.add_argument('--noise', type=float, default=0.3, help="Fraction of messages that aren't drink checks")
+    parser.add_argument('--guilds', type=int, default=1, help="Guilds the messages are spread over")
+    parser.add_argument('--shard', action='store_true',
+                        help="Give every guild but the first (which keeps the seeded data) its own database shard")
+    parser.add_argument('--iterations', type=int, default=100, help="Invocations per slash command")
+    parser.add_argument('--commands', default=','.join(COMMANDS), help="Comma-separated commands to run")
+    parser.add_argument('--discord-latency-ms', type=float, default=0, help="Simulated REST latency for sends and reactions")
+    parser.add_argument('--seed', type=int, default=1, help="Random seed")
+    parser.add_argument('--output', default=None, help="Result file (default: benchmarks/results/<revision>.json)")
+    parser.add_argument('--compare', default=None, help="Previous result file to compare against")
+    parser.add_argument('--verbose', action='store_true', help="Keep the bot's INFO logging")
+    return parser.parse_args()
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def seed_database(path: str, credits: int, users: int, rng: random.Random):
+    """Bulk insert users, chains, drink checks and credits with the raw sqlite3 driver."""
+    conn = sqlite3.connect(path)
+    now = datetime.utcnow()
+    fmt = '%Y-%m-%d %H:%M:%S.%f'
+    user_totals = [0] * users
+    user_streaks = [0] * users
+
+    chains = []
+    drink_checks = []
+    credit_rows = []
+    message_id = 1
+    chain_id = 0
+    while message_id <= credits:
+        chain_id += 1
+        length = min(rng.randint(1, 30), credits - message_id + 1)
+        start = now - timedelta(minutes=rng.randint(60, 90 * 24 * 60))
+        first_message = message_id
+        for position in range(length):
+            user_idx = rng.randrange(users)
+            timestamp = (start + timedelta(minutes=position)).strftime(fmt)
+            drink_checks.append((message_id, user_idx + 1, chain_id, 0, None, timestamp))
+            credit_rows.append((user_idx + 1, message_id, 'initial' if position == 0 else 'chain', timestamp))
+            user_totals[user_idx] += 1
+            user_streaks[user_idx] = max(user_streaks[user_idx], length)
+            message_id += 1
+        chains.append((chain_id, drink_checks[first_message - 1][1], first_message, message_id - 1,
+                       drink_checks[-1][1], start.strftime(fmt),
+                       (start + timedelta(minutes=length - 1)).strftime(fmt), 0, length, 0))
+
+    # Longest chain holds the server record
+    if chains:
+        record = max(range(len(chains)), key=lambda idx: chains[idx][8])
+        chains[record] = chains[record][:9] + (1,)
+
+    conn.executemany(
+        "INSERT INTO users (user_id, username, total_credits, longest_chain_streak) VALUES (?, ?, ?, ?)",
+        [(idx + 1, f"user{idx + 1}", user_totals[idx], user_streaks[idx]) for idx in range(users)]
+    )
+    conn.executemany(
+        "INSERT INTO active_chains (chain_id, starter_id, start_message_id, last_message_id, "
+        "last_message_author_id, start_time, last_activity, is_active, total_messages, is_server_record) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", chains
+    )
+    conn.executemany(
+        "INSERT INTO drink_checks (message_id, user_id, chain_id, is_reply, replied_to_message_id, timestamp) "
+        "VALUES (?, ?, ?, ?, ?, ?)", drink_checks
+    )
+    conn.executemany(
+        "INSERT INTO credits (user_id, message_id, credit_type, timestamp) VALUES (?, ?, ?, ?)", credit_rows
+    )
+    conn.commit()
+    conn.close()
+
+def summarize(latencies: List[float], elapsed: float, queries: Optional[int]) -> Dict:
+    ordered = sorted(latencies)
+    count = len(ordered)
+
+    def percentile(q):
+        return ordered[min(count - 1, int(q * count))] * 1000 if count else 0.0
+
+    return {
+        'operations': count,
+        'throughput_per_s': count / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(0.50),
+        'p99_ms': percentile(0.99),
+        'mean_ms': (sum(ordered) / count) * 1000 if count else 0.0,
+        'queries_per_op': (queries / count) if count and queries is not None else None,
+    }
+
+async def bench_messages(bot, args, rng: random.Random) -> Dict:
+    from benchmarks.fakes import FakeChannel, FakeMessage, FakeUser
+    from database.profiler import profiler
+
+    cog = bot.get_cog('MessageEvents')
+    channel = FakeChannel(latency=args.discord_latency_ms / 1000)
+    authors = [FakeUser(rng.randint(1, args.users)) for _ in range(50)]
+    messages = []
+    for idx in range(args.messages):
+        noise = rng.random() < args.noise
+        # Round robin, so each guild's first message starts its chain
+        started = idx < args.guilds
+        messages.append(FakeMessage(
+            rng.choice(authors), channel,
+            content='drink check' if started else '',
+            attachments=0 if noise and not started else 1,
+            guild_id=idx % args.guilds + 1
+        ))
+
+    latencies = []
+
+    async def handle(message):
+        start = time.perf_counter()
+        await cog.on_message(message)
+        latencies.append(time.perf_counter() - start)
+
+    profiler.reset()
+    started = time.perf_counter()
+    if args.rate > 0:
+        # Dispatch like the gateway does, one task per event on a fixed schedule
+        tasks = []
+        for idx, message in enumerate(messages):
+            delay = started + idx / args.rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(handle(message)))
+        await asyncio.gather(*tasks)
+    else:
+        for message in messages:
+            await handle(message)
+    elapsed = time.perf_counter() - started
+
+    stats = profiler.operations.get('on_message')
+    return summarize(latencies, elapsed, stats.queries if stats else None)
+
+async def bench_command(bot, name: str, args, rng: random.Random) -> Dict:
+    from benchmarks.fakes import FakeInteraction, FakeUser
+    from database.profiler import profiler
+
+    cog = bot.get_cog('StatsCommands')
+    command = next(cmd for cmd in cog.walk_app_commands() if cmd.name == name)
+
+    latencies = []
+    profiler.reset()
+    started = time.perf_counter()
+    for _ in range(args.iterations):
+        interaction = FakeInteraction(FakeUser(rng.randint(1, args.users)))
+        start = time.perf_counter()
+        await command.callback(cog, interaction)
+        latencies.append(time.perf_counter() - start)
+    elapsed = time.perf_counter() - started
+
+    stats = profiler.operations.get(f"/{name}")
+    return summarize(latencies, elapsed, stats.queries if stats else None)
+
+async def run_benchmarks(args) -> Dict:
+    import main as app
+    from database.connection import init_db
+
+    if not args.verbose:
+        # Per-message INFO logs would dominate the timings
+        logging.getLogger().setLevel(logging.WARNING)
+
+    rng = random.Random(args.seed)
+    bot = app.DrinkCheckBot()
+    init_db()
+    seed_database(args.db_path, args.credits, args.users, rng)
+    for extension in app.EXTENSIONS:
+        await bot.load_extension(extension)
+    await bot.warm_up()
+
+    results = {'on_message': await bench_messages(bot, args, rng)}
+    for name in [cmd.strip() for cmd in args.commands.split(',') if cmd.strip()]:
+        results[f"/{name}"] = await bench_command(bot, name, args, rng)
+    await bot.close()
+    return results
+
+def print_results(results: Dict, baseline: Optional[Dict] = None):
+    print(f"{'operation':<14}{'ops':>8}{'ops/s':>11}{'p50 ms':>9}{'p99 ms':>9}{'q/op':>7}")
+    for name, result in results.items():
+        queries = result['queries_per_op']
+        line = (f"{name:<14}{result['operations']:>8}{result['throughput_per_s']:>11.1f}"
+                f"{result['p50_ms']:>9.2f}{result['p99_ms']:>9.2f}"
+                f"{queries if queries is not None else float('nan'):>7.1f}")
+        old = (baseline or {}).get(name)
+        if old and old['throughput_per_s']:
+            change = (result['throughput_per_s'] / old['throughput_per_s'] - 1) * 100
+            line += f"   throughput {change:+.1f}%, p99 {old['p99_ms']:.2f} -> {result['p99_ms']:.2f}ms"
+        print(line)
+
+def main():
+    args = parse_args()
+    args.users = args.users or max(10, args.credits // 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Point the app at a scratch database before anything imports database.connection
+        args.db_path = os.path.join(tmp, 'bench.db')
+        os.environ['DATABASE_URL'] = f"sqlite:///{args.db_path}"
+        os.environ.setdefault('COMMAND_SYNC_STATE_PATH', os.path.join(tmp, 'command_sync.json'))
+        # Messages are sent as fast as possible; the flood guard would drop most of them
+        os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+        # The event log is part of the write path, so it's measured, but never into the live log
+        os.environ['EVENT_LOG_DIR'] = os.path.join(tmp, 'event_log')
+        # Set either way, so a DB_SHARD_DIR from .env never sends guilds to the live shard files
+        os.environ['DB_SHARD_DIR'] = os.path.join(tmp, 'shards') if args.shard else ''
+        os.environ['DB_SHARD_MAP'] = '1=main' if args.shard else ''
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+        results = asyncio.run(run_benchmarks(args))
+
+    revision = git_revision()
+    report = {
+        'revision': revision,
+        'timestamp': datetime.utcnow().isoformat() + 'Z',
+        'params': {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'db_path', 'verbose')},
+        'results': results,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+    print_results(results, baseline)
+
+    output = args.output or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results', f"{revision}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Compare the bot's memory use with and without LOW_MEMORY_MODE.
+
+Each mode runs in a fresh process so RSS isn't shared between them. The
+process builds DrinkCheckBot and feeds its gateway state a synthetic guild:
+a GUILD_CREATE for a large guild, the member list chunks the gateway would
+send back if the bot asks for them (only when discord.py decides the guild
+needs chunking under that mode), then MESSAGE_CREATE events from random
+members. RSS is sampled after each stage.
+
+Usage:
+    python -m benchmarks.bench_memory --members 200000 --messages 20000
+    python -m benchmarks.bench_memory --members 50000 --json
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+MODES = {'default': '0', 'low_memory': '1'}
+GUILD_ID = 1
+CHANNEL_ID = 10
+# Members per GUILD_MEMBERS_CHUNK, as Discord sends them
+CHUNK_SIZE = 1000
+ROLES = 20
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare RSS with and without LOW_MEMORY_MODE")
+    parser.add_argument('--members', type=int, default=100000, help="Members in the synthetic guild")
+    parser.add_argument('--messages', type=int, default=10000, help="Messages to parse after the guild loads")
+    parser.add_argument('--seed', type=int, default=1, help="Random seed")
+    parser.add_argument('--json', action='store_true', help="Print the results as JSON")
+    # Internal: run one mode in this process and print its samples
+    parser.add_argument('--mode', choices=list(MODES), default=None, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def rss_bytes() -> int:
+    """Current resident set size; peak RSS where /proc isn't available"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+def user_payload(user_id: int) -> dict:
+    return {'id': str(user_id), 'username': f"member{user_id}", 'discriminator': '0',
+            'global_name': f"Member {user_id}", 'avatar': f"{user_id:032x}", 'bot': False}
+
+def member_payload(user_id: int, rng: random.Random) -> dict:
+    return {
+        'user': user_payload(user_id),
+        'roles': [str(100 + role) for role in rng.sample(range(ROLES), rng.randint(0, 3))],
+        'joined_at': '2024-01-01T00:00:00+00:00',
+        'deaf': False, 'mute': False, 'flags': 0,
+    }
+
+def guild_payload(members: int) -> dict:
+    return {
+        'id': str(GUILD_ID), 'name': 'Synthetic guild', 'owner_id': '1000',
+        'member_count': members, 'large': True, 'unavailable': False,
+        'features': [], 'emojis': [], 'stickers': [], 'threads': [], 'presences': [],
+        'voice_states': [], 'stage_instances': [], 'guild_scheduled_events': [],
+        'premium_tier': 0, 'afk_timeout': 300, 'verification_level': 0,
+        'default_message_notifications': 0, 'explicit_content_filter': 0, 'mfa_level': 0, 'nsfw_level': 0,
+        'roles': [{'id': str(GUILD_ID), 'name': '@everyone', 'permissions': '0', 'position': 0,
+                   'color': 0, 'hoist': False, 'managed': False, 'mentionable': False}] +
+                 [{'id': str(100 + role), 'name': f"role{role}", 'permissions': '0', 'position': role + 1,
+                   'color': 0, 'hoist': False, 'managed': False, 'mentionable': False} for role in range(ROLES)],
+        'channels': [{'id': str(CHANNEL_ID), 'type': 0, 'name': 'drink-checks', 'position': 0,
+                      'permission_overwrites': [], 'nsfw': False}],
+        # A large guild's GUILD_CREATE carries only a few members; the rest come from chunking
+        'members': [],
+    }
+
+def message_payload(message_id: int, author_id: int, rng: random.Random) -> dict:
+    member = member_payload(author_id, rng)
+    return {
+        'id': str(message_id), 'channel_id': str(CHANNEL_ID), 'guild_id': str(GUILD_ID),
+        'author': member.pop('user'), 'member': member,
+        'content': 'drink check' if rng.random() < 0.5 else '',
+        'timestamp': datetime.now(timezone.utc).isoformat(), 'edited_timestamp': None,
+        'tts': False, 'mention_everyone': False, 'mentions': [], 'mention_roles': [],
+        'attachments': [], 'embeds': [], 'pinned': False, 'type': 0,
+    }
+
+async def measure(members: int, messages: int, seed: int) -> dict:
+    import main as app
+
+    rng = random.Random(seed)
+    gc.collect()
+    samples = {'baseline': rss_bytes()}
+
+    bot = app.DrinkCheckBot()
+    # What login() does before connecting: bind the client to the running loop
+    await bot._async_setup_hook()
+    state = bot._connection
+    # Nothing is connected, so a chunk request is answered here instead of by the gateway
+    async def chunker(guild_id, query='', limit=0, presences=False, *, nonce=None):
+        pass
+    state.chunker = chunker
+
+    guild = state._get_create_guild(guild_payload(members))
+    chunked = state._guild_needs_chunking(guild)
+    if chunked:
+        await state.chunk_guild(guild, wait=False)
+        nonce = next(iter(state._chunk_requests.values())).nonce
+        count = (members + CHUNK_SIZE - 1) // CHUNK_SIZE
+        for index in range(count):
+            start = 1000 + index * CHUNK_SIZE
+            state.parse_guild_members_chunk({
+                'guild_id': str(GUILD_ID), 'chunk_index': index, 'chunk_count': count, 'nonce': nonce,
+                'members': [member_payload(user_id, rng) for user_id in range(start, min(start + CHUNK_SIZE, 1000 + members))],
+            })
+    gc.collect()
+    samples['guild_loaded'] = rss_bytes()
+
+    for message_id in range(messages):
+        state.parse_message_create(message_payload(10 ** 6 + message_id, 1000 + rng.randrange(members), rng))
+        # The gateway hands over one event at a time, so let its on_message run
+        await asyncio.sleep(0)
+    pending = asyncio.all_tasks() - {asyncio.current_task()}
+    if pending:
+        await asyncio.wait(pending)
+    gc.collect()
+    samples['after_messages'] = rss_bytes()
+
+    return {
+        'chunked': chunked,
+        'cached_members': len(guild.members),
+        'cached_users': len(state._users),
+        'cached_messages': len(state._messages) if state._messages is not None else 0,
+        'rss': samples,
+    }
+
+def run_mode(mode: str, args) -> dict:
+    env = dict(os.environ, LOW_MEMORY_MODE=MODES[mode], DATABASE_URL='sqlite://', EVENT_LOG_DIR='',
+               DB_SHARD_DIR='', DB_SHARD_MAP='')
+    output = subprocess.check_output(
+        [sys.executable, '-m', 'benchmarks.bench_memory', '--mode', mode,
+         '--members', str(args.members), '--messages', str(args.messages), '--seed', str(args.seed)],
+        env=env, text=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    return json.loads(output.strip().splitlines()[-1])
+
+def print_results(results: dict):
+    mib = 1024 * 1024
+    print(f"{'mode':<12} {'chunked':>7} {'members':>8} {'users':>8} {'messages':>8}"
+          f" {'baseline':>9} {'guild':>9} {'after':>9}")
+    for mode, result in results.items():
+        rss = result['rss']
+        print(f"{mode:<12} {str(result['chunked']):>7} {result['cached_members']:>8} {result['cached_users']:>8}"
+              f" {result['cached_messages']:>8} {rss['baseline'] / mib:>7.1f}Mi {rss['guild_loaded'] / mib:>7.1f}Mi"
+              f" {rss['after_messages'] / mib:>7.1f}Mi")
+    default, low = results['default']['rss'], results['low_memory']['rss']
+    growth = default['after_messages'] - default['baseline']
+    low_growth = low['after_messages'] - low['baseline']
+    if growth > 0:
+        print(f"\nGrowth over baseline: {growth / mib:.1f}Mi -> {low_growth / mib:.1f}Mi "
+              f"({(1 - low_growth / growth) * 100:.0f}% less)")
+
+def main():
+    args = parse_args()
+    if args.mode:
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        print(json.dumps(asyncio.run(measure(args.members, args.messages, args.seed))))
+        return
+
+    results = {mode: run_mode(mode, args) for mode in MODES}
+    if args.json:
+        print(json.dumps({'params': {'members': args.members, 'messages': args.messages}, 'results': results}, indent=2))
+    else:
+        print_results(results)
+
+if __name__ == "__main__":
+    main()
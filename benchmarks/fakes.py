@@ -0,0 +1,110 @@
+#stand-ins for the discord.py objects the handlers touch
+import asyncio
+import itertools
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import List, Optional
+
+_ids = itertools.count(10**17)
+
+def next_id() -> int:
+    """Snowflake-sized id, unique within the process."""
+    return next(_ids)
+
+class FakeAttachment:
+    def __init__(self, filename: str = 'drink.png', content_type: str = 'image/png', size: int = 50_000,
+                 data: Optional[bytes] = None):
+        self.id = next_id()
+        self.filename = filename
+        self.content_type = content_type
+        self.size = size
+        self.url = f"https://cdn.example/{self.id}/{filename}"
+        self._data = data
+
+    async def read(self) -> bytes:
+        return self._data if self._data is not None else b''
+
+class FakeUser:
+    def __init__(self, user_id: int, name: Optional[str] = None, bot: bool = False):
+        self.id = user_id
+        self.name = name or f"user{user_id}"
+        self.display_name = self.name
+        self.bot = bot
+        self.mention = f"<@{user_id}>"
+        self.display_avatar = SimpleNamespace(url=f"https://cdn.example/avatars/{user_id}.png")
+        self.roles: List = []
+
+    def __str__(self):
+        return self.name
+
+class FakeChannel:
+    """Records sent messages; latency simulates the Discord REST round trip."""
+
+    def __init__(self, channel_id: int = 1, latency: float = 0.0):
+        self.id = channel_id
+        self.latency = latency
+        self.sent: List[str] = []
+
+    async def send(self, content=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.sent.append(content)
+
+class FakeMessage:
+    def __init__(self, author: FakeUser, channel: FakeChannel, content: str = '', attachments: int = 1,
+                 reply_to: Optional[int] = None, guild_id: int = 1, created_at: Optional[datetime] = None):
+        self.id = next_id()
+        self.author = author
+        self.channel = channel
+        self.content = content
+        self.attachments = [FakeAttachment() for _ in range(attachments)]
+        self.reference = SimpleNamespace(message_id=reply_to) if reply_to else None
+        self.guild = SimpleNamespace(id=guild_id)
+        self.created_at = created_at or datetime.now(timezone.utc)
+        self.reactions: List[str] = []
+
+    async def add_reaction(self, emoji):
+        if self.channel.latency:
+            await asyncio.sleep(self.channel.latency)
+        self.reactions.append(emoji)
+
+class FakeResponse:
+    def __init__(self):
+        self.messages = []
+        self._done = False
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def send_message(self, content=None, **kwargs):
+        self._done = True
+        self.messages.append((content, kwargs))
+
+    async def defer(self, **kwargs):
+        self._done = True
+
+    async def edit_message(self, **kwargs):
+        self._done = True
+        self.messages.append((None, kwargs))
+
+class FakeFollowup:
+    def __init__(self):
+        self.messages = []
+
+    async def send(self, content=None, **kwargs):
+        self.messages.append((content, kwargs))
+
+class FakeInteraction:
+    def __init__(self, user: FakeUser, guild_id: int = 1, channel_id: int = 1):
+        self.id = next_id()
+        self.user = user
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.guild = SimpleNamespace(id=guild_id, roles=[])
+        self.response = FakeResponse()
+        self.followup = FakeFollowup()
+        self.edits = []
+
+    async def edit_original_response(self, content=None, **kwargs):
+        # A deferred command's answer replaces its "thinking" message
+        self.edits.append((content, kwargs))
@@ -0,0 +1,220 @@
+#duplicate drink photo detection
+import asyncio
+import hashlib
+import io
+import logging
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    from PIL import Image
+except ImportError:  # Optional dependency; without it photos aren't checked
+    Image = None
+
+HASHING_AVAILABLE = Image is not None
+
+from bot.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Width of the difference hash in bits per row; the hash has HASH_SIZE ** 2 bits
+HASH_SIZE = 8
+# Hashes with fewer set (or unset) bits than this say little about the photo: dark,
+# blank or evenly lit shots all hash close to zero. Those only match byte for byte
+MIN_HASH_BITS = 8
+
+@dataclass(frozen=True)
+class Fingerprint:
+    """What identifies a photo: its exact bytes and what it looks like."""
+    sha256: str
+    dhash: int
+
+def dhash(image) -> int:
+    """
+    Difference hash: shrink to (HASH_SIZE + 1) x HASH_SIZE greyscale and set a
+    bit wherever a pixel is brighter than its right-hand neighbour. Survives
+    re-encoding, resizing and small edits; a crop or a new photo changes it.
+    """
+    small = image.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+def fingerprint_bytes(data: bytes) -> Optional[Fingerprint]:
+    """Hash an encoded image. Runs in a worker process; returns None if it can't be decoded"""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            return Fingerprint(hashlib.sha256(data).hexdigest(), dhash(image))
+    except Exception:
+        return None
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+def is_distinctive(value_hash: int) -> bool:
+    """True if a difference hash has enough detail to compare photos by"""
+    return MIN_HASH_BITS <= value_hash.bit_count() <= HASH_SIZE ** 2 - MIN_HASH_BITS
+
+class BKTree:
+    """
+    Burkhard-Keller tree over hashes under Hamming distance. A search only
+    visits subtrees whose edge distance is within ``max_distance`` of the
+    query's distance to their parent, so near-duplicate lookups touch a small
+    fraction of the stored hashes.
+    """
+
+    def __init__(self):
+        self.root: Optional[list] = None  # [hash, value, {distance: child}]
+        self.size = 0
+
+    def add(self, value_hash: int, value=None):
+        self.size += 1
+        if self.root is None:
+            self.root = [value_hash, value, {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming(value_hash, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value_hash, value, {}]
+                return
+            node = child
+
+    def search(self, query: int, max_distance: int) -> List[Tuple[int, int, object]]:
+        """Every (distance, hash, value) within ``max_distance`` of ``query``, closest first"""
+        if self.root is None:
+            return []
+        found = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            distance = hamming(query, node[0])
+            if distance <= max_distance:
+                found.append((distance, node[0], node[1]))
+            for edge, child in node[2].items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+        found.sort(key=lambda match: match[0])
+        return found
+
+    def __len__(self):
+        return self.size
+
+class PhotoIndex:
+    """
+    Stored photo fingerprints: exact matches by SHA-256, near matches through a
+    BK-tree. Photos without a distinctive hash are only matched exactly.
+    """
+
+    def __init__(self, max_distance: int):
+        self.max_distance = max_distance
+        self.by_sha: Dict[str, int] = {}  # sha256 -> message id
+        self.tree = BKTree()
+
+    def add(self, fingerprint: Fingerprint, message_id: int):
+        if fingerprint.sha256 in self.by_sha:
+            return
+        self.by_sha[fingerprint.sha256] = message_id
+        if is_distinctive(fingerprint.dhash):
+            self.tree.add(fingerprint.dhash, message_id)
+
+    def find_duplicate(self, fingerprint: Fingerprint) -> Optional[int]:
+        """Message id of a stored photo that is the same or looks the same, if any"""
+        message_id = self.by_sha.get(fingerprint.sha256)
+        if message_id is not None:
+            return message_id
+        if not is_distinctive(fingerprint.dhash):
+            return None
+        matches = self.tree.search(fingerprint.dhash, self.max_distance)
+        return matches[0][2] if matches else None
+
+    def __len__(self):
+        return len(self.by_sha)
+
+class AttachmentValidator:
+    """
+    Fingerprints a message's image attachments off the event loop and spots
+    photos that were already used for a drink check. Attachments that aren't
+    images, or are too large to fetch, are left unchecked.
+    """
+
+    def __init__(self, max_distance: int = 6, max_bytes: int = 25 * 1024 * 1024,
+                 concurrency: int = 4, workers: int = 2, executor: Optional[Executor] = None):
+        self.index = PhotoIndex(max_distance)
+        self.max_bytes = max_bytes
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.workers = workers
+        self._executor = executor
+
+    @property
+    def executor(self) -> Executor:
+        # Started on first use so processes aren't started before they're needed. Not forked
+        # from the bot, whose logging and pool threads could leave a copied lock held
+        if self._executor is None:
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context(method))
+        return self._executor
+
+    def should_fetch(self, attachment) -> bool:
+        """Cheap checks on the attachment metadata before downloading anything"""
+        content_type = getattr(attachment, 'content_type', None) or ''
+        size = getattr(attachment, 'size', 0) or 0
+        return content_type.startswith('image/') and 0 < size <= self.max_bytes
+
+    async def _fingerprint(self, attachment) -> Optional[Fingerprint]:
+        async with self.semaphore:
+            try:
+                with metrics.time('attachment_fetch'):
+                    data = await attachment.read()
+            except Exception as e:
+                logger.warning(f"Couldn't fetch attachment {attachment.filename}: {e}")
+                return None
+        if not data:
+            return None
+        with metrics.time('attachment_hash'):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, fingerprint_bytes, data)
+
+    async def fingerprint_message(self, message) -> List[Fingerprint]:
+        """Fingerprints of the message's image attachments, one per distinct photo"""
+        attachments = [a for a in (message.attachments or []) if self.should_fetch(a)]
+        if not attachments:
+            return []
+        results = await asyncio.gather(*(self._fingerprint(a) for a in attachments))
+        unique = {}
+        for fingerprint in results:
+            if fingerprint is not None:
+                unique.setdefault(fingerprint.sha256, fingerprint)
+        return list(unique.values())
+
+    def find_duplicates(self, fingerprints: Sequence[Fingerprint]) -> List[Optional[int]]:
+        """For each fingerprint, the message that already used the photo (or None)"""
+        return [self.index.find_duplicate(fingerprint) for fingerprint in fingerprints]
+
+    def is_repost(self, fingerprints: Sequence[Fingerprint]) -> bool:
+        """True if every checked photo was used before. Unchecked messages aren't reposts"""
+        return bool(fingerprints) and all(match is not None for match in self.find_duplicates(fingerprints))
+
+    def remember(self, fingerprints: Iterable[Fingerprint], message_id: int):
+        for fingerprint in fingerprints:
+            self.index.add(fingerprint, message_id)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+def to_signed64(value: int) -> int:
+    """Store an unsigned 64-bit hash in a signed BIGINT column"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+def from_signed64(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
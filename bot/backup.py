@@ -0,0 +1,220 @@
+#online database backups
+import asyncio
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import time
+from dataclasses import dataclass, replace
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from bot.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+BACKUP_PREFIX = 'drink_check-'
+# Copy buffer for compression
+CHUNK_SIZE = 1024 * 1024
+# Times the copy may be restarted by writes before it's done in one step
+MAX_RESTARTS = 3
+
+class _Restarted(Exception):
+    """SQLite started the copy over because the database changed"""
+
+ProgressCallback = Callable[[int, int], None]
+
+@dataclass(frozen=True)
+class BackupResult:
+    path: str
+    pages: int
+    size: int  # Bytes on disk, after compression
+    seconds: float
+    # Shard files backed up along with the main database, and ones that failed
+    shards: int = 0
+    shard_failures: int = 0
+
+class BackupManager:
+    """
+    Copies the live SQLite database with the online backup API. Each step
+    copies ``pages_per_step`` pages and then releases the database, sleeping
+    ``step_pause`` so the bot's writes get in between. A write during the copy
+    makes SQLite start over, so the file is always a consistent snapshot; to
+    make sure a busy database still gets backed up, each restart makes the
+    steps 4x larger, and after MAX_RESTARTS the copy is done in one step.
+    The copy runs on a worker thread, is checked and gzipped, and only the
+    newest ``keep`` backups are kept.
+
+    ``shards`` lists the per-guild shard files (name -> path) to back up
+    after the main database, each into ``<directory>/shards/<name>`` with the
+    same settings and rotation.
+    """
+
+    def __init__(self, db_path: str, directory: str, keep: int = 7, pages_per_step: int = 256,
+                 step_pause: float = 0.005, compress: bool = True,
+                 shards: Optional[Callable[[], Dict[str, str]]] = None):
+        self.db_path = db_path
+        self.directory = directory
+        self.keep = keep
+        self.pages_per_step = pages_per_step
+        self.step_pause = step_pause
+        self.compress = compress
+        # Pages copied and total pages of the backup in progress
+        self.progress = (0, 0)
+        self.last_result: Optional[BackupResult] = None
+        self.shards = shards
+        self._lock = asyncio.Lock()
+        self._schedule_task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    async def backup(self) -> BackupResult:
+        """Take a backup now; waits for one that's already running to finish first"""
+        async with self._lock:
+            self.progress = (0, 0)
+            with metrics.time('backup'):
+                result = await asyncio.to_thread(self.run_backup, self._set_progress)
+                if self.shards is not None:
+                    done, failed = await asyncio.to_thread(self.run_shard_backups, self._set_progress)
+                    result = replace(result, shards=done, shard_failures=failed)
+            self.last_result = result
+            return result
+
+    def _set_progress(self, copied: int, total: int):
+        self.progress = (copied, total)
+
+    def run_backup(self, progress: Optional[ProgressCallback] = None) -> BackupResult:
+        """Blocking backup, for the worker thread (or scripts)"""
+        started = time.perf_counter()
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{BACKUP_PREFIX}{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.db"
+        copy_path = os.path.join(self.directory, name + '.partial')
+
+        try:
+            # A separate connection, so the bot's pool is never involved
+            source = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+            target = sqlite3.connect(copy_path)
+            try:
+                self._copy(source, target, progress)
+                pages = target.execute("PRAGMA page_count").fetchone()[0]
+                check = target.execute("PRAGMA quick_check").fetchone()[0]
+                if check != 'ok':
+                    raise RuntimeError(f"Backup failed its integrity check: {check}")
+            finally:
+                target.close()
+                source.close()
+
+            final_path = os.path.join(self.directory, name + ('.gz' if self.compress else ''))
+            if self.compress:
+                with open(copy_path, 'rb') as raw, gzip.open(final_path + '.partial', 'wb', compresslevel=6) as packed:
+                    shutil.copyfileobj(raw, packed, CHUNK_SIZE)
+                os.replace(final_path + '.partial', final_path)
+                os.remove(copy_path)
+            else:
+                os.replace(copy_path, final_path)
+        except BaseException:
+            for leftover in (copy_path, copy_path[:-len('.partial')] + '.gz.partial'):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            raise
+
+        self.rotate()
+        result = BackupResult(final_path, pages, os.path.getsize(final_path), time.perf_counter() - started)
+        logger.info(f"Backed up {pages} pages to {final_path} ({result.size // 1024} KiB, {result.seconds:.1f}s)")
+        return result
+
+    def run_shard_backups(self, progress: Optional[ProgressCallback] = None):
+        """Back up every shard file that exists; returns (backed up, failed). Blocking"""
+        done = failed = 0
+        for name, path in sorted(self.shards().items()):
+            if not os.path.exists(path):
+                continue
+            shard = BackupManager(path, os.path.join(self.directory, 'shards', name), self.keep,
+                                  self.pages_per_step, self.step_pause, self.compress)
+            # One shard failing doesn't cost the others their backup
+            try:
+                shard.run_backup(progress)
+                done += 1
+            except Exception as e:
+                failed += 1
+                metrics.inc('backup_failed_total')
+                logger.error(f"Backup of shard {name} failed: {e}", exc_info=True)
+        return done, failed
+
+    def _copy(self, source: sqlite3.Connection, target: sqlite3.Connection,
+              progress: Optional[ProgressCallback]):
+        pages = self.pages_per_step
+        for attempt in range(MAX_RESTARTS + 1):
+            copied_so_far = 0
+
+            def on_step(status, remaining, total):
+                nonlocal copied_so_far
+                copied = total - remaining
+                if copied < copied_so_far:
+                    raise _Restarted()
+                copied_so_far = copied
+                if progress:
+                    progress(copied, total)
+
+            try:
+                # The last attempt copies everything in one step, holding a read lock throughout
+                source.backup(target, pages=pages if attempt < MAX_RESTARTS else -1,
+                              progress=on_step, sleep=self.step_pause)
+                return
+            except _Restarted:
+                metrics.inc('backup_restarts_total')
+                logger.info(f"Database changed during backup, retrying with {pages * 4} pages per step")
+                pages *= 4
+
+    def backups(self) -> List[str]:
+        """Finished backups, newest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        names = [name for name in os.listdir(self.directory)
+                 if name.startswith(BACKUP_PREFIX) and not name.endswith('.partial')]
+        # Timestamped names sort chronologically
+        return [os.path.join(self.directory, name) for name in sorted(names, reverse=True)]
+
+    def rotate(self):
+        for path in self.backups()[self.keep:]:
+            os.remove(path)
+            logger.info(f"Removed old backup {path}")
+
+    def start_schedule(self, interval_hours: float):
+        """Back up every ``interval_hours`` in the background"""
+        if self._schedule_task is None:
+            self._schedule_task = asyncio.create_task(self._schedule(interval_hours * 3600))
+
+    async def _schedule(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.backup()
+            except Exception as e:
+                metrics.inc('backup_failed_total')
+                logger.error(f"Scheduled backup failed: {e}", exc_info=True)
+
+    async def stop(self):
+        if self._schedule_task:
+            self._schedule_task.cancel()
+            await asyncio.gather(self._schedule_task, return_exceptions=True)
+            self._schedule_task = None
+
+def get_backup_manager(bot) -> Optional[BackupManager]:
+    """The bot-wide BackupManager (with every shard, if DB_SHARD_DIR is set), or None if the database isn't a SQLite file."""
+    if not hasattr(bot, 'backups'):
+        from config.settings import BACKUP_DIR, BACKUP_KEEP, BACKUP_PAGES_PER_STEP, BACKUP_STEP_PAUSE_MS
+        from database.connection import engine
+        from database.sharding import shards
+        db_path = engine.url.database
+        if engine.url.get_backend_name() != 'sqlite' or not db_path or db_path == ':memory:':
+            bot.backups = None
+        else:
+            bot.backups = BackupManager(os.path.abspath(db_path), BACKUP_DIR, BACKUP_KEEP,
+                                        BACKUP_PAGES_PER_STEP, BACKUP_STEP_PAUSE_MS / 1000,
+                                        shards=(lambda: {name: shards.path(name) for name in shards.shards()})
+                                        if shards is not None else None)
+    return bot.backups
@@ -0,0 +1,122 @@
+#in-memory state shared between cogs
+import asyncio
+from dataclasses import dataclass
+from typing import List, Optional
+
+from bot.chain_engine import ChainState, EngineState
+from database.models import ActiveChain
+from database.sharding import shard_for
+
+# How many leaderboard rows are kept in memory
+LEADERBOARD_CACHE_SIZE = 100
+
+def chain_state_from_model(chain: ActiveChain) -> ChainState:
+    """Detached copy of a chain row for the engine and the caches"""
+    return ChainState(
+        chain_id=chain.chain_id,
+        starter_id=chain.starter_id,
+        start_message_id=chain.start_message_id,
+        last_message_id=chain.last_message_id,
+        last_message_author_id=chain.last_message_author_id,
+        start_time=chain.start_time,
+        last_activity=chain.last_activity,
+        total_messages=chain.total_messages,
+        is_server_record=bool(chain.is_server_record),
+        version=chain.version or 0,
+    )
+
+@dataclass(frozen=True)
+class LeaderboardEntry:
+    user_id: int
+    username: str
+    total_credits: int
+
+class StateCache:
+    """
+    Chain engine state, server record and leaderboard, warmed at startup and
+    kept up to date by the message handler. ``ready`` is set once warm-up has
+    finished so handlers don't run against half-loaded state.
+    """
+
+    def __init__(self):
+        self.ready = asyncio.Event()
+        # Until loaded, readers go to the database
+        self.chain_loaded = False
+        self.chain_state = EngineState()
+        self.record_starter_name: Optional[str] = None
+        self.leaderboard: Optional[List[LeaderboardEntry]] = None
+        # Bumped on every change to the board, so a reload that raced one can be discarded
+        self.leaderboard_generation = 0
+
+    def load_chain_state(self, active_chain: Optional[ActiveChain], record: Optional[ActiveChain],
+                         next_chain_id: int, starter_name: Optional[str] = None):
+        """Replace the engine state with what is in the database"""
+        self.chain_state = EngineState(
+            active_chain=chain_state_from_model(active_chain) if active_chain and active_chain.is_active else None,
+            record=chain_state_from_model(record) if record else None,
+            next_chain_id=next_chain_id,
+        )
+        self.record_starter_name = starter_name
+        self.chain_loaded = True
+
+    def set_chain_state(self, state: EngineState):
+        """Store the state the engine moved to once its effects are committed"""
+        previous_record = self.chain_state.record
+        if state.record and (previous_record is None or previous_record.chain_id != state.record.chain_id):
+            # Record changed hands, the starter name is looked up lazily
+            self.record_starter_name = None
+        self.chain_state = state
+        self.chain_loaded = True
+
+    @property
+    def active_chain(self) -> Optional[ChainState]:
+        return self.chain_state.active_chain
+
+    @property
+    def server_record(self) -> Optional[ChainState]:
+        return self.chain_state.record
+
+    def set_leaderboard(self, entries: List[LeaderboardEntry]):
+        self.leaderboard = entries[:LEADERBOARD_CACHE_SIZE]
+
+    def invalidate_leaderboard(self):
+        """Drop the cached leaderboard so the next read reloads it."""
+        self.leaderboard_generation += 1
+        self.leaderboard = None
+
+    def record_credit(self, user_id: int, username: str, total_credits: int):
+        """Keep the cached top of the leaderboard in step with a user's new total."""
+        self.leaderboard_generation += 1
+        if self.leaderboard is None:
+            return
+        entries = [entry for entry in self.leaderboard if entry.user_id != user_id]
+        if len(entries) == len(self.leaderboard) and len(entries) >= LEADERBOARD_CACHE_SIZE \
+                and total_credits <= entries[-1].total_credits:
+            # Not on the cached part of the board
+            return
+        entries.append(LeaderboardEntry(user_id, username, total_credits))
+        entries.sort(key=lambda entry: entry.total_credits, reverse=True)
+        self.leaderboard = entries[:LEADERBOARD_CACHE_SIZE]
+
+def get_state_cache(bot, guild_id: Optional[int] = None) -> StateCache:
+    """
+    The StateCache for the guild's database shard, created on first use. Guilds
+    in the main database (all of them without DB_SHARD_DIR) share the bot-wide
+    one, ``bot.state_cache``.
+    """
+    shard = shard_for(guild_id)
+    if shard is not None:
+        caches = getattr(bot, 'shard_state_caches', None)
+        if caches is None:
+            caches = bot.shard_state_caches = {}
+        cache = caches.get(shard)
+        if cache is None:
+            # Nothing is warmed for a shard; its chain state is loaded on first use
+            cache = caches[shard] = StateCache()
+            cache.ready.set()
+        return cache
+    cache = getattr(bot, 'state_cache', None)
+    if cache is None:
+        cache = StateCache()
+        bot.state_cache = cache
+    return cache
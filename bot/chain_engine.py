@@ -0,0 +1,263 @@
+"""
+Pure drink check chain rules.
+
+The engine knows nothing about discord.py or the database. It takes the
+current EngineState and a MessageEvent and returns the next state plus a list
+of effects (credit awarded, chain started, record broken, ...) for the caller
+to persist and announce. Time comes from an injectable clock, so the same
+rules run in the live bot and in offline simulations that fast-forward
+through chain timeouts.
+"""
+
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
+
+import pytz
+
+Clock = Callable[[], datetime]
+
+DEFAULT_KEYWORDS = ("drink check", "dc")
+DEFAULT_TIMEOUT = timedelta(minutes=30)
+# A chain update is announced every this many messages
+MILESTONE_EVERY = 5
+
+def utc_now() -> datetime:
+    """Default clock: the current time in UTC"""
+    return datetime.utcnow().replace(tzinfo=pytz.UTC)
+
+class ManualClock:
+    """Clock for simulations and replays that only moves when told to."""
+
+    def __init__(self, start: Optional[datetime] = None):
+        self.now = start or utc_now()
+
+    def __call__(self) -> datetime:
+        return self.now
+
+    def advance(self, seconds: float = 0, **kwargs):
+        self.now += timedelta(seconds=seconds, **kwargs)
+
+    def set(self, now: datetime):
+        self.now = now
+
+@dataclass(frozen=True, slots=True)
+class MessageEvent:
+    """The parts of a Discord message the chain rules look at."""
+    message_id: int
+    author_id: int
+    content: str = ''
+    attachment_count: int = 0
+    is_reply: bool = False
+    replied_to_message_id: Optional[int] = None
+
+@dataclass(frozen=True, slots=True)
+class ChainState:
+    chain_id: int
+    starter_id: int
+    start_message_id: int
+    last_message_id: int
+    last_message_author_id: int
+    start_time: datetime
+    last_activity: datetime
+    total_messages: int = 1
+    is_server_record: bool = False
+    # Bumped by every update to the chain row; the store only applies an update
+    # if the row is still at the version the update was computed from
+    version: int = 0
+
+@dataclass(frozen=True, slots=True)
+class EngineState:
+    active_chain: Optional[ChainState] = None
+    # Chain currently holding the server record
+    record: Optional[ChainState] = None
+    # Chain ids are allocated by the engine so effects can reference them before they're stored
+    next_chain_id: int = 1
+
+# Effects, in the order they should be applied
+
+@dataclass(frozen=True, slots=True)
+class ChainExpired:
+    chain: ChainState
+
+@dataclass(frozen=True, slots=True)
+class ChainStarted:
+    chain: ChainState
+
+@dataclass(frozen=True, slots=True)
+class ChainExtended:
+    chain: ChainState
+
+@dataclass(frozen=True, slots=True)
+class DrinkCheckAccepted:
+    message_id: int
+    user_id: int
+    chain_id: int
+    is_reply: bool
+    replied_to_message_id: Optional[int]
+    timestamp: datetime
+
+@dataclass(frozen=True, slots=True)
+class CreditAwarded:
+    user_id: int
+    message_id: int
+    credit_type: str  # 'initial' or 'chain'
+    timestamp: datetime
+
+@dataclass(frozen=True, slots=True)
+class RecordBroken:
+    chain: ChainState
+    previous_chain_id: Optional[int]
+
+@dataclass(frozen=True, slots=True)
+class ChainMilestone:
+    chain: ChainState
+
+def normalize_timestamp(value: datetime) -> datetime:
+    """Treat naive datetimes (as SQLite returns them) as UTC"""
+    return value.replace(tzinfo=pytz.UTC) if value.tzinfo is None else value
+
+def is_expired(last_activity: Optional[datetime], now: datetime, timeout: timedelta = DEFAULT_TIMEOUT) -> bool:
+    """A chain expires after ``timeout`` without activity"""
+    if not last_activity:
+        return True
+    return (now - normalize_timestamp(last_activity)) > timeout
+
+def keyword_variations(keywords: Iterable[str]) -> Tuple[str, ...]:
+    """Every spelling of the keywords that starts a chain"""
+    variations = []
+    for keyword in keywords:
+        variations.extend([
+            keyword,
+            f"{keyword}!",
+            f"{keyword}?",
+            f"{keyword}.",
+            "d c",
+        ])
+    return tuple(variations)
+
+def has_keyword(content: str, variations: Sequence[str]) -> bool:
+    content_lower = content.lower().strip()
+    return any(variation in content_lower for variation in variations)
+
+def qualifies(attachment_count: int, is_reply: bool, chain_active: bool, content: str,
+              variations: Sequence[str]) -> bool:
+    """
+    Check if a message is a valid drink check. Valid cases:
+    1. Normal message with no active chain: Must have "dc" (or variant) AND attachment
+    2. Message during active chain: Only needs attachment
+    3. Reply: Must have attachment (with or without "dc")
+    """
+    if attachment_count <= 0:
+        return False  # No attachment = no drink check
+    if is_reply or chain_active:
+        return True
+    return has_keyword(content, variations)
+
+class ChainEngine:
+    def __init__(self, clock: Clock = utc_now, timeout: timedelta = DEFAULT_TIMEOUT,
+                 keywords: Iterable[str] = DEFAULT_KEYWORDS, milestone_every: int = MILESTONE_EVERY):
+        self.clock = clock
+        self.timeout = timeout
+        self.variations = keyword_variations(keywords)
+        self.milestone_every = milestone_every
+
+    def is_expired(self, chain: Optional[ChainState], now: Optional[datetime] = None) -> bool:
+        if chain is None:
+            return True
+        return is_expired(chain.last_activity, now or self.clock(), self.timeout)
+
+    def live_chain(self, state: EngineState, now: Optional[datetime] = None) -> Optional[ChainState]:
+        """The active chain, or None if there isn't one or it has timed out"""
+        chain = state.active_chain
+        return None if chain is None or self.is_expired(chain, now) else chain
+
+    def is_drink_check(self, state: EngineState, event: MessageEvent, now: Optional[datetime] = None) -> bool:
+        return qualifies(
+            event.attachment_count, event.is_reply,
+            self.live_chain(state, now) is not None,
+            event.content, self.variations
+        )
+
+    def expire(self, state: EngineState, now: Optional[datetime] = None) -> Tuple[EngineState, list]:
+        """Close the active chain if it has timed out"""
+        chain = state.active_chain
+        if chain is None or not self.is_expired(chain, now):
+            return state, []
+        return replace(state, active_chain=None), [ChainExpired(chain)]
+
+    def step(self, state: EngineState, event: MessageEvent, now: Optional[datetime] = None) -> Tuple[EngineState, list]:
+        """
+        Apply one message to the state. Returns the new state and the effects
+        it produced; messages that aren't drink checks produce no effects.
+        The input state is never modified.
+        """
+        now = now or self.clock()
+        if not self.is_drink_check(state, event, now):
+            return state, []
+
+        state, effects = self.expire(state, now)
+        chain = state.active_chain
+
+        if chain is None:
+            # No active chain - starting a new one
+            chain = ChainState(
+                chain_id=state.next_chain_id,
+                starter_id=event.author_id,
+                start_message_id=event.message_id,
+                last_message_id=event.message_id,
+                last_message_author_id=event.author_id,
+                start_time=now,
+                last_activity=now,
+            )
+            effects.append(ChainStarted(chain))
+            effects.append(DrinkCheckAccepted(event.message_id, event.author_id, chain.chain_id,
+                                              event.is_reply, event.replied_to_message_id, now))
+            effects.append(CreditAwarded(event.author_id, event.message_id, 'initial', now))
+            return replace(state, active_chain=chain, next_chain_id=state.next_chain_id + 1), effects
+
+        # Active chain exists - add to it
+        chain = ChainState(
+            chain.chain_id, chain.starter_id, chain.start_message_id,
+            event.message_id, event.author_id, chain.start_time, now,
+            chain.total_messages + 1, chain.is_server_record, chain.version + 1
+        )
+        record = state.record
+        record_broken = None
+        if record is not None and record.chain_id == chain.chain_id:
+            # Already the record holder, it just keeps growing
+            record = chain
+        elif chain.total_messages > (record.total_messages if record else 0):
+            chain = replace(chain, is_server_record=True)
+            record_broken = RecordBroken(chain, record.chain_id if record else None)
+            record = chain
+
+        effects.append(ChainExtended(chain))
+        effects.append(DrinkCheckAccepted(event.message_id, event.author_id, chain.chain_id,
+                                          event.is_reply, event.replied_to_message_id, now))
+        effects.append(CreditAwarded(event.author_id, event.message_id, 'chain', now))
+        if record_broken:
+            effects.append(record_broken)
+        if self.milestone_every and chain.total_messages % self.milestone_every == 0:
+            effects.append(ChainMilestone(chain))
+
+        return EngineState(chain, record, state.next_chain_id), effects
+
+class ChainSimulator:
+    """Runs events through the engine offline, keeping the state between them."""
+
+    def __init__(self, engine: ChainEngine, state: Optional[EngineState] = None):
+        self.engine = engine
+        self.state = state or EngineState()
+
+    def feed(self, event: MessageEvent) -> list:
+        self.state, effects = self.engine.step(self.state, event)
+        return effects
+
+    def run(self, events: Iterable[MessageEvent]) -> List:
+        """Feed every event and return all effects produced"""
+        effects = []
+        for event in events:
+            self.state, produced = self.engine.step(self.state, event)
+            effects.extend(produced)
+        return effects
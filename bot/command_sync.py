@@ -0,0 +1,76 @@
+#slash command tree syncing
+import hashlib
+import json
+import logging
+import os
+from typing import Optional
+
+import discord
+from discord import app_commands
+
+logger = logging.getLogger(__name__)
+
+def _command_payload(command, tree: app_commands.CommandTree) -> dict:
+    """The payload discord.py would upload for a command."""
+    try:
+        return command.to_dict(tree)
+    except TypeError:
+        # discord.py < 2.4 takes no tree argument
+        return command.to_dict()
+
+def command_tree_hash(tree: app_commands.CommandTree, guild: Optional[discord.abc.Snowflake] = None) -> str:
+    """Stable hash of every command that a sync for this scope would upload."""
+    payloads = [_command_payload(command, tree) for command in tree.get_commands(guild=guild)]
+    payloads.sort(key=lambda payload: (payload.get('type', 1), payload['name']))
+    encoded = json.dumps(payloads, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+def load_sync_state(path: str) -> dict:
+    """Load the persisted command hashes, or an empty state if there are none."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable command sync state at {path}: {e}")
+        return {}
+
+def save_sync_state(path: str, state: dict):
+    """Persist the command hashes, replacing the file atomically."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+async def sync_command_tree(tree: app_commands.CommandTree, state_path: str,
+                            guild_id: Optional[int] = None, force: bool = False) -> bool:
+    """
+    Sync the command tree only if it differs from what was last synced.
+    With guild_id set, global commands are copied to that guild and synced
+    there, which Discord applies instantly and is handy while developing.
+    Returns True if a sync request was made.
+    """
+    guild = discord.Object(id=guild_id) if guild_id else None
+    if guild:
+        tree.copy_global_to(guild=guild)
+
+    scope = f"guild:{guild_id}" if guild_id else "global"
+    key = f"{tree.client.application_id}:{scope}"
+    current_hash = command_tree_hash(tree, guild=guild)
+
+    state = load_sync_state(state_path)
+    if not force and state.get(key) == current_hash:
+        logger.info(f"Slash commands unchanged for {scope}, skipping sync")
+        return False
+
+    logger.info(f"Syncing slash commands for {scope}...")
+    await tree.sync(guild=guild)
+
+    state[key] = current_hash
+    try:
+        save_sync_state(state_path, state)
+    except OSError as e:
+        logger.warning(f"Could not persist command sync state to {state_path}: {e}")
+    logger.info(f"Slash commands synced for {scope}")
+    return True
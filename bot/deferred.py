@@ -0,0 +1,105 @@
+#defer-and-followup execution for slow slash commands
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+
+import discord
+
+from bot.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+TIMEOUT_MESSAGE = "⏳ That's taking longer than it should. Please try again in a moment."
+
+class CommandTimeout(Exception):
+    """The command's work didn't finish in time; the user has already been told"""
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one computation: the
+    first caller starts it and everyone who asks before it finishes awaits the
+    same result (or exception). A caller that gives up doesn't cancel it for
+    the others.
+    """
+
+    def __init__(self):
+        self.calls: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, work: Callable[[], Awaitable[T]]) -> T:
+        task = self.calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(work())
+            self.calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            metrics.inc('singleflight_shared_total')
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        # Retrieve the exception so an abandoned failure isn't reported as never retrieved
+        if not task.cancelled():
+            task.exception()
+
+    def __len__(self):
+        return len(self.calls)
+
+class CommandRunner:
+    """
+    Runs a slash command's data work without risking Discord's 3 second
+    deadline for the first response. The interaction is deferred right away
+    (Discord shows "thinking..."), the work runs with ``timeout`` and
+    identical requests in flight at the same time share one run. The command
+    then answers with ``send``, which replaces the "thinking" message.
+
+    A public deferral can't be turned ephemeral afterwards, so once a command
+    is deferred without ``ephemeral`` every answer is public, the timeout
+    apology included.
+    """
+
+    def __init__(self, timeout: float = 10.0):
+        self.timeout = timeout
+        self.flights = SingleFlight()
+
+    async def run(self, interaction: discord.Interaction, key: Hashable,
+                  work: Callable[..., Awaitable[T]], *args: Any, ephemeral: bool = False) -> T:
+        """
+        Defer ``interaction`` and return ``await work(*args)``, shared with any
+        in-flight call with the same ``key``. Raises CommandTimeout after
+        telling the user (in the deferred message, public unless ``ephemeral``),
+        if the work takes longer than the timeout.
+        """
+        if not interaction.response.is_done():
+            await interaction.response.defer(thinking=True, ephemeral=ephemeral)
+            metrics.inc('commands_deferred_total')
+        try:
+            return await asyncio.wait_for(self.flights.do(key, lambda: work(*args)), self.timeout)
+        except asyncio.TimeoutError:
+            metrics.inc('command_timeouts_total')
+            logger.warning(f"{key} didn't finish within {self.timeout}s")
+            await interaction.edit_original_response(content=TIMEOUT_MESSAGE)
+            raise CommandTimeout(key)
+
+    @staticmethod
+    async def send(interaction: discord.Interaction, content: str = None, ephemeral: bool = False, **kwargs):
+        """
+        Answer the command, whether or not it was deferred. A deferred command's
+        "thinking" message is edited into the answer, so ``ephemeral`` only
+        applies if it wasn't deferred; the deferral decided that
+        """
+        if interaction.response.is_done():
+            await interaction.edit_original_response(content=content, **kwargs)
+        else:
+            await interaction.response.send_message(content, ephemeral=ephemeral, **kwargs)
+
+def get_command_runner(bot) -> CommandRunner:
+    """The bot-wide CommandRunner, created on first use."""
+    runner = getattr(bot, 'command_runner', None)
+    if runner is None:
+        from config.settings import COMMAND_TIMEOUT_SECONDS
+        runner = CommandRunner(COMMAND_TIMEOUT_SECONDS)
+        bot.command_runner = runner
+    return runner
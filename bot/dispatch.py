@@ -0,0 +1,114 @@
+#background Discord REST calls (reactions, chain notices)
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional, Set
+
+import discord
+
+from bot.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Backoff for retries when Discord doesn't say how long to wait
+BASE_RETRY_DELAY = 1.0
+
+def _retry_after(error: discord.HTTPException) -> Optional[float]:
+    """Seconds Discord asked us to wait, from the Retry-After header"""
+    headers = getattr(error.response, 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+class BackgroundDispatcher:
+    """
+    Runs Discord calls as tracked background tasks so message handlers don't
+    wait on REST round trips. At most ``concurrency`` calls are in flight.
+    Rate limits discord.py gave up waiting out (``discord.RateLimited``) are
+    retried, without holding a slot during the backoff; other 429s were
+    already retried by discord.py. 5xx responses are only retried for
+    idempotent calls, since a message Discord answered with a 502 may still
+    have been posted. Anything still pending at shutdown gets ``drain()``'s
+    timeout to finish.
+    """
+
+    def __init__(self, concurrency: int = 4, max_pending: int = 1000, max_retries: int = 3):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.tasks: Set[asyncio.Task] = set()
+        self.closed = False
+
+    @property
+    def pending(self) -> int:
+        return len(self.tasks)
+
+    def submit(self, name: str, call: Callable[[], Awaitable], idempotent: bool = False) -> Optional[asyncio.Task]:
+        """
+        Schedule ``call`` (a function returning a fresh coroutine, so it can be
+        retried). Pass ``idempotent=True`` if repeating a call that may already
+        have succeeded is harmless, such as adding a reaction. Returns None if
+        the call was dropped because the dispatcher is closed or the backlog is full.
+        """
+        if self.closed or len(self.tasks) >= self.max_pending:
+            metrics.inc('dispatch_dropped_total', name)
+            logger.warning(f"Dropped background {name}: {'shutting down' if self.closed else 'backlog full'}")
+            return None
+        task = asyncio.create_task(self._run(name, call, idempotent), name=f"dispatch:{name}")
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def _run(self, name: str, call: Callable[[], Awaitable], idempotent: bool):
+        for attempt in range(self.max_retries + 1):
+            # The slot is only held for the call itself, so a backoff doesn't hold up other calls
+            async with self.semaphore:
+                try:
+                    with metrics.time(name):
+                        await call()
+                    return
+                except discord.RateLimited as e:
+                    delay = e.retry_after
+                except discord.HTTPException as e:
+                    # discord.py has already waited out and retried any 429 it raises, and
+                    # its own 5xx retries are all a send that may have gone through gets
+                    if e.status < 500 or not idempotent:
+                        metrics.inc('dispatch_failed_total', name)
+                        logger.error(f"Background {name} failed: {e}")
+                        return
+                    delay = _retry_after(e) or BASE_RETRY_DELAY * 2 ** attempt
+                except Exception as e:
+                    metrics.inc('dispatch_failed_total', name)
+                    logger.error(f"Background {name} failed: {e}", exc_info=True)
+                    return
+
+            if attempt == self.max_retries:
+                break
+            metrics.inc('dispatch_retries_total', name)
+            logger.warning(f"Background {name} rate limited or failed, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+        metrics.inc('dispatch_failed_total', name)
+        logger.error(f"Background {name} gave up after {self.max_retries} retries")
+
+    async def drain(self, timeout: float = 10.0):
+        """Stop accepting work and wait up to ``timeout`` for pending calls, cancelling the rest."""
+        self.closed = True
+        if not self.tasks:
+            return
+        logger.info(f"Waiting for {len(self.tasks)} background Discord calls")
+        done, pending = await asyncio.wait(set(self.tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+            logger.warning(f"Cancelled {len(pending)} background Discord calls at shutdown")
+
+def get_dispatcher(bot) -> BackgroundDispatcher:
+    """The bot-wide BackgroundDispatcher, created on first use."""
+    dispatcher = getattr(bot, 'dispatcher', None)
+    if dispatcher is None:
+        from config.settings import DISPATCH_CONCURRENCY, DISPATCH_MAX_PENDING, DISPATCH_RETRIES
+        dispatcher = BackgroundDispatcher(DISPATCH_CONCURRENCY, DISPATCH_MAX_PENDING, DISPATCH_RETRIES)
+        bot.dispatcher = dispatcher
+    return dispatcher
@@ -0,0 +1,646 @@
+"""
+Append-only log of every committed chain and credit change.
+
+Each committed drink check is written as one record: the message inputs the
+chain engine saw plus the effects it produced. Admin credit changes get a
+record too. Records are length-prefixed and CRC-checked msgpack (JSON if
+msgpack isn't installed) in numbered segment files. A crash can leave a torn
+record at the end of the last segment; it's detected and cut off on open.
+
+Snapshots hold every table's rows as of a sequence number. The first one is
+streamed from the database when the log is created. Later ones are folded from
+the previous snapshot plus the log in a child process, so they only ever
+reflect logged changes and never hold the tables in the bot's memory. replay_events.py rebuilds the tables from a snapshot plus the tail.
+"""
+
+import glob
+import json
+import logging
+import os
+import queue
+import struct
+import subprocess
+import sys
+import threading
+import zlib
+from dataclasses import dataclass, fields, is_dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import msgpack
+except ImportError:  # Optional; JSON is bigger and slower but reads the same
+    msgpack = None
+
+from bot.chain_engine import (
+    ChainState, EngineState, MessageEvent, normalize_timestamp,
+    ChainExpired, ChainStarted, ChainExtended, DrinkCheckAccepted,
+    CreditAwarded, RecordBroken, ChainMilestone
+)
+from bot.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# File header: magic, format (b'm' msgpack / b'j' JSON), format version
+MAGIC = b'DCEL'
+FORMAT_VERSION = 1
+HEADER_SIZE = len(MAGIC) + 2
+# Record framing: payload length and CRC32, big endian
+FRAME = struct.Struct('>II')
+
+SEGMENT_PATTERN = 'events-{:08d}.log'
+SNAPSHOT_PATTERN = 'snapshot-{:012d}.snap'
+# Rows per snapshot record
+SNAPSHOT_CHUNK = 1000
+
+EFFECT_TYPES = {cls.__name__: cls for cls in (
+    ChainExpired, ChainStarted, ChainExtended, DrinkCheckAccepted, CreditAwarded, RecordBroken, ChainMilestone
+)}
+DATETIME_FIELDS = {'start_time', 'last_activity', 'timestamp'}
+
+def _micros(value: Optional[datetime]) -> Optional[int]:
+    if value is None:
+        return None
+    return int(normalize_timestamp(value).timestamp() * 1_000_000)
+
+def _from_micros(value: Optional[int]) -> Optional[datetime]:
+    if value is None:
+        return None
+    return datetime.fromtimestamp(value / 1_000_000, tz=timezone.utc)
+
+def record_time(record: Dict[str, Any]) -> datetime:
+    """When a record's change was made"""
+    return _from_micros(record['ts'])
+
+def _encode_fields(obj) -> Dict[str, Any]:
+    encoded = {}
+    for f in fields(obj):
+        value = getattr(obj, f.name)
+        if is_dataclass(value):
+            value = _encode_fields(value)
+        elif f.name in DATETIME_FIELDS:
+            value = _micros(value)
+        encoded[f.name] = value
+    return encoded
+
+def encode_effect(effect) -> Dict[str, Any]:
+    encoded = _encode_fields(effect)
+    encoded['type'] = type(effect).__name__
+    return encoded
+
+def decode_effect(data: Dict[str, Any]):
+    data = dict(data)
+    cls = EFFECT_TYPES[data.pop('type')]
+    for name in DATETIME_FIELDS & data.keys():
+        data[name] = _from_micros(data[name])
+    if 'chain' in data:
+        chain = dict(data['chain'])
+        for name in DATETIME_FIELDS & chain.keys():
+            chain[name] = _from_micros(chain[name])
+        data['chain'] = ChainState(**chain)
+    return cls(**data)
+
+def encode_event(event: MessageEvent, has_keyword: bool) -> Dict[str, Any]:
+    """Engine inputs for a message. Only whether the content held a keyword is kept"""
+    encoded = _encode_fields(event)
+    encoded['content'] = None
+    encoded['has_keyword'] = has_keyword
+    return encoded
+
+class _Codec:
+    def __init__(self, fmt: bytes):
+        if fmt == b'm' and msgpack is None:
+            raise RuntimeError("This log was written with msgpack, which isn't installed")
+        self.format = fmt
+
+    def dumps(self, record: Dict[str, Any]) -> bytes:
+        if self.format == b'm':
+            return msgpack.packb(record, use_bin_type=True)
+        return json.dumps(record, separators=(',', ':')).encode()
+
+    def loads(self, payload: bytes) -> Dict[str, Any]:
+        if self.format == b'm':
+            # Integer keys (row ids) survive a round trip only with strict_map_key off
+            return msgpack.unpackb(payload, raw=False, strict_map_key=False)
+        return json.loads(payload)
+
+def _default_format() -> bytes:
+    return b'm' if msgpack is not None else b'j'
+
+def _write_header(handle, fmt: bytes):
+    handle.write(MAGIC + fmt + bytes([FORMAT_VERSION]))
+
+def _read_header(handle, path: str) -> _Codec:
+    header = handle.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE or header[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not an event log file")
+    if header[-1] != FORMAT_VERSION:
+        raise ValueError(f"{path} has unsupported format version {header[-1]}")
+    return _Codec(header[len(MAGIC):len(MAGIC) + 1])
+
+def _frame(codec: _Codec, record: Dict[str, Any]) -> bytes:
+    payload = codec.dumps(record)
+    return FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+def read_file(path: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """(end offset, record) for each intact record; stops at the first torn or corrupt one"""
+    with open(path, 'rb') as handle:
+        codec = _read_header(handle, path)
+        offset = HEADER_SIZE
+        while True:
+            frame = handle.read(FRAME.size)
+            if len(frame) < FRAME.size:
+                return
+            length, crc = FRAME.unpack(frame)
+            payload = handle.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                logger.warning(f"Torn or corrupt record at offset {offset} in {path}")
+                return
+            offset += FRAME.size + length
+            yield offset, codec.loads(payload)
+
+def _numbered(directory: str, pattern: str) -> List[Tuple[int, str]]:
+    prefix, suffix = pattern.split('{')[0], pattern.split('}')[1]
+    found = []
+    for path in glob.glob(os.path.join(directory, f"{prefix}*{suffix}")):
+        number = os.path.basename(path)[len(prefix):-len(suffix)]
+        if number.isdigit():
+            found.append((int(number), path))
+    return sorted(found)
+
+def segments(directory: str) -> List[Tuple[int, str]]:
+    """(first seq, path) of every segment, oldest first"""
+    return _numbered(directory, SEGMENT_PATTERN)
+
+def snapshots(directory: str) -> List[Tuple[int, str]]:
+    """(seq, path) of every snapshot, oldest first"""
+    return _numbered(directory, SNAPSHOT_PATTERN)
+
+def read_records(directory: str, after_seq: int = 0, until_seq: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """Logged records with after_seq < seq <= until_seq, in order"""
+    found = segments(directory)
+    for index, (first_seq, path) in enumerate(found):
+        # Skip segments that end before the wanted range
+        if index + 1 < len(found) and found[index + 1][0] <= after_seq + 1:
+            continue
+        for _, record in read_file(path):
+            seq = record['seq']
+            if seq <= after_seq:
+                continue
+            if until_seq is not None and seq > until_seq:
+                return
+            yield record
+
+# Tables in a snapshot, with the columns kept for each
+SNAPSHOT_TABLES = {
+    'users': ('user_id', 'username', 'total_credits', 'longest_chain_streak'),
+    'active_chains': ('chain_id', 'starter_id', 'start_message_id', 'last_message_id', 'last_message_author_id',
+                      'start_time', 'last_activity', 'is_active', 'total_messages', 'is_server_record', 'version'),
+    'drink_checks': ('message_id', 'user_id', 'chain_id', 'is_reply', 'replied_to_message_id', 'timestamp'),
+    'credits': ('user_id', 'message_id', 'credit_type', 'timestamp'),
+}
+
+class ReplayState:
+    """
+    Every table's rows held in memory, changed the way MessageEvents and the
+    admin commands change the database. Replaying a long log is a loop of
+    dict updates; the result is written out in bulk.
+    """
+
+    def __init__(self):
+        self.seq = 0
+        self.users: Dict[int, Dict[str, Any]] = {}
+        self.chains: Dict[int, Dict[str, Any]] = {}
+        self.drink_checks: Dict[int, Dict[str, Any]] = {}
+        self.credits: List[Dict[str, Any]] = []
+
+    def rows(self, table: str) -> List[Dict[str, Any]]:
+        if table == 'users':
+            return list(self.users.values())
+        if table == 'active_chains':
+            return list(self.chains.values())
+        if table == 'drink_checks':
+            return list(self.drink_checks.values())
+        return self.credits
+
+    def load_rows(self, table: str, rows: List[Dict[str, Any]]):
+        for row in rows:
+            for name in DATETIME_FIELDS & row.keys():
+                if isinstance(row[name], int):
+                    row[name] = _from_micros(row[name])
+            if table == 'users':
+                self.users[row['user_id']] = row
+            elif table == 'active_chains':
+                self.chains[row['chain_id']] = row
+            elif table == 'drink_checks':
+                self.drink_checks[row['message_id']] = row
+            else:
+                self.credits.append(row)
+
+    def user(self, user_id: int, username: Optional[str]) -> Dict[str, Any]:
+        """A user's row, added if they aren't stored yet"""
+        # Like the bot, the name is only set when the user is first stored
+        user = self.users.get(user_id)
+        if user is None:
+            user = self.users[user_id] = {'user_id': user_id, 'username': username,
+                                          'total_credits': 0, 'longest_chain_streak': 0}
+        return user
+
+    def apply(self, record: Dict[str, Any]):
+        """Apply one logged record"""
+        kind = record['kind']
+        if kind == 'drink_check':
+            self.user(record['event']['author_id'], record.get('username'))
+            for data in record['effects']:
+                self.apply_effect(decode_effect(data), record.get('username'))
+        elif kind == 'close_expired':
+            self.close_expired(record_time(record), record['timeout'])
+        elif kind == 'set_credits':
+            user = self.user(record['user_id'], record.get('username'))
+            user['total_credits'] = record['amount']
+            self.credits = [credit for credit in self.credits if credit['user_id'] != record['user_id']]
+            self.credits.extend({'user_id': record['user_id'], 'message_id': None,
+                                 'credit_type': 'initial', 'timestamp': None} for _ in range(record['amount']))
+        else:
+            raise ValueError(f"Unknown record kind: {kind}")
+        self.seq = record['seq']
+
+    def close_expired(self, now: datetime, timeout_seconds: float):
+        """Mirror of database.models.close_expired_chains"""
+        cutoff = now - timedelta(seconds=timeout_seconds)
+        for chain in self.chains.values():
+            last_activity = chain.get('last_activity')
+            if chain.get('is_active') and (last_activity is None or normalize_timestamp(last_activity) < cutoff):
+                chain['is_active'] = False
+                chain['version'] = (chain.get('version') or 0) + 1
+
+    def apply_effect(self, effect, username: Optional[str] = None):
+        """Mirror of MessageEvents._apply_effects"""
+        if isinstance(effect, ChainExpired):
+            chain = self.chains.get(effect.chain.chain_id)
+            if chain:
+                chain['is_active'] = False
+                chain['version'] = (chain.get('version') or 0) + 1
+        elif isinstance(effect, ChainStarted):
+            for chain in self.chains.values():
+                chain['is_active'] = False
+            row = _encode_fields(effect.chain)
+            row.update(start_time=effect.chain.start_time, last_activity=effect.chain.last_activity,
+                       is_active=True, is_server_record=False, version=0)
+            self.chains[effect.chain.chain_id] = row
+        elif isinstance(effect, ChainExtended):
+            chain, state = self.chains[effect.chain.chain_id], effect.chain
+            chain.update(last_message_id=state.last_message_id, last_message_author_id=state.last_message_author_id,
+                         last_activity=state.last_activity, total_messages=state.total_messages,
+                         version=(chain.get('version') or 0) + 1)
+            user = self.user(state.last_message_author_id, username)
+            user['longest_chain_streak'] = max(user.get('longest_chain_streak') or 0, state.total_messages)
+        elif isinstance(effect, DrinkCheckAccepted):
+            self.drink_checks[effect.message_id] = {
+                'message_id': effect.message_id, 'user_id': effect.user_id, 'chain_id': effect.chain_id,
+                'is_reply': effect.is_reply, 'replied_to_message_id': effect.replied_to_message_id,
+                'timestamp': effect.timestamp,
+            }
+        elif isinstance(effect, CreditAwarded):
+            self.credits.append({'user_id': effect.user_id, 'message_id': effect.message_id,
+                                 'credit_type': effect.credit_type, 'timestamp': effect.timestamp})
+            user = self.user(effect.user_id, username)
+            user['total_credits'] = (user.get('total_credits') or 0) + 1
+        elif isinstance(effect, RecordBroken):
+            for chain_id, chain in self.chains.items():
+                chain['is_server_record'] = chain_id == effect.chain.chain_id
+
+    def engine_state(self) -> EngineState:
+        """Chain engine state for re-running the rules from here"""
+        def to_state(row):
+            return ChainState(**{f.name: row.get(f.name) for f in fields(ChainState)})
+        active = [row for row in self.chains.values() if row.get('is_active')]
+        record = [row for row in self.chains.values() if row.get('is_server_record')]
+        return EngineState(
+            active_chain=to_state(max(active, key=lambda row: row['start_time'])) if active else None,
+            record=to_state(record[0]) if record else None,
+            next_chain_id=max(self.chains, default=0) + 1,
+        )
+
+def _write_snapshot(directory: str, seq: int, chunks: Iterable[Tuple[str, List[Dict[str, Any]]]]) -> str:
+    """Write (table, rows) chunks as the snapshot for ``seq``; atomic, so a crash leaves the previous one"""
+    path = os.path.join(directory, SNAPSHOT_PATTERN.format(seq))
+    codec = _Codec(_default_format())
+    with open(path + '.partial', 'wb') as handle:
+        _write_header(handle, codec.format)
+        handle.write(_frame(codec, {'seq': seq}))
+        for table, rows in chunks:
+            columns = SNAPSHOT_TABLES[table]
+            chunk = [{name: (_micros(row.get(name)) if name in DATETIME_FIELDS else row.get(name))
+                      for name in columns} for row in rows]
+            handle.write(_frame(codec, {'table': table, 'rows': chunk}))
+        handle.write(_frame(codec, {'end': True}))
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(path + '.partial', path)
+    return path
+
+def write_snapshot(directory: str, state: ReplayState) -> str:
+    """Write ``state`` as the snapshot for its seq"""
+    def chunks():
+        for table in SNAPSHOT_TABLES:
+            rows = state.rows(table)
+            for start in range(0, len(rows), SNAPSHOT_CHUNK):
+                yield table, rows[start:start + SNAPSHOT_CHUNK]
+    return _write_snapshot(directory, state.seq, chunks())
+
+def read_snapshot(path: str) -> ReplayState:
+    state = ReplayState()
+    complete = False
+    for _, record in read_file(path):
+        if 'seq' in record:
+            state.seq = record['seq']
+        elif 'table' in record:
+            state.load_rows(record['table'], record['rows'])
+        elif record.get('end'):
+            complete = True
+    if not complete:
+        raise ValueError(f"Snapshot {path} is incomplete")
+    return state
+
+def load_state(directory: str, until_seq: Optional[int] = None) -> ReplayState:
+    """Latest usable snapshot (at or before until_seq) plus the log after it"""
+    usable = [path for seq, path in snapshots(directory) if until_seq is None or seq <= until_seq]
+    if not usable:
+        raise ValueError(f"No snapshot in {directory} at or before seq {until_seq}")
+    state = read_snapshot(usable[-1])
+    for record in read_records(directory, state.seq, until_seq):
+        state.apply(record)
+    return state
+
+def write_snapshot_from_database(directory: str, db, seq: int = 0) -> Dict[str, int]:
+    """
+    Write the current tables as the snapshot for ``seq`` (the first one of a
+    new log), streamed a chunk at a time. Returns the rows written per table
+    """
+    from database.models import User, ActiveChain, DrinkCheck, Credit
+    models = {'users': User, 'active_chains': ActiveChain, 'drink_checks': DrinkCheck, 'credits': Credit}
+    counts = dict.fromkeys(models, 0)
+
+    def chunks():
+        for table, model in models.items():
+            columns = [getattr(model, name) for name in SNAPSHOT_TABLES[table]]
+            rows = []
+            for row in db.query(*columns).yield_per(SNAPSHOT_CHUNK):
+                row = dict(zip(SNAPSHOT_TABLES[table], row))
+                if table == 'credits' and row['credit_type'] is not None:
+                    row['credit_type'] = getattr(row['credit_type'], 'value', row['credit_type'])
+                rows.append(row)
+                if len(rows) == SNAPSHOT_CHUNK:
+                    counts[table] += len(rows)
+                    yield table, rows
+                    rows = []
+            if rows:
+                counts[table] += len(rows)
+                yield table, rows
+
+    _write_snapshot(directory, seq, chunks())
+    return counts
+
+def compact_directory(directory: str, until_seq: int) -> str:
+    """
+    Fold the latest snapshot and the log up to ``until_seq`` into a new
+    snapshot. Holds every row in memory, so the bot runs it in a child process
+    (``python -m bot.event_log <directory> <until_seq>``)
+    """
+    state = load_state(directory, until_seq)
+    path = write_snapshot(directory, state)
+    # The first snapshot (the database when logging began) is kept so the whole
+    # history can be replayed, plus the last two in case the newest is unreadable
+    for _, old in snapshots(directory)[1:-2]:
+        os.remove(old)
+    return path
+
+class EventLog:
+    """
+    Writer for the live bot. ``append`` assigns the next sequence number and
+    queues the record; a writer thread frames, writes and flushes it, so the
+    event loop never waits on the disk. Segments roll over at
+    ``segment_bytes``. Once ``snapshot_every`` records have been written since
+    the last snapshot, ``snapshot_due`` is set and ``compact`` (run on a
+    worker thread) has a child process write a new one.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024,
+                 snapshot_every: int = 10000, fsync: bool = False):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        self.seq = 0
+        self.snapshot_seq = 0
+        self._codec = _Codec(_default_format())
+        self._handle = None
+        self.is_open = False
+        self._lock = threading.Lock()
+        self._open_lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        # Records waiting for the writer thread, then None to stop it
+        self._queue: 'queue.Queue[Optional[Dict[str, Any]]]' = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        # Highest seq on disk (flushed to the OS), for compact to wait on
+        self._written = threading.Condition()
+        self.written_seq = 0
+
+    @property
+    def snapshot_due(self) -> bool:
+        return self.snapshot_every > 0 and self.seq - self.snapshot_seq >= self.snapshot_every
+
+    def open(self, db=None):
+        """
+        Find where the log ends, cutting off a torn final record. A new log
+        starts with a snapshot of the database (``db``, a session) so
+        replays have a base to start from. Does nothing if it's already open.
+        """
+        with self._open_lock:
+            if not self.is_open:
+                self._open(db)
+                self.is_open = True
+
+    def _open(self, db):
+        os.makedirs(self.directory, exist_ok=True)
+        existing = snapshots(self.directory)
+        self.snapshot_seq = existing[-1][0] if existing else 0
+        found = segments(self.directory)
+        if found:
+            first_seq, path = found[-1]
+            self.seq, end = first_seq - 1, HEADER_SIZE
+            for end, record in read_file(path):
+                self.seq = record['seq']
+            if end < os.path.getsize(path):
+                logger.warning(f"Truncating {os.path.getsize(path) - end} bytes of torn records from {path}")
+                with open(path, 'r+b') as handle:
+                    handle.truncate(end)
+            self._open_segment(path)
+        elif not existing:
+            if db is None:
+                raise ValueError("A new event log needs a database session for its first snapshot")
+            counts = write_snapshot_from_database(self.directory, db)
+            logger.info(f"Started event log in {self.directory} from {counts['users']} users "
+                        f"and {counts['drink_checks']} drink checks")
+        else:
+            self.seq = self.snapshot_seq
+        self.written_seq = self.seq
+        logger.info(f"Event log at seq {self.seq} (snapshot {self.snapshot_seq}, {self._codec.format.decode()} format)")
+
+    def _open_segment(self, path: str):
+        # Appending to a segment keeps its format, whatever's installed now
+        with open(path, 'rb') as handle:
+            self._codec = _read_header(handle, path)
+        self._handle = open(path, 'ab')
+
+    def _roll(self, seq: int):
+        if self._handle:
+            self._handle.close()
+        self._codec = _Codec(_default_format())
+        path = os.path.join(self.directory, SEGMENT_PATTERN.format(seq))
+        self._handle = open(path, 'ab')
+        _write_header(self._handle, self._codec.format)
+
+    def append(self, record: Dict[str, Any]) -> int:
+        """Queue a record for the writer thread, returning its sequence number"""
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name='event-log', daemon=True)
+                self._writer.start()
+            self.seq += 1
+            record['seq'] = self.seq
+            # Under the lock, so records are queued in seq order
+            self._queue.put(record)
+            return self.seq
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            # Whatever else is already waiting goes out with the same flush
+            while batch[-1] is not None:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            records = [record for record in batch if record is not None]
+            if records:
+                self._write(records)
+            if batch[-1] is None:
+                return
+
+    def _write(self, records: List[Dict[str, Any]]):
+        try:
+            for record in records:
+                if self._handle is None or self._handle.tell() >= self.segment_bytes:
+                    self._roll(record['seq'])
+                self._handle.write(_frame(self._codec, record))
+            self._handle.flush()
+            if self.fsync:
+                os.fsync(self._handle.fileno())
+        except Exception as e:
+            # The database stays the source of truth, so the bot carries on without these
+            metrics.inc('event_log_failed_total', amount=len(records))
+            logger.error(f"Failed to write event log records {records[0]['seq']}-{records[-1]['seq']}: {e}",
+                         exc_info=True)
+        with self._written:
+            self.written_seq = records[-1]['seq']
+            self._written.notify_all()
+
+    def wait_written(self, seq: int, timeout: Optional[float] = None) -> bool:
+        """Wait until every record up to ``seq`` has been written"""
+        with self._written:
+            return self._written.wait_for(lambda: self.written_seq >= seq, timeout)
+
+    def append_drink_check(self, event: MessageEvent, has_keyword: bool, username: str,
+                           effects: List, timeout: timedelta) -> int:
+        # The time and timeout the engine ran with, so a replay can run it again the same way
+        timestamp = next(effect.timestamp for effect in effects if isinstance(effect, DrinkCheckAccepted))
+        return self.append({
+            'kind': 'drink_check',
+            'ts': _micros(timestamp),
+            'timeout': timeout.total_seconds(),
+            'event': encode_event(event, has_keyword),
+            'username': username,
+            'effects': [encode_effect(effect) for effect in effects],
+        })
+
+    def append_set_credits(self, user_id: int, username: str, amount: int, timestamp: datetime) -> int:
+        return self.append({'kind': 'set_credits', 'ts': _micros(timestamp),
+                            'user_id': user_id, 'username': username, 'amount': amount})
+
+    def append_close_expired(self, now: datetime, timeout: timedelta) -> int:
+        return self.append({'kind': 'close_expired', 'ts': _micros(now), 'timeout': timeout.total_seconds()})
+
+    def compact(self) -> Optional[str]:
+        """
+        Write a new snapshot from the latest one and the log after it. The
+        fold holds every row in memory, so it runs in a child process that
+        exits afterwards rather than growing the bot. Blocking
+        """
+        if not self._compact_lock.acquire(blocking=False):
+            return None
+        try:
+            until = self.seq
+            self.wait_written(until)
+            # A fresh interpreter rather than a fork, which would copy the bot's memory and
+            # its running threads' locks; it only imports this module
+            root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            result = subprocess.run([sys.executable, '-m', 'bot.event_log', os.path.abspath(self.directory), str(until)],
+                                    cwd=root)
+            if result.returncode != 0:
+                raise RuntimeError(f"Event log compaction exited with code {result.returncode}")
+            self.snapshot_seq = until
+            logger.info(f"Wrote event log snapshot at seq {until}")
+            return os.path.join(self.directory, SNAPSHOT_PATTERN.format(until))
+        finally:
+            self._compact_lock.release()
+
+    def close(self):
+        """Write everything still queued, then close the segment"""
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            self._queue.put(None)
+            writer.join()
+        if self._handle:
+            self._handle.flush()
+            os.fsync(self._handle.fileno())
+            self._handle.close()
+            self._handle = None
+
+def get_event_log(bot, shard: Optional[str] = None) -> Optional[EventLog]:
+    """
+    The bot-wide EventLog for the main database, or the one for a database
+    shard (by name, see database.sharding), or None if EVENT_LOG_DIR is unset.
+    A replay rebuilds one database, so each shard logs into its own directory,
+    ``<EVENT_LOG_DIR>/shards/<shard>``. Opened by MessageEvents.warm_up, or
+    bot.shards.prepare_guild for shards first used later.
+    """
+    if not hasattr(bot, 'event_log'):
+        from config.settings import EVENT_LOG_DIR, EVENT_LOG_SEGMENT_MB, EVENT_LOG_SNAPSHOT_EVERY, EVENT_LOG_FSYNC
+        bot.event_log = EventLog(
+            EVENT_LOG_DIR, EVENT_LOG_SEGMENT_MB * 1024 * 1024, EVENT_LOG_SNAPSHOT_EVERY, EVENT_LOG_FSYNC
+        ) if EVENT_LOG_DIR else None
+    if shard is None or bot.event_log is None:
+        return bot.event_log
+    logs = getattr(bot, 'shard_event_logs', None)
+    if logs is None:
+        logs = bot.shard_event_logs = {}
+    log = logs.get(shard)
+    if log is None:
+        main = bot.event_log
+        log = logs[shard] = EventLog(os.path.join(main.directory, 'shards', shard), main.segment_bytes,
+                                     main.snapshot_every, main.fsync)
+    return log
+
+def all_event_logs(bot) -> List[EventLog]:
+    """The main database's log and every shard's that has been used"""
+    main = get_event_log(bot)
+    if main is None:
+        return []
+    return [main] + list(getattr(bot, 'shard_event_logs', {}).values())
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    compact_directory(sys.argv[1], int(sys.argv[2]))
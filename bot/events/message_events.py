@@ -1,92 +1,402 @@
 #message handling events
 from discord.ext import commands
 from discord import Message
-from database.models import User, DrinkCheck, Credit, ActiveChain
-from database.connection import DatabaseSession
+from database.models import User, DrinkCheck, Credit, ActiveChain, PhotoHash, close_expired_chains
+from database.connection import DatabaseSession, ReadSession
+from database.profiler import profiler
+from database.sharding import MAIN_SHARD, each_shard, fan_out, shard_for, shards
 from bot.trackers import DrinkCheckTracker
-from datetime import datetime
+from bot.cache import get_state_cache
+from bot.dispatch import get_dispatcher
+from bot.shards import open_shard_log, prepare_guild
+from bot.stats import RecentActivity, get_stats_manager
+from bot.message_index import DrinkCheckIndex, build_bloom
+from bot.ratelimit import TokenBucketLimiter
+from bot.guild_config import GuildConfig, get_config_store
+from bot.attachments import AttachmentValidator, Fingerprint, HASHING_AVAILABLE, from_signed64, to_signed64
+from bot.event_log import EventLog, all_event_logs, get_event_log
+from bot.chain_engine import (
+    ChainEngine, EngineState, MessageEvent, utc_now, has_keyword,
+    ChainExpired, ChainStarted, ChainExtended, DrinkCheckAccepted,
+    CreditAwarded, RecordBroken, ChainMilestone
+)
+from bot.metrics import metrics
+from bot.traffic import TrafficRecorder
+from datetime import datetime, timedelta
+import asyncio
+import time
 import pytz
 import logging
-from typing import Dict, Set
+from collections import defaultdict
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+from typing import Dict, List, Optional, Tuple
 
 # Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Set up Central timezone
 central = pytz.timezone('America/Chicago')
 
+# Users with credits this recent are loaded into the user cache at startup
+RECENT_USER_DAYS = 7
+RECENT_USER_LIMIT = 500
+
+# Attempts at applying a drink check whose chain row changed underneath it
+MAX_CHAIN_RETRIES = 3
+
+class StaleChainError(Exception):
+    """The chain row was updated since the engine state was read"""
+
 class MessageEvents(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.tracker = DrinkCheckTracker()
-        # Add cache for users and allowed channels
-        self.user_cache: Dict[int, User] = {}
-        self.allowed_channels: Set[int] = set()
+        from config.settings import MESSAGE_INDEX_MAX_AGE_HOURS, MESSAGE_INDEX_MAX_SIZE
+        # The bot may carry a simulated clock (replays, benchmarks)
+        self.clock = getattr(bot, 'clock', None) or utc_now
+        # Recently stored drink checks, for resolving replies without a query
+        self.message_index = DrinkCheckIndex(
+            timedelta(hours=MESSAGE_INDEX_MAX_AGE_HOURS), MESSAGE_INDEX_MAX_SIZE, self.clock
+        )
+        # Tracked channels, keywords and chain timeout per guild, changeable at runtime
+        self.config = get_config_store(bot)
+        self.tracker = DrinkCheckTracker(index=self.message_index, config=self.config)
+        self._bloom_task = None
+        # Add cache for users, per database shard (None is the main database)
+        self.user_caches: Dict[Optional[str], Dict[int, User]] = defaultdict(dict)
+        self.user_cache = self.user_caches[None]
         self.cache_timeout = 3600  # Cache timeout in seconds
         self.last_cache_cleanup = datetime.utcnow()
+        # Chain state and server record shared with the stats commands
+        self.cache = get_state_cache(bot)
+        self.stats = get_stats_manager(bot)
+        defaults = self.config.defaults
+        self.engine = ChainEngine(clock=self.clock, timeout=defaults.timeout, keywords=defaults.keywords)
+        # Engines for guilds with their own keywords or timeout, keyed by those settings
+        self._engines: Dict[Tuple[Tuple[str, ...], int], ChainEngine] = {}
+        # Only one chain is tracked at a time per database, so a lock per shard serializes
+        # every update to it while guilds on other shards commit in parallel
+        self.chain_locks: Dict[Optional[str], asyncio.Lock] = defaultdict(asyncio.Lock)
+        self.chain_lock = self.chain_locks[None]
+        # Reactions and notices go out in the background
+        self.dispatcher = get_dispatcher(bot)
+        # Optional log of incoming traffic for replays
+        self.recorder = None
+        # Rejects drink checks that reuse an earlier photo
+        self.attachments = self._create_validator()
+        # Per user and channel limit on messages that could be drink checks
+        self.flood_guard = self._create_flood_guard()
+        # Append-only record of every committed change, opened by warm_up
+        self.event_log: Optional[EventLog] = get_event_log(bot)
+        # Compactions in progress, by log directory
+        self._snapshot_tasks: Dict[str, asyncio.Task] = {}
+
+    def _create_flood_guard(self) -> Optional[TokenBucketLimiter]:
+        from config.settings import RATE_LIMIT_ENABLED, RATE_LIMIT_BURST, RATE_LIMIT_PER_MINUTE
+        if not RATE_LIMIT_ENABLED:
+            return None
+        # Follow a simulated clock so replays are limited the way live traffic was
+        clock = (lambda: self.clock().timestamp()) if self.clock is not utc_now else time.monotonic
+        return TokenBucketLimiter(RATE_LIMIT_PER_MINUTE / 60, RATE_LIMIT_BURST, clock)
+
+    @staticmethod
+    def _create_validator() -> Optional[AttachmentValidator]:
+        from config.settings import (
+            PHOTO_DEDUP_ENABLED, PHOTO_HASH_DISTANCE, PHOTO_MAX_BYTES,
+            PHOTO_FETCH_CONCURRENCY, PHOTO_HASH_WORKERS
+        )
+        if not PHOTO_DEDUP_ENABLED:
+            return None
+        if not HASHING_AVAILABLE:
+            logger.warning("Pillow is not installed, duplicate photos won't be detected")
+            return None
+        return AttachmentValidator(PHOTO_HASH_DISTANCE, PHOTO_MAX_BYTES, PHOTO_FETCH_CONCURRENCY, PHOTO_HASH_WORKERS)
+
+    def setup_recorder(self):
+        """Start recording traffic if TRAFFIC_LOG_PATH is set"""
+        from config.settings import TRAFFIC_LOG_PATH
+        if TRAFFIC_LOG_PATH:
+            self.recorder = TrafficRecorder(TRAFFIC_LOG_PATH, self.tracker.keywords)
+            logger.info(f"Recording message traffic to {TRAFFIC_LOG_PATH}")
+
+    async def cog_unload(self):
+        if self._bloom_task:
+            self._bloom_task.cancel()
+        if self.attachments:
+            self.attachments.close()
+        if self.recorder:
+            self.recorder.close()
+            self.recorder = None
+        if self._snapshot_tasks:
+            await asyncio.gather(*self._snapshot_tasks.values(), return_exceptions=True)
+        for log in all_event_logs(self.bot):
+            log.close()
 
     async def setup_channels(self):
-        """Load allowed channels from settings"""
+        """Log the default tracked channels; guilds can override them with /admin config"""
+        channels = self.config.defaults.tracked_channels
+        if channels:
+            logger.info(f"Loaded {len(channels)} tracked channels")
+        else:
+            logger.info("No TRACKED_CHANNELS set, all channels will be tracked by default")
+
+    def _config_for(self, message: Message) -> GuildConfig:
+        return self.config.get(message.guild.id if message.guild else None)
+
+    def _engine_for(self, config: GuildConfig) -> ChainEngine:
+        """Chain rules using the guild's keywords and timeout"""
+        if config.keywords == self.config.defaults.keywords \
+                and config.chain_timeout_minutes == self.config.defaults.chain_timeout_minutes:
+            return self.engine
+        key = (config.keywords, config.chain_timeout_minutes)
+        engine = self._engines.get(key)
+        if engine is None:
+            engine = ChainEngine(clock=self.clock, timeout=config.timeout, keywords=config.keywords)
+            self._engines[key] = engine
+        return engine
+
+    @profiler.profiled("warm_up")
+    async def warm_up(self):
+        """Load chain, record, recently active users and recent drink checks before messages arrive"""
+        if self.event_log is not None:
+            await asyncio.to_thread(self._open_event_log)
+        await asyncio.to_thread(self._load_warm_state)
+        logger.info(f"Warmed chain state, {len(self.user_cache)} recent users "
+                    f"and {len(self.message_index)} recent drink checks")
+        if self.attachments:
+            count = await asyncio.to_thread(self._load_photo_hashes)
+            logger.info(f"Loaded {count} photo hashes")
+        
+        from config.settings import BLOOM_FILTER_ENABLED
+        if BLOOM_FILTER_ENABLED:
+            # Reads every drink check id, so it's built in the background; until
+            # it's attached, replies outside the recent window go to the database
+            self._bloom_task = asyncio.create_task(self._load_bloom())
+
+    async def _load_bloom(self):
+        from config.settings import BLOOM_FILTER_CAPACITY, BLOOM_FILTER_ERROR_RATE
         try:
-            from config.settings import TRACKED_CHANNELS
-            self.allowed_channels = set(TRACKED_CHANNELS)
-            logger.info(f"Loaded {len(self.allowed_channels)} tracked channels")
-        except ImportError:
-            logger.warning("No TRACKED_CHANNELS found in settings, all channels will be tracked")
-            self.allowed_channels = set()
+            bloom = await asyncio.to_thread(self._build_bloom, BLOOM_FILTER_CAPACITY, BLOOM_FILTER_ERROR_RATE)
+            logger.info(f"Bloom filter built over {bloom.count} drink checks ({len(bloom.bits) // 1024} KiB)")
+            self.message_index.attach_bloom(bloom)
+        except Exception as e:
+            logger.error(f"Failed to build drink check Bloom filter: {e}", exc_info=True)
+
+    def _build_bloom(self, capacity: int, error_rate: float):
+        # Message ids are unique across guilds, so one filter covers every shard
+        stored = sum(fan_out(lambda db: db.query(func.count(DrinkCheck.message_id)).scalar() or 0).values())
+        message_ids = each_shard(lambda db: (row[0] for row in db.query(DrinkCheck.message_id).yield_per(10000)))
+        # Room for the history to double before the error rate degrades
+        return build_bloom(message_ids, max(capacity, stored * 2), error_rate)
+
+    def _open_event_log(self):
+        # A new log's first snapshot is taken from the database
+        with ReadSession() as db:
+            self.event_log.open(db)
+        # Every shard on disk logs into its own directory
+        for shard in (shards.shards() if shards is not None else []):
+            open_shard_log(get_event_log(self.bot, shard), shard)
+
+    def _log_committed(self, log: EventLog, append, *args):
+        """
+        Append to an event log after a commit. The database stays the source
+        of truth, so a failed append is logged rather than failing the change.
+        """
+        try:
+            append(*args)
+        except Exception as e:
+            metrics.inc('event_log_failed_total')
+            logger.error(f"Failed to append to the event log: {e}", exc_info=True)
+            return
+        if log.snapshot_due and log.directory not in self._snapshot_tasks:
+            self._snapshot_tasks[log.directory] = asyncio.create_task(self._snapshot_event_log(log))
+
+    async def _snapshot_event_log(self, log: EventLog):
+        try:
+            with metrics.time('event_log_snapshot'):
+                await asyncio.to_thread(log.compact)
+        except Exception as e:
+            logger.error(f"Event log snapshot of {log.directory} failed: {e}", exc_info=True)
+        finally:
+            del self._snapshot_tasks[log.directory]
+
+    def _load_warm_state(self):
+        overrides = self.config.load()
+        if overrides:
+            logger.info(f"Loaded settings overrides for {overrides} guilds")
+        # Chains that went stale while the bot was down are closed in one UPDATE per shard.
+        # Only ones past every guild's timeout; the engine closes the rest lazily
+        now, timeout = self.clock(), self.config.max_timeout()
+        closed = fan_out(lambda db: self._close_expired_chains(db, now, timeout), write=True)
+        if any(closed.values()):
+            logger.info(f"Closed {sum(closed.values())} expired chains")
+        for shard, count in closed.items():
+            log = get_event_log(self.bot, None if shard == MAIN_SHARD else shard)
+            if count and log is not None:
+                log.append_close_expired(now, timeout)
+
+        with DatabaseSession() as db:
+            self._load_chain_state(db, with_starter_name=True)
+
+            cutoff = self.clock() - timedelta(days=RECENT_USER_DAYS)
+            recent_users = db.query(User)\
+                .join(Credit, Credit.user_id == User.user_id)\
+                .filter(Credit.timestamp >= cutoff)\
+                .distinct()\
+                .limit(RECENT_USER_LIMIT)\
+                .all()
+            for user in recent_users:
+                self.user_cache[user.user_id] = user
+
+        # Message ids are unique across guilds, so one index covers every shard
+        index_cutoff = self.clock() - self.message_index.max_age
+        def recent(db):
+            return db.query(DrinkCheck.message_id, DrinkCheck.timestamp)\
+                .filter(DrinkCheck.timestamp >= index_cutoff)\
+                .order_by(DrinkCheck.timestamp.desc())\
+                .limit(self.message_index.max_size)\
+                .all()
+        recent_drink_checks = fan_out(recent)
+        newest = sorted((row for rows in recent_drink_checks.values() for row in rows),
+                        key=lambda row: row.timestamp, reverse=True)[:self.message_index.max_size]
+        # Oldest first, the order the index evicts in
+        for message_id, timestamp in reversed(newest):
+            self.message_index.add(message_id, timestamp=timestamp)
+
+    @staticmethod
+    def _close_expired_chains(db, now, timeout) -> int:
+        closed = close_expired_chains(db, now, timeout)
+        if closed:
+            db.commit()
+        return closed
+
+    def _load_photo_hashes(self) -> int:
+        # A photo used in any guild counts as used
+        stored = fan_out(lambda db: db.query(PhotoHash.sha256, PhotoHash.dhash, PhotoHash.message_id).all())
+        for rows in stored.values():
+            for sha256, dhash, message_id in rows:
+                self.attachments.remember([Fingerprint(sha256, from_signed64(dhash))], message_id)
+        return len(self.attachments.index)
+
+    def _load_chain_state(self, db, with_starter_name: bool = False, guild_id: Optional[int] = None):
+        """Load the engine state (active chain, record, next chain id) from the guild's database"""
+        active_chain = db.query(ActiveChain)\
+            .filter_by(is_active=True)\
+            .order_by(ActiveChain.start_time.desc())\
+            .first()
+
+        server_record = db.query(ActiveChain)\
+            .filter_by(is_server_record=True)\
+            .first()
+        starter_name = None
+        if server_record and with_starter_name:
+            starter = db.query(User).filter_by(user_id=server_record.starter_id).first()
+            starter_name = starter.username if starter else "Unknown"
+
+        max_chain_id = db.query(func.max(ActiveChain.chain_id)).scalar() or 0
+        # An expired chain stays in the state; the engine closes it on the next drink check
+        get_state_cache(self.bot, guild_id).load_chain_state(active_chain, server_record, max_chain_id + 1, starter_name)
 
     def _should_process_message(self, message: Message) -> bool:
-        """Quick check if message should be processed"""
-        # Ignore bot messages
-        if message.author.bot:
+        """Quick check if message should be processed. Counts the reason for anything dropped"""
+        # Ignore bot messages, and messages outside the guild's tracked channels (if any are set)
+        if message.author.bot or not self._config_for(message).tracks(message.channel.id):
+            metrics.inc('messages_dropped_total', 'filtered')
             return False
-            
-        # If no channel restrictions, process all
-        if not self.allowed_channels:
-            return True
-            
-        # Check if message is in allowed channel
-        return message.channel.id in self.allowed_channels
+        
+        # Only messages with attachments can reach the database, so only they use up tokens
+        if self.flood_guard is not None and message.attachments \
+                and not self.flood_guard.allow((message.author.id, message.channel.id)):
+            metrics.inc('messages_dropped_total', 'rate_limited')
+            return False
+        return True
 
     def _cleanup_cache(self):
         """Clean up expired cache entries"""
         now = datetime.utcnow()
         if (now - self.last_cache_cleanup).total_seconds() > 3600:  # Cleanup every hour
-            self.user_cache.clear()
+            for users in self.user_caches.values():
+                users.clear()
             self.last_cache_cleanup = now
 
+    @staticmethod
+    def _to_event(message: Message) -> MessageEvent:
+        """The parts of a Discord message the chain engine needs"""
+        return MessageEvent(
+            message_id=message.id,
+            author_id=message.author.id,
+            content=message.content,
+            attachment_count=len(message.attachments) if message.attachments else 0,
+            is_reply=message.reference is not None,
+            replied_to_message_id=message.reference.message_id if message.reference else None,
+        )
+
     @commands.Cog.listener()
+    @profiler.profiled("on_message")
     async def on_message(self, message: Message):
+        metrics.inc('messages_received_total')
         try:
+            if self.recorder:
+                self.recorder.record(message)
+
             # Quick early return if message shouldn't be processed
-            if not self._should_process_message(message):
+            with metrics.time('channel_filter'):
+                should_process = self._should_process_message(message)
+            if not should_process:
                 return
 
+            # Record time-to-first-message for the startup breakdown
+            startup_timer = getattr(self.bot, 'startup_timer', None)
+            if startup_timer and 'first_message' not in startup_timer.milestones:
+                startup_timer.mark('first_message')
+
+            # Don't act on half-loaded state while startup warm-up is still running
+            if not self.cache.ready.is_set():
+                await self.cache.ready.wait()
+            # A guild's first message opens (and maybe creates) its shard off the loop
+            await prepare_guild(self.bot, message.guild.id if message.guild else None)
+
             # Get active chain first
-            with DatabaseSession() as db:
-                active_chain = await self._get_active_chain(db)
+            with metrics.time('chain_lookup'):
+                state = await self._get_chain_state(message.guild.id if message.guild else None)
 
             # Check if it's a valid drink check
-            is_drink_check = self.tracker.is_drink_check(message.content, message, active_chain)
+            event = self._to_event(message)
+            engine = self._engine_for(self._config_for(message))
+            with metrics.time('is_drink_check'):
+                is_drink_check = engine.is_drink_check(state, event)
             #logger.info(f"Is drink check: {is_drink_check}")
             
             if is_drink_check:
-                #logger.info("Valid drink check detected")
-                await self._process_drink_check(message)
+                if event.is_reply:
+                    # Counted from memory only; a reply the index can't settle isn't worth a query
+                    replied_to = message.reference.message_id
+                    if replied_to is not None and self.message_index.get(replied_to) is not None:
+                        metrics.inc('replies_total', 'to_drink_check')
+                    elif replied_to is None or not self.message_index.might_contain(replied_to):
+                        metrics.inc('replies_total', 'other')
+                    else:
+                        metrics.inc('replies_total', 'unknown')
+                if await self._process_drink_check(message, event, engine):
+                    metrics.inc('messages_processed_total')
+            else:
+                metrics.inc('messages_dropped_total', 'not_drink_check')
                 
             # Cleanup cache periodically
             self._cleanup_cache()
         except Exception as e:
+            metrics.inc('messages_dropped_total', 'error')
             logger.error(f"Error processing message: {e}", exc_info=True)
 
-    async def _get_or_create_user(self, db, user_id, username):
-        """Get user from cache or create in database."""
+    async def _get_or_create_user(self, db, user_id, username, guild_id: Optional[int] = None):
+        """Get user from cache or create in database (the guild's shard)."""
+        user_cache = self.user_caches[shard_for(guild_id)]
         # Check cache first
-        cached_user = self.user_cache.get(user_id)
+        cached_user = user_cache.get(user_id)
         if cached_user:
-            # Merge the cached instance with the current session
-            user = db.merge(cached_user)
+            # Attach the cached instance without reloading it; counters are
+            # only ever changed with SQL updates, never through this object
+            user = db.merge(cached_user, load=False)
             return user
 
         # If not in cache, get from database
@@ -97,161 +407,270 @@ class MessageEvents(commands.Cog):
             db.commit()
             
         # Add to cache
-        self.user_cache[user_id] = user
+        user_cache[user_id] = user
         return user
 
-    async def _get_active_chain(self, db):
-        """Get the current active chain if it exists and isn't expired."""
-        active_chain = db.query(ActiveChain)\
-            .filter_by(is_active=True)\
-            .order_by(ActiveChain.start_time.desc())\
-            .first()
-        
-        if active_chain and active_chain.is_expired():
-            active_chain.is_active = False
-            db.commit()
-            return None
-            
-        return active_chain
+    async def _get_chain_state(self, guild_id: Optional[int] = None) -> EngineState:
+        """Engine state of the guild's shard from the cache, loading it from the database the first time"""
+        cache = get_state_cache(self.bot, guild_id)
+        if not cache.chain_loaded:
+            with DatabaseSession(guild_id) as db:
+                self._load_chain_state(db, guild_id=guild_id)
+        return cache.chain_state
 
-    async def _create_new_chain(self, db, message_id: int, user_id: int) -> ActiveChain:
-        """Create a new chain and deactivate any existing ones."""
-        # Deactivate any existing chains
-        db.query(ActiveChain)\
-            .filter_by(is_active=True)\
-            .update({"is_active": False})
-        
-        # Create new chain with current time in UTC
-        now = datetime.utcnow().replace(tzinfo=pytz.UTC)
-        
-        new_chain = ActiveChain(
-            starter_id=user_id,
-            start_message_id=message_id,
-            last_message_id=message_id,
-            last_message_author_id=user_id,
-            start_time=now,
-            last_activity=now,
-            total_messages=1  # Start with 1 message
-        )
-        db.add(new_chain)
+    def _apply_effects(self, db, user: User, message: Message, effects: List) -> Tuple[List[Tuple[str, dict]], int]:
+        """
+        Persist the engine's effects in the current transaction. Returns the
+        notices to send and the user's new credit total. Raises StaleChainError
+        if the chain row isn't at the version the effects were computed from.
+        """
+        notices = []
+        total_credits = None
+        for effect in effects:
+            if isinstance(effect, ChainExpired):
+                updated = db.query(ActiveChain)\
+                    .filter_by(chain_id=effect.chain.chain_id, version=effect.chain.version)\
+                    .update({"is_active": False, "version": ActiveChain.version + 1}, synchronize_session=False)
+                if not updated:
+                    raise StaleChainError(f"chain {effect.chain.chain_id} changed before it could be closed")
+
+            elif isinstance(effect, ChainStarted):
+                chain = effect.chain
+                # Deactivate any existing chains
+                db.query(ActiveChain)\
+                    .filter_by(is_active=True)\
+                    .update({"is_active": False})
+                db.add(ActiveChain(
+                    chain_id=chain.chain_id,
+                    starter_id=chain.starter_id,
+                    start_message_id=chain.start_message_id,
+                    last_message_id=chain.last_message_id,
+                    last_message_author_id=chain.last_message_author_id,
+                    start_time=chain.start_time,
+                    last_activity=chain.last_activity,
+                    total_messages=chain.total_messages  # Start with 1 message
+                ))
+                # Create a temporary message that only the chain starter can see
+                notices.append((
+                    f"🔗 You started a new drink check chain!",
+                    {
+                        "delete_after": 20,  # Message will auto-delete after 20 seconds
+                        "reference": message  # Reference the original message
+                    }
+                ))
+
+            elif isinstance(effect, ChainExtended):
+                chain = effect.chain
+                # Update chain's last message info and activity. The count is incremented
+                # in SQL, and only if nobody else has updated the row since it was read
+                updated = db.query(ActiveChain)\
+                    .filter_by(chain_id=chain.chain_id, version=chain.version - 1)\
+                    .update({
+                        "last_message_id": chain.last_message_id,
+                        "last_message_author_id": chain.last_message_author_id,
+                        "last_activity": chain.last_activity,
+                        "total_messages": ActiveChain.total_messages + 1,
+                        "version": ActiveChain.version + 1,
+                    }, synchronize_session=False)
+                if not updated:
+                    raise StaleChainError(f"chain {chain.chain_id} changed before it could be extended")
+                # Update user's personal best if needed
+                db.query(User)\
+                    .filter_by(user_id=user.user_id)\
+                    .filter(func.coalesce(User.longest_chain_streak, 0) < chain.total_messages)\
+                    .update({"longest_chain_streak": chain.total_messages}, synchronize_session=False)
+
+            elif isinstance(effect, DrinkCheckAccepted):
+                db.add(DrinkCheck(
+                    message_id=effect.message_id,
+                    user_id=effect.user_id,
+                    chain_id=effect.chain_id,
+                    is_reply=effect.is_reply,
+                    replied_to_message_id=effect.replied_to_message_id,
+                    timestamp=effect.timestamp
+                ))
+
+            elif isinstance(effect, CreditAwarded):
+                db.add(Credit(
+                    user_id=effect.user_id,
+                    message_id=effect.message_id,
+                    credit_type=effect.credit_type,
+                    timestamp=effect.timestamp
+                ))
+                total_credits = db.execute(
+                    update(User)
+                    .where(User.user_id == effect.user_id)
+                    .values(total_credits=func.coalesce(User.total_credits, 0) + 1)
+                    .returning(User.total_credits)
+                ).scalar()
+
+            elif isinstance(effect, RecordBroken):
+                # New server record! Move the flag from the old record holder
+                db.query(ActiveChain)\
+                    .filter_by(is_server_record=True)\
+                    .filter(ActiveChain.chain_id != effect.chain.chain_id)\
+                    .update({"is_server_record": False})
+                db.query(ActiveChain)\
+                    .filter_by(chain_id=effect.chain.chain_id)\
+                    .update({"is_server_record": True})
+                notices.append((
+                    f"🏆 **New Server Record!**\n"
+                    f"This chain now has {effect.chain.total_messages} drink checks!",
+                    {}
+                ))
+
+            elif isinstance(effect, ChainMilestone):
+                # Send chain update message every 5 messages
+                notices.append((
+                    f"🔗 Chain Update!\n"
+                    f"Current streak: {effect.chain.total_messages} drink checks",
+                    {}
+                ))
+        return notices, total_credits
+
+    @staticmethod
+    def _commit_and_close(db):
         db.commit()
-        return new_chain
+        # Hands the shard's write connection back without waiting for the event loop,
+        # which may itself be blocked waiting for it (an admin command writing)
+        db.close()
 
-    async def _process_drink_check(self, message: Message):
-        """Process a drink check message and award credits."""
+    async def _process_drink_check(self, message: Message, event: MessageEvent = None,
+                                   engine: Optional[ChainEngine] = None) -> bool:
+        """Process a drink check message and award credits. Returns False if it was rejected"""
         try:
-            with DatabaseSession() as db:
-                # Get or create user
-                user = await self._get_or_create_user(db, message.author.id, str(message.author))
-                
-                # Check for active chain
-                active_chain = await self._get_active_chain(db)
-                
-                # Create drink check record with current time in UTC
-                now = datetime.utcnow().replace(tzinfo=pytz.UTC)
-                
-                drink_check = DrinkCheck(
-                    message_id=message.id,
-                    user_id=message.author.id,
-                    is_reply=message.reference is not None,
-                    replied_to_message_id=message.reference.message_id if message.reference else None,
-                    timestamp=now
-                )
-                db.add(drink_check)
-
-                if not active_chain:
-                    # No active chain - starting a new one
-                    chain = await self._create_new_chain(db, message.id, message.author.id)
-                    drink_check.chain_id = chain.chain_id
-                    
-                    # Award initial credit
-                    credit = Credit(
-                        user_id=message.author.id,
-                        message_id=message.id,
-                        credit_type='initial',
-                        timestamp=now
-                    )
-                    db.add(credit)
-                    user.total_credits += 1
-                    logger.info(f"Started new chain, awarded initial credit to {message.author.name}")
-                    
-                    # Send chain start message
-                    try:
-                        # Create a temporary message that only the chain starter can see
-                        await message.channel.send(
-                            f"🔗 You started a new drink check chain!",
-                            delete_after=20,  # Message will auto-delete after 10 seconds
-                            reference=message  # Reference the original message
-                        )
-                    except Exception as e:
-                        logger.error(f"Failed to send chain start message: {e}")
-                
-                else:
-                    # Active chain exists - add to it
-                    drink_check.chain_id = active_chain.chain_id
-                    
-                    # Award chain credit
-                    credit = Credit(
-                        user_id=message.author.id,
-                        message_id=message.id,
-                        credit_type='chain',
-                        timestamp=now
-                    )
-                    db.add(credit)
-                    user.total_credits += 1
-                    
-                    # Update chain's last message info and activity
-                    active_chain.last_message_id = message.id
-                    active_chain.last_message_author_id = message.author.id
-                    active_chain.last_activity = now
-                    active_chain.total_messages += 1
-                    
-                    # Check if this chain sets a new record
-                    current_record = db.query(ActiveChain)\
-                        .filter_by(is_server_record=True)\
-                        .with_entities(ActiveChain.total_messages)\
-                        .first()
-                    
-                    current_record_count = current_record[0] if current_record else 0
-                    
-                    if active_chain.total_messages > current_record_count:
-                        # New server record!
-                        active_chain.is_server_record = True
-                        # Update old record holder
-                        if current_record:
-                            db.query(ActiveChain)\
-                                .filter_by(is_server_record=True)\
-                                .filter(ActiveChain.chain_id != active_chain.chain_id)\
-                                .update({"is_server_record": False})
-                        
-                        await message.channel.send(
-                            f"🏆 **New Server Record!**\n"
-                            f"This chain now has {active_chain.total_messages} drink checks!"
-                        )
-                    
-                    # Update user's personal best if needed
-                    if active_chain.total_messages > user.longest_chain_streak:
-                        user.longest_chain_streak = active_chain.total_messages
-                    
-                    # Send chain update message every 5 messages
-                    if active_chain.total_messages % 5 == 0:
-                        await message.channel.send(
-                            f"🔗 Chain Update!\n"
-                            f"Current streak: {active_chain.total_messages} drink checks"
-                        )
-
-                db.commit()
-                #logger.info("Successfully committed all database changes")
-                
-                # Add reaction to confirm credit
-                await message.add_reaction('🍺')
+            event = event or self._to_event(message)
+            engine = engine or self._engine_for(self._config_for(message))
+            
+            # Photos are downloaded and hashed before taking the lock; only the lookup runs under it
+            fingerprints = []
+            if self.attachments:
+                with metrics.time('attachment_check'):
+                    fingerprints = await self.attachments.fingerprint_message(message)
+            
+            # Reading the state, writing the effects and moving the cache forward happen
+            # under the lock, so two messages never extend or start a chain from the same state
+            async with self.chain_locks[shard_for(message.guild.id if message.guild else None)]:
+                notices = await self._commit_drink_check(message, event, engine, fingerprints)
+            if notices is None:
+                return False
+            
+            # Discord calls run in the background so the handler never waits on REST latency
+            # or rate limits. A message's notices are sent in order by one task
+            if notices:
+                self.dispatcher.submit('channel_send', lambda: self._send_notices(message, notices))
+            
+            # Add reaction to confirm credit
+            self.dispatcher.submit('reaction', lambda: message.add_reaction('🍺'), idempotent=True)
+            return True
         
         except Exception as e:
             logger.error(f"Error in _process_drink_check: {e}")
             raise
 
+    async def _send_notices(self, message: Message, notices: List[Tuple[str, dict]]):
+        # Sent notices are removed so a retried task carries on from the first unsent one
+        while notices:
+            content, kwargs = notices[0]
+            await message.channel.send(content, **kwargs)
+            notices.pop(0)
+
+    async def _commit_drink_check(self, message: Message, event: MessageEvent, engine: ChainEngine,
+                                  fingerprints: List[Fingerprint] = ()) -> Optional[List[Tuple[str, dict]]]:
+        """
+        Run the chain rules and commit their effects. If the stored chain moved on
+        since the cached state was read (another process, a manual fix), the state
+        is reloaded and the message applied again. Returns the notices to send,
+        or None if the message turned out not to be a drink check or only
+        reposts photos that were already used.
+        """
+        if fingerprints and self.attachments.is_repost(fingerprints):
+            metrics.inc('messages_dropped_total', 'duplicate_photo')
+            logger.info(f"Rejected drink check {message.id} from {message.author.name}: photo was already used")
+            return None
+        # Only photos that haven't been seen are stored against this message
+        new_photos = [fp for fp, match in zip(fingerprints, self.attachments.find_duplicates(fingerprints))
+                      if match is None] if fingerprints else []
+        
+        guild_id = message.guild.id if message.guild else None
+        cache, stats = get_state_cache(self.bot, guild_id), get_stats_manager(self.bot, guild_id)
+        # A shard session belongs to this handler alone, so its commit (and fsync) can run on a
+        # worker thread while guilds on other shards commit. The main database's session is
+        # scoped to the loop's thread and shared with every other handler, so it commits here
+        commit_in_thread = shard_for(guild_id) is not None
+        for attempt in range(MAX_CHAIN_RETRIES):
+            with DatabaseSession(guild_id) as db:
+                db_write_start = time.perf_counter()
+                
+                # Get or create user
+                user = await self._get_or_create_user(db, message.author.id, str(message.author), guild_id)
+                
+                # Run the chain rules; the cached state only moves forward once the effects are committed
+                state, effects = engine.step(await self._get_chain_state(guild_id), event)
+                if not effects:
+                    metrics.inc('messages_dropped_total', 'not_drink_check')
+                    return None
+                
+                # Snapshot before commit, which expires the ORM objects
+                user_id, username = user.user_id, user.username
+                try:
+                    # Channel messages are sent once the transaction is committed,
+                    # so the session is never held open across a Discord round trip
+                    notices, total_credits = self._apply_effects(db, user, message, effects)
+                    for fingerprint in new_photos:
+                        db.add(PhotoHash(
+                            sha256=fingerprint.sha256, dhash=to_signed64(fingerprint.dhash),
+                            message_id=message.id, user_id=user_id, created_at=self.clock()
+                        ))
+                    metrics.observe('db_write', time.perf_counter() - db_write_start)
+                    
+                    with metrics.time('commit'):
+                        if commit_in_thread:
+                            await asyncio.to_thread(self._commit_and_close, db)
+                        else:
+                            db.commit()
+                except (StaleChainError, IntegrityError) as e:
+                    db.rollback()
+                    if attempt == MAX_CHAIN_RETRIES - 1:
+                        raise
+                    metrics.inc('chain_conflicts_total')
+                    logger.warning(f"Chain state was stale for message {message.id}, reloading: {e}")
+                    self._load_chain_state(db, guild_id=guild_id)
+                    continue
+            
+            if any(isinstance(effect, ChainStarted) for effect in effects):
+                logger.info(f"Started new chain, awarded initial credit to {message.author.name}")
+            # One per accepted message; sample it with LOG_SAMPLE rather than logging at INFO
+            logger.debug(
+                f"Committed drink check from {message.author.name}",
+                extra={'message_id': message.id, 'chain_id': state.active_chain.chain_id,
+                       'chain_length': state.active_chain.total_messages}
+            )
+            
+            # Each database has its own log, since a replay rebuilds one database
+            event_log = get_event_log(self.bot, shard_for(guild_id))
+            if event_log is not None:
+                self._log_committed(event_log, event_log.append_drink_check, event,
+                                    has_keyword(event.content, engine.variations), username, effects, engine.timeout)
+            
+            # Keep the shared cache in step with what was just committed
+            cache.set_chain_state(state)
+            cache.record_credit(user_id, username, total_credits)
+            if new_photos:
+                self.attachments.remember(new_photos, message.id)
+            for effect in effects:
+                if isinstance(effect, DrinkCheckAccepted):
+                    self.message_index.add(effect.message_id, timestamp=effect.timestamp)
+                elif isinstance(effect, CreditAwarded):
+                    await stats.increment_drink_checks(user_id, RecentActivity(
+                        effect.message_id, user_id, username, state.active_chain.chain_id,
+                        effect.credit_type, effect.timestamp
+                    ))
+            return notices
+
 async def setup(bot):
     cog = MessageEvents(bot)
     await cog.setup_channels()  # Initialize tracked channels
+    cog.setup_recorder()
     await bot.add_cog(cog)
     return True
\ No newline at end of file
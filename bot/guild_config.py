@@ -0,0 +1,183 @@
+#per-guild settings that can change at runtime
+import json
+import logging
+import threading
+from dataclasses import dataclass, fields, replace
+from datetime import timedelta
+from functools import cached_property
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from bot.chain_engine import DEFAULT_KEYWORDS, keyword_variations, utc_now
+from database.connection import DatabaseSession, ReadSession
+from database.models import GuildSetting
+
+logger = logging.getLogger(__name__)
+
+# Bounds for values set through the admin commands
+MAX_TIMEOUT_MINUTES = 24 * 60
+MAX_KEYWORDS = 20
+
+@dataclass(frozen=True)
+class GuildConfig:
+    """
+    Immutable snapshot of one guild's settings. The store swaps in a new
+    snapshot on every change, so a handler holding one never sees a
+    half-applied update.
+    """
+    # Empty means every channel is tracked
+    tracked_channels: FrozenSet[int] = frozenset()
+    keywords: Tuple[str, ...] = DEFAULT_KEYWORDS
+    chain_timeout_minutes: int = 30
+
+    @property
+    def timeout(self) -> timedelta:
+        return timedelta(minutes=self.chain_timeout_minutes)
+
+    @cached_property
+    def variations(self) -> Tuple[str, ...]:
+        return keyword_variations(self.keywords)
+
+    def tracks(self, channel_id: int) -> bool:
+        return not self.tracked_channels or channel_id in self.tracked_channels
+
+# Setting name -> parser from the stored JSON value (or admin input) to the snapshot field
+def _parse_channels(value) -> FrozenSet[int]:
+    return frozenset(int(channel_id) for channel_id in value)
+
+def _parse_keywords(value) -> Tuple[str, ...]:
+    keywords = tuple(dict.fromkeys(str(keyword).strip().lower() for keyword in value if str(keyword).strip()))
+    if not keywords:
+        raise ValueError("At least one keyword is required")
+    if len(keywords) > MAX_KEYWORDS:
+        raise ValueError(f"At most {MAX_KEYWORDS} keywords are allowed")
+    return keywords
+
+def _parse_timeout(value) -> int:
+    minutes = int(value)
+    if not 1 <= minutes <= MAX_TIMEOUT_MINUTES:
+        raise ValueError(f"Chain timeout must be between 1 and {MAX_TIMEOUT_MINUTES} minutes")
+    return minutes
+
+PARSERS: Dict[str, Callable[[Any], Any]] = {
+    'tracked_channels': _parse_channels,
+    'keywords': _parse_keywords,
+    'chain_timeout_minutes': _parse_timeout,
+}
+
+def _to_json(value) -> str:
+    if isinstance(value, frozenset):
+        value = sorted(value)
+    return json.dumps(value)
+
+class ConfigStore:
+    """
+    Per-guild settings persisted in the guild_config table, with the values
+    from config/settings.py as defaults. Reads return the current snapshot
+    without locking; updates are written in one transaction and then
+    published by replacing the snapshot map.
+    """
+
+    def __init__(self, defaults: GuildConfig):
+        self.defaults = defaults
+        self._snapshots: Dict[int, GuildConfig] = {}
+        # Serializes writers; readers never take it
+        self._write_lock = threading.Lock()
+
+    def get(self, guild_id: Optional[int]) -> GuildConfig:
+        if guild_id is None:
+            return self.defaults
+        return self._snapshots.get(guild_id, self.defaults)
+
+    def load(self) -> int:
+        """(Re)read every guild's settings. Returns how many guilds have overrides"""
+        with ReadSession() as db:
+            rows = db.query(GuildSetting.guild_id, GuildSetting.key, GuildSetting.value).all()
+        overrides: Dict[int, Dict[str, Any]] = {}
+        for guild_id, key, value in rows:
+            if key not in PARSERS:
+                logger.warning(f"Ignoring unknown setting {key} for guild {guild_id}")
+                continue
+            try:
+                overrides.setdefault(guild_id, {})[key] = PARSERS[key](json.loads(value))
+            except (ValueError, TypeError) as e:
+                logger.error(f"Ignoring invalid {key} for guild {guild_id}: {e}")
+        with self._write_lock:
+            self._snapshots = {guild_id: replace(self.defaults, **values) for guild_id, values in overrides.items()}
+        return len(self._snapshots)
+
+    def update(self, guild_id: int, changes: Dict[str, Any], updated_by: Optional[int] = None) -> GuildConfig:
+        """
+        Validate and store ``changes`` (setting name -> value) for a guild and
+        publish the new snapshot. Raises ValueError for an unknown setting or
+        a bad value; nothing is stored in that case.
+        """
+        parsed = {}
+        for key, value in changes.items():
+            if key not in PARSERS:
+                raise ValueError(f"Unknown setting: {key}")
+            parsed[key] = PARSERS[key](value)
+
+        with self._write_lock:
+            now = utc_now()
+            with DatabaseSession() as db:
+                for key, value in parsed.items():
+                    db.merge(GuildSetting(guild_id=guild_id, key=key, value=_to_json(value),
+                                          updated_at=now, updated_by=updated_by))
+                db.commit()
+            config = replace(self.get(guild_id), **parsed)
+            self._publish(guild_id, config)
+        logger.info(f"Guild {guild_id} settings changed by {updated_by}: {', '.join(parsed)}")
+        return config
+
+    def reset(self, guild_id: int, keys: Iterable[str]) -> GuildConfig:
+        """Drop a guild's overrides for ``keys`` so the defaults apply again"""
+        keys = list(keys)
+        unknown = [key for key in keys if key not in PARSERS]
+        if unknown:
+            raise ValueError(f"Unknown setting: {', '.join(unknown)}")
+
+        with self._write_lock:
+            with DatabaseSession() as db:
+                db.query(GuildSetting)\
+                    .filter(GuildSetting.guild_id == guild_id, GuildSetting.key.in_(keys))\
+                    .delete(synchronize_session=False)
+                db.commit()
+            config = replace(self.get(guild_id), **{key: getattr(self.defaults, key) for key in keys})
+            self._publish(guild_id, config)
+        logger.info(f"Guild {guild_id} settings reset: {', '.join(keys)}")
+        return config
+
+    def _publish(self, guild_id: int, config: GuildConfig):
+        # Copy on write: readers keep whichever map they already fetched
+        snapshots = dict(self._snapshots)
+        if config == self.defaults:
+            snapshots.pop(guild_id, None)
+        else:
+            snapshots[guild_id] = config
+        self._snapshots = snapshots
+
+    def max_timeout(self) -> timedelta:
+        """Longest chain timeout any guild uses; a chain idle longer has expired everywhere"""
+        return max([self.defaults.timeout] + [config.timeout for config in self._snapshots.values()])
+
+    def overrides(self, guild_id: int) -> List[str]:
+        """Names of the settings that differ from the defaults for a guild"""
+        config = self.get(guild_id)
+        return [f.name for f in fields(GuildConfig) if getattr(config, f.name) != getattr(self.defaults, f.name)]
+
+def default_config() -> GuildConfig:
+    """Defaults from the environment (config/settings.py)"""
+    from config.settings import TRACKED_CHANNELS, CHAIN_KEYWORDS, CHAIN_TIMEOUT_MINUTES
+    return GuildConfig(
+        tracked_channels=frozenset(TRACKED_CHANNELS),
+        keywords=_parse_keywords(CHAIN_KEYWORDS),
+        chain_timeout_minutes=CHAIN_TIMEOUT_MINUTES,
+    )
+
+def get_config_store(bot) -> ConfigStore:
+    """The bot-wide ConfigStore (``bot.guild_config``), created on first use."""
+    store = getattr(bot, 'guild_config', None)
+    if store is None:
+        store = ConfigStore(default_config())
+        bot.guild_config = store
+    return store
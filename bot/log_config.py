@@ -0,0 +1,120 @@
+#logging setup that keeps handler I/O off the event loop
+import json
+import logging
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else was passed with extra= and goes into the JSON
+_RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+def parse_mapping(value: Optional[str]) -> Dict[str, str]:
+    """Parse 'a=1,b=2' settings into a dict"""
+    mapping = {}
+    for item in (value or '').split(','):
+        if '=' in item:
+            key, _, val = item.partition('=')
+            mapping[key.strip()] = val.strip()
+    return mapping
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with any extra= fields included."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith('_'):
+                entry[key] = value
+        # Tracebacks are rendered by the queue handler, on the thread that raised
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc_info'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class SamplingFilter(logging.Filter):
+    """
+    Passes one in every N records below WARNING for the configured loggers
+    (and their children). Warnings and errors are never sampled.
+    """
+
+    def __init__(self, rates: Dict[str, int]):
+        super().__init__()
+        self.rates = {name: rate for name, rate in rates.items() if rate > 1}
+        self.seen: Dict[str, int] = {}
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def _rate_for(self, name: str):
+        while name:
+            if name in self.rates:
+                return name, self.rates[name]
+            name = name.rpartition('.')[0]
+        return None, 1
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        key, rate = self._rate_for(record.name)
+        if rate <= 1:
+            return True
+        with self._lock:
+            count = self.seen.get(key, 0)
+            self.seen[key] = count + 1
+        if count % rate == 0:
+            record.sample_rate = rate
+            return True
+        self.dropped += 1
+        return False
+
+class _QueueHandler(QueueHandler):
+    """Queue handler that leaves formatting to the listener thread."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge the arguments now so they can't change before the listener runs.
+        # Tracebacks hold frames, so they're rendered here and dropped
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+def setup_logging(level: str = 'INFO', log_format: str = 'text', levels: Optional[Dict[str, str]] = None,
+                  sample_rates: Optional[Dict[str, int]] = None, stream=None) -> QueueListener:
+    """
+    Route every record through a queue to a background thread that does the
+    formatting and writing, so a slow terminal or pipe never stalls the event
+    loop. Returns the started listener; stop() it on shutdown to flush.
+    """
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JsonFormatter() if log_format == 'json' else logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    if sample_rates:
+        # Dropped before they're queued, on the caller's thread
+        queue_handler.addFilter(SamplingFilter(sample_rates))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper())
+    for name, module_level in (levels or {}).items():
+        logging.getLogger(name).setLevel(module_level.upper())
+
+    listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    return listener
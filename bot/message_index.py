@@ -0,0 +1,105 @@
+#in-memory lookup of drink check message ids
+import hashlib
+import math
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Iterable, Optional, Tuple
+
+from bot.chain_engine import Clock, normalize_timestamp, utc_now
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over integer ids. ``might_contain`` never returns
+    False for an added id; it returns True for an id that wasn't added with
+    roughly ``error_rate`` probability while under ``capacity`` ids.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: int):
+        digest = hashlib.blake2b(item.to_bytes(8, 'little', signed=True), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, item: int):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def might_contain(self, item: int) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+class DrinkCheckIndex:
+    """
+    Message ids of drink checks stored in the last ``max_age`` (at most
+    ``max_size`` of them), so replies can be matched without a query. An
+    optional Bloom filter over every stored drink check rules out most ids
+    that were never drink checks, leaving only the rest for the database.
+    """
+
+    def __init__(self, max_age: timedelta, max_size: int, clock: Clock = utc_now):
+        self.max_age = max_age
+        self.max_size = max_size
+        self.clock = clock
+        # message id -> (drink check id, stored at), oldest first
+        self.recent: 'OrderedDict[int, Tuple[int, datetime]]' = OrderedDict()
+        self.bloom: Optional[BloomFilter] = None
+
+    def __len__(self):
+        return len(self.recent)
+
+    def add(self, message_id: int, drink_check_id: Optional[int] = None, timestamp: Optional[datetime] = None):
+        """Record a drink check. The models key drink checks by message id, so that's the default id"""
+        timestamp = normalize_timestamp(timestamp) if timestamp else self.clock()
+        self.recent[message_id] = (message_id if drink_check_id is None else drink_check_id, timestamp)
+        self.recent.move_to_end(message_id)
+        if self.bloom is not None:
+            self.bloom.add(message_id)
+        self._evict()
+
+    def _evict(self):
+        cutoff = self.clock() - self.max_age
+        while self.recent:
+            message_id, (_, timestamp) = next(iter(self.recent.items()))
+            if len(self.recent) <= self.max_size and timestamp >= cutoff:
+                break
+            del self.recent[message_id]
+
+    def get(self, message_id: int) -> Optional[int]:
+        """Drink check id for a recent drink check message, or None if it isn't in the window"""
+        entry = self.recent.get(message_id)
+        if entry is None:
+            return None
+        if entry[1] < self.clock() - self.max_age:
+            self._evict()
+            return None
+        return entry[0]
+
+    def might_contain(self, message_id: int) -> bool:
+        """False only if the message is certainly not a stored drink check"""
+        if message_id in self.recent:
+            return True
+        if self.bloom is None:
+            return True
+        return self.bloom.might_contain(message_id)
+
+    def attach_bloom(self, bloom: BloomFilter):
+        """Start using a filter built (off the event loop) from every stored drink check"""
+        # Anything added while it was being built is still in the recent window
+        for message_id in self.recent:
+            bloom.add(message_id)
+        self.bloom = bloom
+
+def build_bloom(message_ids: Iterable[int], capacity: int, error_rate: float) -> BloomFilter:
+    """Bloom filter over ``message_ids``. Leave headroom in ``capacity`` for ids added later"""
+    bloom = BloomFilter(capacity, error_rate)
+    for message_id in message_ids:
+        bloom.add(message_id)
+    return bloom
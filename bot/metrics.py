@@ -0,0 +1,166 @@
+#latency histograms and counters for the message pipeline
+import bisect
+import logging
+import time
+from contextlib import nullcontext
+from typing import Dict, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Bucket upper bounds in seconds, from half a millisecond up to five seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Shared no-op context manager handed out while metrics are disabled
+_NOOP = nullcontext()
+
+class Histogram:
+    """Fixed-bucket latency histogram, rendered in the Prometheus format."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # One extra slot for observations above the last bucket (+Inf)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by interpolating inside the bucket that contains it."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for idx, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[idx - 1] if idx > 0 else 0.0
+                upper = self.buckets[idx] if idx < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * ((rank - seen) / bucket_count)
+            seen += bucket_count
+        return self.buckets[-1]
+
+class _StageTimer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+class MetricsRegistry:
+    """
+    Histograms keyed by stage name and counters keyed by (name, label).
+    When disabled, time() returns a shared no-op context manager and inc()
+    returns immediately, so instrumented code costs a call and a branch.
+    """
+
+    def __init__(self, enabled: bool = True, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[Tuple[str, Optional[str]], int] = {}
+
+    def time(self, stage: str):
+        """Context manager recording how long the block took under ``stage``."""
+        if not self.enabled:
+            return _NOOP
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = Histogram(self.buckets)
+        return _StageTimer(histogram)
+
+    def observe(self, stage: str, seconds: float):
+        """Record an already measured duration."""
+        if not self.enabled:
+            return
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = Histogram(self.buckets)
+        histogram.observe(seconds)
+
+    def inc(self, name: str, reason: Optional[str] = None, amount: int = 1):
+        """Increment a counter, optionally split by a reason label."""
+        if not self.enabled:
+            return
+        key = (name, reason)
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def reset(self):
+        self.histograms.clear()
+        self.counters.clear()
+
+    def render_prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        if self.histograms:
+            lines.append("# HELP drinkcheck_stage_seconds Latency of each on_message pipeline stage")
+            lines.append("# TYPE drinkcheck_stage_seconds histogram")
+        for stage, histogram in sorted(self.histograms.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, histogram.counts):
+                cumulative += bucket_count
+                lines.append(f'drinkcheck_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'drinkcheck_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+            lines.append(f'drinkcheck_stage_seconds_sum{{stage="{stage}"}} {histogram.sum}')
+            lines.append(f'drinkcheck_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+
+        names = sorted({name for name, _ in self.counters})
+        for name in names:
+            lines.append(f"# TYPE drinkcheck_{name} counter")
+            for (counter_name, reason), value in sorted(self.counters.items(), key=lambda item: str(item[0])):
+                if counter_name != name:
+                    continue
+                labels = f'{{reason="{reason}"}}' if reason else ""
+                lines.append(f"drinkcheck_{name}{labels} {value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """Human readable table for the /admin metrics command."""
+        if not self.enabled:
+            return "Metrics are disabled (set METRICS_ENABLED=1 to turn them on)."
+
+        lines = [f"{'stage':<16}{'count':>8}{'mean':>10}{'p50':>10}{'p99':>10}"]
+        for stage, histogram in sorted(self.histograms.items()):
+            mean = histogram.sum / histogram.count if histogram.count else 0.0
+            lines.append(
+                f"{stage:<16}{histogram.count:>8}{mean * 1000:>8.1f}ms"
+                f"{histogram.quantile(0.5) * 1000:>8.1f}ms{histogram.quantile(0.99) * 1000:>8.1f}ms"
+            )
+        if self.counters:
+            lines.append("")
+            for (name, reason), value in sorted(self.counters.items(), key=lambda item: str(item[0])):
+                label = f"{name}[{reason}]" if reason else name
+                lines.append(f"{label:<40}{value:>8}")
+        return "\n".join(lines)
+
+async def start_metrics_server(registry: MetricsRegistry, host: str, port: int):
+    """Serve /metrics for Prometheus on a local port. Returns the aiohttp runner."""
+    from aiohttp import web
+
+    async def handle_metrics(request):
+        return web.Response(text=registry.render_prometheus(), content_type='text/plain')
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return runner
+
+def _registry_from_settings() -> MetricsRegistry:
+    from config.settings import METRICS_ENABLED
+    return MetricsRegistry(enabled=METRICS_ENABLED)
+
+# Process-wide registry used by the message pipeline
+metrics = _registry_from_settings()
@@ -0,0 +1,51 @@
+#per-user flood guard for incoming messages
+import time
+from typing import Callable, Dict, Hashable, List
+
+class TokenBucketLimiter:
+    """
+    One token bucket per key: up to ``burst`` messages at once, refilled at
+    ``rate`` per second. A check is a dict lookup and some arithmetic, so a
+    flood is turned away before it reaches the database.
+    """
+
+    def __init__(self, rate: float, burst: int, clock: Callable[[], float] = time.monotonic,
+                 max_keys: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.max_keys = max_keys
+        # key -> [tokens, last refill]
+        self.buckets: Dict[Hashable, List[float]] = {}
+
+    def allow(self, key: Hashable, cost: float = 1.0) -> bool:
+        """Take ``cost`` tokens from the key's bucket. False if there aren't enough"""
+        now = self.clock()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= self.max_keys:
+                self._prune(now)
+            bucket = self.buckets[key] = [float(self.burst), now]
+        else:
+            # The clock may be wall time; never refill backwards
+            bucket[0] = min(self.burst, bucket[0] + max(0.0, now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] < cost:
+            return False
+        bucket[0] -= cost
+        return True
+
+    def _prune(self, now: float):
+        """Forget buckets that have refilled completely; they behave like new ones"""
+        full_after = self.burst / self.rate if self.rate > 0 else float('inf')
+        idle = [key for key, (_, last) in self.buckets.items() if now - last >= full_after]
+        for key in idle:
+            del self.buckets[key]
+        # Still full of active keys: drop the oldest half rather than grow without bound
+        if len(self.buckets) >= self.max_keys:
+            oldest = sorted(self.buckets, key=lambda key: self.buckets[key][1])
+            for key in oldest[:len(oldest) // 2]:
+                del self.buckets[key]
+
+    def __len__(self):
+        return len(self.buckets)
@@ -0,0 +1,33 @@
+#per-guild database shards, from the event loop's side
+import asyncio
+from typing import Optional
+
+from bot.event_log import EventLog, get_event_log
+from database.sharding import needs_opening, open_shard, shard_for, shards
+
+def open_shard_log(log: EventLog, shard: str):
+    """Open a shard's event log; a new one starts from a snapshot of the shard. Blocking"""
+    db = shards.session(shard)
+    try:
+        log.open(db)
+    finally:
+        db.close()
+
+def _open_guild(guild_id: int, log: Optional[EventLog]):
+    open_shard(guild_id)
+    if log is not None:
+        open_shard_log(log, shard_for(guild_id))
+
+async def prepare_guild(bot, guild_id: Optional[int]):
+    """
+    Open the guild's shard and its event log on a worker thread the first
+    time they're used, so a session taken afterwards on the event loop never
+    waits for a new file to be created or migrated, or for a log's first
+    snapshot. Call it before DatabaseSession(guild_id) in a handler
+    """
+    shard = shard_for(guild_id)
+    if shard is None:
+        return
+    log = get_event_log(bot, shard)
+    if needs_opening(guild_id) or (log is not None and not log.is_open):
+        await asyncio.to_thread(_open_guild, guild_id, log)
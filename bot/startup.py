@@ -0,0 +1,46 @@
+#startup timing
+import asyncio
+import logging
+import time
+from typing import Awaitable, Dict, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+class StartupTimer:
+    """Records how long each startup stage takes and when milestones are hit."""
+
+    def __init__(self, started_at: Optional[float] = None):
+        # perf_counter() value for when the process started
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.milestones: Dict[str, float] = {}
+
+    async def timed(self, name: str, awaitable: Awaitable[T]) -> T:
+        """Await a stage and record its duration. Stages may run concurrently."""
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.stages[name] = time.perf_counter() - start
+
+    def mark(self, name: str) -> Optional[float]:
+        """Record the first time a milestone is reached, relative to process start."""
+        if name in self.milestones:
+            return None
+        elapsed = time.perf_counter() - self.started_at
+        self.milestones[name] = elapsed
+        logger.info(f"Startup milestone {name} reached after {elapsed * 1000:.0f}ms")
+        return elapsed
+
+    def summary(self) -> str:
+        """One line breakdown of stage durations, slowest first."""
+        stages = sorted(self.stages.items(), key=lambda item: item[1], reverse=True)
+        breakdown = ", ".join(f"{name}={duration * 1000:.0f}ms" for name, duration in stages)
+        total = time.perf_counter() - self.started_at
+        return f"Startup took {total * 1000:.0f}ms since process start ({breakdown})"
+
+async def run_concurrently(timer: StartupTimer, stages: Dict[str, Awaitable]):
+    """Run independent startup stages concurrently, timing each one."""
+    await asyncio.gather(*(timer.timed(name, stage) for name, stage in stages.items()))
@@ -1,17 +1,405 @@
+#stats read path shared by the commands
+import asyncio
+import contextvars
+import functools
+import logging
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+import discord
+import pytz
+from sqlalchemy import func, text
+
+from bot.cache import LeaderboardEntry, LEADERBOARD_CACHE_SIZE, StateCache, chain_state_from_model, get_state_cache
+from bot.chain_engine import ChainState
+from database.connection import ReadSession
+from database.models import User, Credit, ActiveChain, DrinkCheck
+from database.sharding import shard_for
+
+logger = logging.getLogger(__name__)
+
+# Set up Central timezone
+central = pytz.timezone('America/Chicago')
+
+LEADERBOARD_TYPES = ('credits', 'streak')
+
+class TTLCache:
+    """Values that expire ``ttl`` seconds after they were stored."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: Dict[Hashable, Tuple[float, Any]] = {}
+
+    def get(self, key: Hashable, default=None):
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        if entry[0] < time.monotonic():
+            del self._entries[key]
+            return default
+        return entry[1]
+
+    def set(self, key: Hashable, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        """Drop one key, or everything"""
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+class LRUCache:
+    """At most ``maxsize`` values; the least recently used is dropped first."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: 'OrderedDict[Hashable, Any]' = OrderedDict()
+
+    def get(self, key: Hashable, default=None):
+        try:
+            self._entries.move_to_end(key)
+        except KeyError:
+            return default
+        return self._entries[key]
+
+    def set(self, key: Hashable, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+# Looks a user's name up outside the database (Discord's cache or API); None if unknown
+NameFetcher = Callable[[int], Awaitable[Optional[str]]]
+
+@dataclass(frozen=True)
+class UserStats:
+    user_id: int
+    username: str
+    total_drink_checks: int
+    longest_chain_streak: int
+    today: int  # Central Time
+    yesterday: int
+    most_active_day: Optional[str]
+    most_active_count: int
+
+@dataclass(frozen=True)
+class RecentActivity:
+    message_id: int
+    user_id: int
+    username: str
+    chain_id: int
+    credit_type: str  # 'initial' for the drink check that started the chain
+    timestamp: datetime
+
 class StatsManager:
-    async def get_user_stats(self, user_id: int) -> dict:
-        # Get total drink checks, responses, etc.
-        # Return formatted stats
-        pass
-        
-    async def get_leaderboard(self, stat_type: str) -> list:
-        # Get top users by drink checks, responses, etc.
-        pass
-        
-    async def get_recent_activity(self, limit: int = 10) -> list:
-        # Get recent drink checks and responses
-        pass
-        
-    async def increment_drink_checks(self, user_id: int):
-        # Update user's drink check count
-        pass
\ No newline at end of file
+    """
+    The one place the commands read stats from. Query results are cached per
+    query type for ``ttl`` seconds and invalidated when the message handler
+    or an admin command writes. Recent drink checks are kept in a ring buffer,
+    so get_recent_activity never touches the database.
+
+    Queries run on a small thread pool of their own, so a slow one never
+    blocks the event loop and can't starve ``asyncio.to_thread`` work. The
+    caches are only touched on the event loop.
+
+    With database shards there is one manager per shard, reading through
+    ``guild_id`` (any guild in the shard) and sharing the main one's pool.
+    """
+
+    def __init__(self, cache: StateCache, ttl: float = 60, recent_size: int = 50, workers: int = 4,
+                 name_cache_size: int = 1000, fetch_name: Optional[NameFetcher] = None,
+                 guild_id: Optional[int] = None, executor: Optional[ThreadPoolExecutor] = None):
+        self.cache = cache
+        self.guild_id = guild_id
+        self.user_stats = TTLCache(ttl)
+        self.leaderboards = TTLCache(ttl)
+        # Display names come from users.username, so the member cache isn't needed for them
+        self.usernames = LRUCache(name_cache_size)
+        self.fetch_name = fetch_name
+        self.recent: Deque[RecentActivity] = deque(maxlen=recent_size)
+        # Until warm_up has run the buffer only holds what was committed since
+        self.warmed = False
+        self._owns_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(max_workers=workers, thread_name_prefix='stats')
+        # Bumped by every invalidation. A query that was running when it happened
+        # may have read the old data, so its result isn't cached
+        self.generation = 0
+
+    async def _read(self, query: Callable[..., Any], *args) -> Any:
+        """Run ``query(db, *args)`` in a read session on the stats pool"""
+        loop = asyncio.get_running_loop()
+        # Like asyncio.to_thread, carry the profiler's scope into the worker
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self.executor, functools.partial(context.run, self._in_session, query, *args))
+
+    def _in_session(self, query: Callable[..., Any], *args) -> Any:
+        with ReadSession(self.guild_id) as db:
+            return query(db, *args)
+
+    def close(self):
+        if self._owns_executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def warm_up(self):
+        """Load the credits leaderboard and the recent activity buffer"""
+        loaded = await asyncio.to_thread(self._load_warm_state)
+        # Drink checks committed while the query ran may or may not be in it
+        seen = {activity.message_id for activity in loaded}
+        self.recent = deque(loaded + [activity for activity in self.recent if activity.message_id not in seen],
+                            maxlen=self.recent.maxlen)
+        self.warmed = True
+
+    def _load_warm_state(self) -> List[RecentActivity]:
+        with ReadSession(self.guild_id) as db:
+            self._load_leaderboard(db)
+            rows = db.query(DrinkCheck, User.username, Credit.credit_type)\
+                .join(User, User.user_id == DrinkCheck.user_id)\
+                .join(Credit, Credit.message_id == DrinkCheck.message_id)\
+                .order_by(DrinkCheck.timestamp.desc())\
+                .limit(self.recent.maxlen)\
+                .all()
+            # The buffer is oldest first
+            return [RecentActivity(
+                drink_check.message_id, drink_check.user_id, username, drink_check.chain_id,
+                credit_type.value if credit_type else 'chain', drink_check.timestamp
+            ) for drink_check, username, credit_type in reversed(rows)]
+
+    def _load_leaderboard(self, db) -> List[LeaderboardEntry]:
+        """Read the top of the credits leaderboard into the shared cache"""
+        entries = self._query_leaderboard(db)
+        self.cache.set_leaderboard(entries)
+        return entries
+
+    @staticmethod
+    def _query_leaderboard(db, column=User.total_credits) -> List[LeaderboardEntry]:
+        # The value column holds whatever the board is ranked by
+        rows = db.query(User.user_id, User.username, column)\
+            .order_by(column.desc())\
+            .limit(LEADERBOARD_CACHE_SIZE)\
+            .all()
+        return [LeaderboardEntry(user_id, username, value or 0) for user_id, username, value in rows]
+
+    async def get_user_stats(self, user_id: int) -> Optional[UserStats]:
+        """Profile numbers for a user, or None if they've never been seen"""
+        today = datetime.utcnow().replace(tzinfo=pytz.UTC).astimezone(central).date()
+        cached_day, stats = self.user_stats.get(user_id, (None, None))
+        # Today/yesterday roll over at midnight
+        if stats is None or cached_day != today:
+            generation = self.generation
+            stats = await self._read(self._query_user_stats, user_id, today)
+            if stats is not None and generation == self.generation:
+                self.user_stats.set(user_id, (today, stats))
+        return stats
+
+    def _query_user_stats(self, db, user_id: int, today) -> Optional[UserStats]:
+        db_user = db.query(User).filter_by(user_id=user_id).first()
+        if not db_user:
+            return None
+
+        # Create datetime ranges in Central Time and convert to UTC for the queries
+        yesterday = today - timedelta(days=1)
+        today_start = central.localize(datetime.combine(today, datetime.min.time())).astimezone(pytz.UTC)
+        today_end = central.localize(datetime.combine(today, datetime.max.time())).astimezone(pytz.UTC)
+        yesterday_start = central.localize(datetime.combine(yesterday, datetime.min.time())).astimezone(pytz.UTC)
+        yesterday_end = central.localize(datetime.combine(yesterday, datetime.max.time())).astimezone(pytz.UTC)
+
+        # Get total drink check count (no distinction between types)
+        total_dcs = db.query(func.count(Credit.credit_id))\
+            .filter_by(user_id=user_id)\
+            .scalar() or 0
+
+        today_dcs = db.query(func.count(Credit.credit_id))\
+            .filter(Credit.user_id == user_id,
+                   Credit.timestamp >= today_start,
+                   Credit.timestamp <= today_end)\
+            .scalar() or 0
+
+        yesterday_dcs = db.query(func.count(Credit.credit_id))\
+            .filter(Credit.user_id == user_id,
+                   Credit.timestamp >= yesterday_start,
+                   Credit.timestamp <= yesterday_end)\
+            .scalar() or 0
+
+        # Get most active day
+        daily_counts = db.query(
+            func.strftime('%Y-%m-%d', Credit.timestamp).label('date'),
+            func.count(Credit.credit_id).label('count')
+        ).filter(
+            Credit.user_id == user_id
+        ).group_by(
+            func.strftime('%Y-%m-%d', Credit.timestamp)
+        ).order_by(
+            text('count DESC')
+        ).first()
+
+        return UserStats(
+            user_id=db_user.user_id,
+            username=db_user.username,
+            total_drink_checks=total_dcs,
+            longest_chain_streak=db_user.longest_chain_streak or 0,
+            today=today_dcs,
+            yesterday=yesterday_dcs,
+            most_active_day=daily_counts.date if daily_counts else None,
+            most_active_count=daily_counts.count if daily_counts else 0,
+        )
+
+    async def get_leaderboard(self, stat_type: str = 'credits') -> List[LeaderboardEntry]:
+        """
+        Top users by ``stat_type``: 'credits' (kept current by the message
+        handler) or 'streak' (longest chain, cached for the TTL).
+        """
+        if stat_type == 'credits':
+            entries = self.cache.leaderboard
+            if entries is None:
+                generation = self.cache.leaderboard_generation
+                entries = await self._read(self._query_leaderboard)
+                # A credit committed while the query ran would be missing from it
+                if generation == self.cache.leaderboard_generation:
+                    self.cache.set_leaderboard(entries)
+            return entries
+        if stat_type not in LEADERBOARD_TYPES:
+            raise ValueError(f"Unknown leaderboard type: {stat_type}")
+
+        entries = self.leaderboards.get(stat_type)
+        if entries is None:
+            generation = self.generation
+            entries = await self._read(self._query_leaderboard, User.longest_chain_streak)
+            if generation == self.generation:
+                self.leaderboards.set(stat_type, entries)
+        return entries
+
+    async def get_server_record(self) -> Tuple[Optional[ChainState], str]:
+        """The server record chain and its starter's name"""
+        if self.cache.chain_loaded:
+            record = self.cache.server_record
+        else:
+            record = await self._read(self._query_server_record)
+        if record is None:
+            return None, "Unknown"
+
+        starter_name = self.cache.record_starter_name if self.cache.chain_loaded else None
+        if not starter_name:
+            starter_name = await self.get_username(record.starter_id)
+            if self.cache.chain_loaded:
+                self.cache.record_starter_name = starter_name
+        return record, starter_name
+
+    async def get_current_chain(self, active_only: bool = True) -> Tuple[Optional[ChainState], bool]:
+        """
+        The active chain and whether it's still open. With ``active_only`` off,
+        falls back to the most recently started chain if none is active.
+        """
+        if self.cache.chain_loaded:
+            if self.cache.active_chain is not None:
+                return self.cache.active_chain, True
+            if active_only:
+                return None, False
+
+        return await self._read(self._query_current_chain, active_only)
+
+    @staticmethod
+    def _query_server_record(db) -> Optional[ChainState]:
+        row = db.query(ActiveChain)\
+            .filter_by(is_server_record=True)\
+            .first()
+        return chain_state_from_model(row) if row else None
+
+    @staticmethod
+    def _query_current_chain(db, active_only: bool) -> Tuple[Optional[ChainState], bool]:
+        query = db.query(ActiveChain)
+        if active_only:
+            query = query.filter_by(is_active=True)
+        chain = query.order_by(ActiveChain.start_time.desc()).first()
+        if chain is None:
+            return None, False
+        return chain_state_from_model(chain), bool(chain.is_active)
+
+    async def get_username(self, user_id: int) -> str:
+        """Name stored with the user's credits, else asked of Discord"""
+        username = self.usernames.get(user_id)
+        if username is None:
+            row = await self._read(lambda db: db.query(User.username).filter_by(user_id=user_id).first())
+            username = row.username if row else None
+            if not username and self.fetch_name:
+                username = await self.fetch_name(user_id)
+            username = username or "Unknown"
+            self.usernames.set(user_id, username)
+        return username
+
+    async def get_recent_activity(self, limit: int = 10) -> List[RecentActivity]:
+        """The latest drink checks, newest first. Served from memory once warmed"""
+        if not self.warmed:
+            # Shards are warmed when first asked for rather than all at startup
+            await self.warm_up()
+        return list(reversed(self.recent))[:limit]
+
+    async def increment_drink_checks(self, user_id: int, activity: Optional[RecentActivity] = None):
+        """Called after a drink check is committed: records it and drops the user's cached stats"""
+        if activity is not None:
+            self.recent.append(activity)
+            self.usernames.set(user_id, activity.username)
+        self.invalidate_user(user_id)
+
+    def invalidate_user(self, user_id: int):
+        """Drop everything cached that depends on the user's credits or streak"""
+        self.generation += 1
+        self.user_stats.invalidate(user_id)
+        self.leaderboards.invalidate('streak')
+
+async def fetch_name(client, user_id: int) -> Optional[str]:
+    """A user's name from the client's cache, or one API call if it isn't there"""
+    user = client.get_user(user_id)
+    if user is None:
+        if not client.is_ready():
+            # Not connected (startup, replays and benchmarks)
+            return None
+        try:
+            user = await client.fetch_user(user_id)
+        except discord.HTTPException as e:
+            logger.debug(f"Couldn't fetch user {user_id}: {e}")
+            return None
+    # Stored names are str(author), so fetched ones match
+    return str(user)
+
+def get_stats_manager(bot, guild_id: Optional[int] = None) -> StatsManager:
+    """
+    The StatsManager for the guild's database shard, created on first use.
+    Guilds in the main database share the bot-wide one, ``bot.stats``.
+    """
+    from config.settings import STATS_CACHE_TTL_SECONDS, RECENT_ACTIVITY_SIZE, STATS_QUERY_WORKERS, NAME_CACHE_SIZE
+    stats = getattr(bot, 'stats', None)
+    if stats is None:
+        stats = StatsManager(get_state_cache(bot), STATS_CACHE_TTL_SECONDS, RECENT_ACTIVITY_SIZE, STATS_QUERY_WORKERS,
+                             NAME_CACHE_SIZE, functools.partial(fetch_name, bot))
+        bot.stats = stats
+    shard = shard_for(guild_id)
+    if shard is None:
+        return stats
+
+    managers = getattr(bot, 'shard_stats', None)
+    if managers is None:
+        managers = bot.shard_stats = {}
+    manager = managers.get(shard)
+    if manager is None:
+        manager = managers[shard] = StatsManager(
+            get_state_cache(bot, guild_id), STATS_CACHE_TTL_SECONDS, RECENT_ACTIVITY_SIZE, STATS_QUERY_WORKERS,
+            NAME_CACHE_SIZE, stats.fetch_name, guild_id=guild_id, executor=stats.executor
+        )
+    return manager
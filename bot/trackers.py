@@ -1,11 +1,24 @@
 #Trackers for drink check messages and responses
+import asyncio
+import logging
 from typing import Optional
-from config.settings import TRACKED_CHANNELS
+from bot.chain_engine import DEFAULT_KEYWORDS, keyword_variations, qualifies
+from bot.message_index import DrinkCheckIndex
+from bot.guild_config import ConfigStore
+from database.connection import ReadSession
+from database.models import DrinkCheck
+
+logger = logging.getLogger(__name__)
 
 class DrinkCheckTracker:
-    def __init__(self, database=None):
-        self.keywords = ["drink check", "dc"]
+    def __init__(self, database=None, index: Optional[DrinkCheckIndex] = None, config: Optional[ConfigStore] = None):
+        # Per-guild keywords come from the config store; these are the defaults
+        self.keywords = list(config.defaults.keywords if config else DEFAULT_KEYWORDS)
+        self.variations = keyword_variations(self.keywords)
+        self.config = config
         self.database = database
+        # Recent drink check ids, so most replies are resolved without a query
+        self.index = index
         
     def is_drink_check(self, content: str, message=None, active_chain=None) -> bool:
         """
@@ -13,63 +26,58 @@ class DrinkCheckTracker:
         1. Normal message with no active chain: Must have "dc" (or variant) AND attachment
         2. Message during active chain: Only needs attachment
         3. Reply: Must have attachment (with or without "dc")
+        The rules themselves live in bot.chain_engine.
         """
         # Early return if no message object
         if not message:
             return False
 
-        # Check if message has file attachments
-        has_attachment = len(message.attachments) > 0 if message.attachments else False
-        if not has_attachment:
-            return False  # No attachment = no drink check
-
-        # If it's a reply with an attachment, it's valid
-        is_reply = bool(message.reference)
-        if is_reply:
-            return True  # Replies with attachments are always valid
-
-        # If there's an active chain, any message with attachment is valid
-        if active_chain:
-            return True
-
-        # For non-replies without active chain, check for drink check keywords
-        content_lower = content.lower().strip()
-        
-        # Generate variations from the base keywords
-        variations = []
-        for keyword in self.keywords:
-            variations.extend([
-                keyword,
-                f"{keyword}!",
-                f"{keyword}?",
-                f"{keyword}.",
-                "d c",
-            ])
-        
-        # Check if content contains drink check keywords
-        has_keywords = any(variation in content_lower for variation in variations)
-        
-        # For non-replies without active chain, need both keywords AND attachment
-        return has_keywords and has_attachment
+        variations = self.variations
+        if self.config and getattr(message, 'guild', None):
+            variations = self.config.get(message.guild.id).variations
+        return qualifies(
+            len(message.attachments) if message.attachments else 0,
+            bool(message.reference),
+            bool(active_chain),
+            content,
+            variations
+        )
         
     async def is_response_to_drink_check(self, message) -> Optional[int]:
         # Check if message is a reply to a tracked drink check
         # Return drink check ID if it is
         if message.reference and message.reference.message_id:
             # This is a reply to another message
+            replied_to = message.reference.message_id
+            if self.index:
+                drink_check_id = self.index.get(replied_to)
+                if drink_check_id is not None:
+                    return drink_check_id
+                if not self.index.might_contain(replied_to):
+                    # The Bloom filter has never seen it, so it's not a drink check
+                    return None
+
             # Check if the referenced message is a drink check in our database
             if self.database:
-                drink_check_id = await self.database.get_drink_check_by_message_id(str(message.reference.message_id))
-                return drink_check_id
+                drink_check_id = await self.database.get_drink_check_by_message_id(str(replied_to))
+            else:
+                guild = getattr(message, 'guild', None)
+                drink_check_id = await asyncio.to_thread(_stored_drink_check, replied_to, guild.id if guild else None)
+            if drink_check_id is not None and self.index:
+                # Further replies to the same message are answered from memory
+                self.index.add(replied_to, drink_check_id)
+            return drink_check_id
         return None
         
     async def track_new_drink_check(self, message):
         # Store new drink check in database
-        print(f"New drink check detected: {message.content} by {message.author.name}")
-        if message.attachments:
-            print(f"  - Has {len(message.attachments)} attachment(s)")
-            for i, attachment in enumerate(message.attachments):
-                print(f"    Attachment {i+1}: {attachment.filename} ({attachment.content_type})")
+        # Runs once per message, so keep it cheap when DEBUG is off
+        if logger.isEnabledFor(logging.DEBUG):
+            attachments = ', '.join(f"{a.filename} ({a.content_type})" for a in message.attachments or [])
+            logger.debug(
+                f"New drink check detected: {message.content} by {message.author.name}",
+                extra={'message_id': message.id, 'attachments': attachments}
+            )
         
         if self.database:
             drink_check_id = await self.database.save_drink_check(
@@ -80,11 +88,11 @@ class DrinkCheckTracker:
                 channel_id=str(message.channel.id)
             )
             if drink_check_id > 0:
-                print(f"Saved drink check with ID: {drink_check_id}")
+                logger.debug(f"Saved drink check with ID: {drink_check_id}")
         
     async def track_response(self, message, drink_check_id: int):
         # Store response in database
-        print(f"Response to drink check {drink_check_id}: {message.content} by {message.author.name}")
+        logger.debug(f"Response to drink check {drink_check_id}: {message.content} by {message.author.name}")
         
         if self.database:
             response_id = await self.database.save_response(
@@ -95,5 +103,11 @@ class DrinkCheckTracker:
                 content=message.content
             )
             if response_id > 0:
-                print(f"Saved response with ID: {response_id}")
+                logger.debug(f"Saved response with ID: {response_id}")
+
 
+def _stored_drink_check(message_id: int, guild_id: Optional[int] = None) -> Optional[int]:
+    """Drink check id (its message id) if the message is a stored drink check in the guild's database"""
+    with ReadSession(guild_id) as db:
+        row = db.query(DrinkCheck.message_id).filter_by(message_id=message_id).first()
+        return row[0] if row else None
@@ -0,0 +1,110 @@
+#gateway traffic recording for replays
+import gzip
+import hashlib
+import json
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, Optional, Sequence
+import time
+
+from bot.chain_engine import has_keyword, keyword_variations, DEFAULT_KEYWORDS
+
+logger = logging.getLogger(__name__)
+
+# Records are written in batches of this many lines
+FLUSH_EVERY = 100
+
+@dataclass(frozen=True)
+class TrafficRecord:
+    """Compact, content-free description of one gateway message."""
+    timestamp: float  # message.created_at as a UTC epoch
+    message_id: int
+    guild_id: Optional[int]
+    channel_id: int
+    author_id: int
+    author_bot: bool
+    reply_to: Optional[int]
+    attachments: int
+    content_hash: str
+    # The content itself isn't stored, only whether it would start a chain
+    has_keyword: bool
+
+    def to_row(self) -> list:
+        return [
+            round(self.timestamp, 3), self.message_id, self.guild_id, self.channel_id, self.author_id,
+            int(self.author_bot), self.reply_to, self.attachments, self.content_hash, int(self.has_keyword)
+        ]
+
+    @classmethod
+    def from_row(cls, row: list) -> 'TrafficRecord':
+        return cls(row[0], row[1], row[2], row[3], row[4], bool(row[5]), row[6], row[7], row[8], bool(row[9]))
+
+def _open(path: str, mode: str):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+class TrafficRecorder:
+    """Appends one JSON array per message to a log file (gzipped if the path ends in .gz)."""
+
+    def __init__(self, path: str, keywords: Sequence[str] = DEFAULT_KEYWORDS):
+        self.path = path
+        self.variations = keyword_variations(keywords)
+        self._file = _open(path, 'a')
+        self._pending = 0
+        self.recorded = 0
+
+    def record(self, message):
+        created_at = getattr(message, 'created_at', None)
+        record = TrafficRecord(
+            timestamp=created_at.timestamp() if created_at else time.time(),
+            message_id=message.id,
+            guild_id=message.guild.id if message.guild else None,
+            channel_id=message.channel.id,
+            author_id=message.author.id,
+            author_bot=bool(message.author.bot),
+            reply_to=message.reference.message_id if message.reference else None,
+            attachments=len(message.attachments) if message.attachments else 0,
+            content_hash=hashlib.blake2b(message.content.encode('utf-8'), digest_size=8).hexdigest(),
+            has_keyword=has_keyword(message.content, self.variations),
+        )
+        self._file.write(json.dumps(record.to_row(), separators=(',', ':')) + '\n')
+        self.recorded += 1
+        self._pending += 1
+        if self._pending >= FLUSH_EVERY:
+            self.flush()
+
+    def flush(self):
+        self._file.flush()
+        self._pending = 0
+
+    def close(self):
+        self._file.close()
+
+def read_traffic(path: str) -> Iterator[TrafficRecord]:
+    """Records from a traffic log, in the order they were written."""
+    with _open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                yield TrafficRecord.from_row(json.loads(line))
+
+class ScaledClock:
+    """
+    Clock that starts at a recorded instant and runs ``speed`` times faster than
+    the wall clock, so chain timeouts shrink by the same factor as the replay.
+    """
+
+    def __init__(self, origin: datetime, speed: float):
+        self.origin = origin
+        self.speed = speed
+        self.wall_start = time.perf_counter()
+
+    def __call__(self) -> datetime:
+        return self.origin + timedelta(seconds=(time.perf_counter() - self.wall_start) * self.speed)
+
+    def restart(self):
+        self.wall_start = time.perf_counter()
+
+def record_time(record: TrafficRecord) -> datetime:
+    return datetime.fromtimestamp(record.timestamp, tz=timezone.utc)
@@ -1,71 +1,285 @@
-from database.models import User, DrinkCheck, Credit, ActiveChain
-from database.connection import DatabaseSession
-from sqlalchemy import inspect
-from datetime import datetime
+"""
+Database diagnostics.
+
+Prints table sizes, credit and chain summaries and the active chains, then
+runs integrity checks as single set-based queries:
+
+- users whose total_credits differs from their number of credit rows
+- credits pointing at a missing user or drink check (admin-set credits have no drink check)
+- chains whose total_messages differs from their number of drink checks
+- more than one chain flagged as the server record
+
+Nothing is loaded table-at-a-time; --dump streams one table as JSON lines.
+The database is only read: missing tables are reported (run migrate_db.py)
+rather than created. Exits with status 1 if any check fails or a table is
+missing.
+
+Usage:
+    python check_db.py
+    python check_db.py --json
+    python check_db.py --dump credits > credits.jsonl
+"""
+
+from database.models import Base, User, DrinkCheck, Credit, ActiveChain, default_chain_timeout
+from database.connection import ReadSession
+from sqlalchemy import inspect, func, select, table
+from sqlalchemy.exc import OperationalError
+from datetime import datetime, timedelta
+import argparse
+import enum
+import json
+import sys
 import pytz
 
 # Set up Central timezone
 central = pytz.timezone('America/Chicago')
 
-def check_tables():
-    print("Checking database tables and contents...")
-    with DatabaseSession() as db:
-        # Get inspector
-        inspector = inspect(db.get_bind())
-        
-        # List all tables
-        print("\nExisting tables:")
-        for table_name in inspector.get_table_names():
-            print(f"- {table_name}")
-        
-        # Check Users table
-        print("\nUsers in database:")
-        users = db.query(User).all()
-        for user in users:
-            print(f"User ID: {user.user_id}, Username: {user.username}, Total Credits: {user.total_credits}")
-        
-        # Check DrinkChecks table
-        print("\nDrink Checks in database:")
-        drink_checks = db.query(DrinkCheck).all()
-        for dc in drink_checks:
-            # Convert UTC timestamp to Central Time for display
-            ct_time = dc.timestamp.astimezone(central) if dc.timestamp else "No timestamp"
-            print(f"Message ID: {dc.message_id}, User ID: {dc.user_id}, Time (CT): {ct_time}, Is Reply: {dc.is_reply}")
-        
-        # Check Credits table
-        print("\nCredits in database:")
-        credits = db.query(Credit).all()
-        for credit in credits:
-            # Convert UTC timestamp to Central Time for display
-            ct_time = credit.timestamp.astimezone(central) if credit.timestamp else "No timestamp"
-            print(f"Credit ID: {credit.credit_id}, User ID: {credit.user_id}, Type: {credit.credit_type}, Time (CT): {ct_time}")
-
-        # Check Active Chains
-        print("\nActive Chains:")
-        active_chains = db.query(ActiveChain).filter_by(is_active=True).all()
-        for chain in active_chains:
-            # Get current time in UTC since our timestamps are in UTC
-            now = datetime.utcnow().replace(tzinfo=pytz.UTC)
-            
-            # Convert chain timestamps to Central Time for display
-            start_time_ct = chain.start_time.astimezone(central) if chain.start_time else "No start time"
-            last_activity_ct = chain.last_activity.astimezone(central) if chain.last_activity else "No activity"
-            
-            # Calculate time difference
-            if chain.last_activity:
-                last_activity_utc = chain.last_activity.replace(tzinfo=pytz.UTC) if chain.last_activity.tzinfo is None else chain.last_activity
-                time_diff = now - last_activity_utc
-                minutes_left = 30 - (time_diff.total_seconds() / 60)
+# Offending ids listed per failed check
+SAMPLE_SIZE = 10
+
+DUMP_MODELS = {
+    'users': User,
+    'drink_checks': DrinkCheck,
+    'credits': Credit,
+    'active_chains': ActiveChain,
+}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Summarize the database and check its integrity")
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    parser.add_argument('--dump', choices=sorted(DUMP_MODELS), help="Stream every row of a table as JSON lines")
+    parser.add_argument('--batch-size', type=int, default=1000, help="Rows fetched per round trip when dumping")
+    parser.add_argument('--samples', type=int, default=SAMPLE_SIZE, help="Offending ids listed per failed check")
+    parser.add_argument('--timeout-minutes', type=int, default=None,
+                        help="Chain timeout used for expiry (default: CHAIN_TIMEOUT_MINUTES)")
+    return parser.parse_args()
+
+def _jsonable(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return value.value
+    return value
+
+def _central(value):
+    if not value:
+        return None
+    value = value.replace(tzinfo=pytz.UTC) if value.tzinfo is None else value
+    return value.astimezone(central).isoformat()
+
+def dump_table(db, model, batch_size: int):
+    """Write every row of ``model`` to stdout without holding the table in memory"""
+    columns = [column.name for column in model.__table__.columns]
+    query = db.query(model).order_by(*model.__table__.primary_key.columns).yield_per(batch_size)
+    for row in query:
+        sys.stdout.write(json.dumps({name: _jsonable(getattr(row, name)) for name in columns}) + '\n')
+        # Rows aren't needed once written
+        db.expunge(row)
+
+def summarize(db, timeout: timedelta = None) -> dict:
+    """Row counts and aggregates, computed in the database. Chains expire after ``timeout``"""
+    timeout = timeout or default_chain_timeout()
+    summary = {'tables': {}}
+    inspector = inspect(db.get_bind())
+    for table_name in inspector.get_table_names():
+        summary['tables'][table_name] = db.execute(select(func.count()).select_from(table(table_name))).scalar()
+
+    summary['users'] = {
+        'count': db.query(func.count(User.user_id)).scalar(),
+        'with_credits': db.query(func.count(User.user_id)).filter(User.total_credits > 0).scalar(),
+        'max_credits': db.query(func.max(User.total_credits)).scalar(),
+        'longest_streak': db.query(func.max(User.longest_chain_streak)).scalar(),
+    }
+
+    credits_by_type = db.query(Credit.credit_type, func.count(Credit.credit_id)) \
+        .group_by(Credit.credit_type) \
+        .all()
+    summary['credits'] = {
+        'count': sum(count for _, count in credits_by_type),
+        'by_type': {_jsonable(credit_type): count for credit_type, count in credits_by_type},
+    }
+
+    count, first, last = db.query(
+        func.count(DrinkCheck.message_id), func.min(DrinkCheck.timestamp), func.max(DrinkCheck.timestamp)
+    ).one()
+    summary['drink_checks'] = {
+        'count': count,
+        'replies': db.query(func.count(DrinkCheck.message_id)).filter(DrinkCheck.is_reply.is_(True)).scalar(),
+        'first': _central(first),
+        'last': _central(last),
+    }
+
+    chain_count, average, longest = db.query(
+        func.count(ActiveChain.chain_id), func.avg(ActiveChain.total_messages), func.max(ActiveChain.total_messages)
+    ).one()
+    record = db.query(ActiveChain).filter_by(is_server_record=True) \
+        .order_by(ActiveChain.total_messages.desc()) \
+        .first()
+    now = datetime.utcnow().replace(tzinfo=pytz.UTC)
+    summary['chains'] = {
+        'count': chain_count,
+        'average_length': round(average or 0, 2),
+        'longest': longest,
+        'server_record_chain_id': record.chain_id if record else None,
+        # Still flagged active but past the timeout; the bot closes these on its next start or drink check
+        'expired_but_active': db.query(func.count(ActiveChain.chain_id))
+            .filter(ActiveChain.is_active.is_(True), ActiveChain.expired_clause(now, timeout))
+            .scalar(),
+    }
+
+    active = []
+    for chain in db.query(ActiveChain).filter_by(is_active=True).order_by(ActiveChain.chain_id):
+        if chain.last_activity:
+            last_activity_utc = chain.last_activity.replace(tzinfo=pytz.UTC) if chain.last_activity.tzinfo is None else chain.last_activity
+            minutes_left = (timeout - (now - last_activity_utc)).total_seconds() / 60
+        else:
+            minutes_left = 0
+        active.append({
+            'chain_id': chain.chain_id,
+            'starter_id': chain.starter_id,
+            'start_time': _central(chain.start_time),
+            'last_activity': _central(chain.last_activity),
+            'total_messages': chain.total_messages,
+            'minutes_until_expiry': round(minutes_left, 1),
+            'is_expired': chain.is_expired(now, timeout),
+        })
+    summary['active_chains'] = active
+    return summary
+
+def check_integrity(db, samples: int = SAMPLE_SIZE) -> list:
+    """Each check is one query returning the offending rows; ``samples`` of them are reported"""
+    results = []
+
+    def record(name, description, query, key):
+        count = db.execute(select(func.count()).select_from(query.subquery())).scalar()
+        sample = [row[0] for row in db.execute(query.limit(samples))] if count else []
+        results.append({'check': name, 'description': description, 'ok': count == 0,
+                        'violations': count, 'sample': {key: sample} if sample else {}})
+
+    credit_counts = select(Credit.user_id, func.count(Credit.credit_id).label('credits')) \
+        .group_by(Credit.user_id) \
+        .subquery()
+    record(
+        'user_total_credits',
+        "users.total_credits matches the user's credit rows",
+        select(User.user_id)
+            .outerjoin(credit_counts, credit_counts.c.user_id == User.user_id)
+            .where(func.coalesce(User.total_credits, 0) != func.coalesce(credit_counts.c.credits, 0))
+            .order_by(User.user_id),
+        'user_ids'
+    )
+
+    record(
+        'orphan_credits',
+        "every credit belongs to an existing user and drink check",
+        select(Credit.credit_id)
+            .outerjoin(User, User.user_id == Credit.user_id)
+            .outerjoin(DrinkCheck, DrinkCheck.message_id == Credit.message_id)
+            # Credits set with /admin setcredit have no message
+            .where((User.user_id.is_(None)) | (Credit.message_id.is_not(None) & DrinkCheck.message_id.is_(None)))
+            .order_by(Credit.credit_id),
+        'credit_ids'
+    )
+
+    chain_counts = select(DrinkCheck.chain_id, func.count(DrinkCheck.message_id).label('messages')) \
+        .where(DrinkCheck.chain_id.is_not(None)) \
+        .group_by(DrinkCheck.chain_id) \
+        .subquery()
+    record(
+        'chain_total_messages',
+        "active_chains.total_messages matches the chain's drink checks",
+        select(ActiveChain.chain_id)
+            .outerjoin(chain_counts, chain_counts.c.chain_id == ActiveChain.chain_id)
+            .where(func.coalesce(ActiveChain.total_messages, 0) != func.coalesce(chain_counts.c.messages, 0))
+            .order_by(ActiveChain.chain_id),
+        'chain_ids'
+    )
+
+    # One row per record holder beyond the first
+    record_holders = db.query(func.count(ActiveChain.chain_id)).filter_by(is_server_record=True).scalar()
+    results.append({
+        'check': 'single_server_record',
+        'description': "at most one chain is flagged as the server record",
+        'ok': record_holders <= 1,
+        'violations': max(0, record_holders - 1),
+        'sample': {'chain_ids': [chain_id for chain_id, in db.query(ActiveChain.chain_id)
+                                 .filter_by(is_server_record=True)
+                                 .order_by(ActiveChain.chain_id)
+                                 .limit(samples)]} if record_holders > 1 else {},
+    })
+    return results
+
+def print_report(summary: dict, checks: list):
+    print("Tables:")
+    for table_name, count in summary['tables'].items():
+        print(f"- {table_name}: {count} rows")
+
+    users = summary['users']
+    print(f"\nUsers: {users['count']} ({users['with_credits']} with credits), "
+          f"most credits {users['max_credits']}, longest streak {users['longest_streak']}")
+
+    credits = summary['credits']
+    by_type = ', '.join(f"{name}: {count}" for name, count in credits['by_type'].items())
+    print(f"Credits: {credits['count']} ({by_type or 'none'})")
+
+    drink_checks = summary['drink_checks']
+    print(f"Drink checks: {drink_checks['count']} ({drink_checks['replies']} replies), "
+          f"first {drink_checks['first']}, last {drink_checks['last']} (CT)")
+
+    chains = summary['chains']
+    print(f"Chains: {chains['count']}, average length {chains['average_length']}, "
+          f"longest {chains['longest']}, server record chain {chains['server_record_chain_id']}, "
+          f"{chains['expired_but_active']} expired but not yet closed")
+
+    print("\nActive Chains:")
+    for chain in summary['active_chains']:
+        print(f"Chain ID: {chain['chain_id']}, started by {chain['starter_id']} at {chain['start_time']} (CT), "
+              f"{chain['total_messages']} messages, {chain['minutes_until_expiry']} minutes until expiry, "
+              f"expired: {chain['is_expired']}")
+    if not summary['active_chains']:
+        print("None")
+
+    print("\nIntegrity checks:")
+    for check in checks:
+        status = 'OK' if check['ok'] else f"FAIL ({check['violations']})"
+        print(f"- {check['check']}: {status} - {check['description']}")
+        for key, ids in check['sample'].items():
+            print(f"    {key}: {', '.join(str(i) for i in ids)}")
+
+def missing_tables(db) -> list:
+    """Tables the models expect that the database doesn't have"""
+    existing = set(inspect(db.get_bind()).get_table_names())
+    return sorted(name for name in Base.metadata.tables if name not in existing)
+
+def check_tables(args=None):
+    args = args or parse_args()
+    with ReadSession() as db:
+        try:
+            missing = missing_tables(db)
+        except OperationalError as e:
+            # The read-only connection won't create a database file that isn't there
+            print(f"Can't open the database: {e.orig}")
+            return False
+        if missing:
+            if args.json:
+                print(json.dumps({'missing_tables': missing}, indent=2))
             else:
-                minutes_left = 0
-            
-            print(f"Chain ID: {chain.chain_id}")
-            print(f"Started by: {chain.starter_id}")
-            print(f"Start time (CT): {start_time_ct}")
-            print(f"Last activity (CT): {last_activity_ct}")
-            print(f"Minutes until expiry: {minutes_left:.1f}")
-            print(f"Is expired: {chain.is_expired()}")
-            print("---")
+                print(f"Missing tables: {', '.join(missing)}. Run migrate_db.py to create them.")
+            return False
+
+        if args.dump:
+            dump_table(db, DUMP_MODELS[args.dump], args.batch_size)
+            return True
+
+        timeout = timedelta(minutes=args.timeout_minutes) if args.timeout_minutes else None
+        summary = summarize(db, timeout)
+        checks = check_integrity(db, args.samples)
+
+    if args.json:
+        print(json.dumps({'summary': summary, 'checks': checks}, indent=2))
+    else:
+        print_report(summary, checks)
+    return all(check['ok'] for check in checks)
 
 if __name__ == "__main__":
-    check_tables() 
\ No newline at end of file
+    sys.exit(0 if check_tables() else 1)
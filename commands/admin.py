@@ -1,13 +1,53 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-from database.models import User, Credit
+from database.models import User, Credit, DrinkCheck, ActiveChain
 from database.connection import DatabaseSession
+from database.sharding import fan_out, shard_for, shards
+from bot.cache import get_state_cache
+from bot.stats import get_stats_manager
+from bot.metrics import metrics
+from bot.backup import get_backup_manager
+from bot.chain_engine import utc_now
+from bot.event_log import get_event_log
+from bot.shards import prepare_guild
+from bot.guild_config import GuildConfig, PARSERS, MAX_TIMEOUT_MINUTES, get_config_store
+from database.profiler import profiler
+from sqlalchemy import func
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Seconds between progress updates from /admin backup
+BACKUP_PROGRESS_INTERVAL = 2
+# Shards listed by /admin shards, busiest first
+SHARDS_SHOWN = 20
+
+def shard_totals(db):
+    """Users, drink checks, chains and active chains in one database"""
+    return (
+        db.query(func.count(User.user_id)).scalar() or 0,
+        db.query(func.count(DrinkCheck.message_id)).scalar() or 0,
+        db.query(func.count(ActiveChain.chain_id)).scalar() or 0,
+        db.query(func.count(ActiveChain.chain_id)).filter(ActiveChain.is_active.is_(True)).scalar() or 0,
+    )
+
+def describe_config(config: GuildConfig, overrides) -> str:
+    """Settings as shown by /admin config, with per-guild overrides marked"""
+    def mark(key):
+        return " *(server)*" if key in overrides else " *(default)*"
+    channels = ', '.join(f"<#{channel_id}>" for channel_id in sorted(config.tracked_channels)) or "All channels"
+    return (
+        f"**Tracked channels:** {channels}{mark('tracked_channels')}\n"
+        f"**Keywords:** {', '.join(config.keywords)}{mark('keywords')}\n"
+        f"**Chain timeout:** {config.chain_timeout_minutes} minutes{mark('chain_timeout_minutes')}"
+    )
+
 class AdminCommands(commands.GroupCog, group_name="admin"):
+    # /admin config ...
+    config = app_commands.Group(name='config', description="View and change this server's drink check settings")
+
     def __init__(self, bot):
         self.bot = bot
         super().__init__()
@@ -26,6 +66,7 @@ class AdminCommands(commands.GroupCog, group_name="admin"):
         return True
 
     @app_commands.command(name='setcredit', description="Set a user's total credits")
+    @profiler.profiled("/admin setcredit")
     @app_commands.describe(
         user="The user to set credits for",
         amount="Number of credits to set"
@@ -37,7 +78,9 @@ class AdminCommands(commands.GroupCog, group_name="admin"):
             return
 
         try:
-            with DatabaseSession() as db:
+            guild_id = interaction.guild_id
+            await prepare_guild(self.bot, guild_id)
+            with DatabaseSession(guild_id) as db:
                 # Get or create user
                 db_user = db.query(User).filter_by(user_id=user.id).first()
                 if not db_user:
@@ -59,6 +102,13 @@ class AdminCommands(commands.GroupCog, group_name="admin"):
                     db.add(credit)
                 
                 db.commit()
+                event_log = get_event_log(self.bot, shard_for(guild_id))
+                if event_log is not None:
+                    event_log.append_set_credits(user.id, str(user), amount, utc_now())
+                
+                # Totals can go down here, so the cached leaderboard can't be patched in place
+                get_state_cache(self.bot, guild_id).invalidate_leaderboard()
+                get_stats_manager(self.bot, guild_id).invalidate_user(user.id)
                 
                 await interaction.response.send_message(
                     f"✅ Set {user.mention}'s credits to {amount}",
@@ -74,6 +124,173 @@ class AdminCommands(commands.GroupCog, group_name="admin"):
             )
             raise
 
+    @app_commands.command(name='metrics', description="Show message pipeline latency and counters")
+    @app_commands.describe(reset="Clear the collected metrics after showing them")
+    async def show_metrics(self, interaction: discord.Interaction, reset: bool = False):
+        """Show per-stage latency histograms for on_message."""
+        if not await self.owner_check(interaction):
+            return
+
+        summary = metrics.summary()
+        if reset:
+            metrics.reset()
+        # Discord caps messages at 2000 characters
+        await interaction.response.send_message(f"```\n{summary[:1900]}\n```", ephemeral=True)
+
+    @app_commands.command(name='queries', description="Show SQL query counts per command and event")
+    @app_commands.describe(reset="Clear the collected query stats after showing them")
+    async def show_queries(self, interaction: discord.Interaction, reset: bool = False):
+        """Show per-operation query counts from the SQL profiler."""
+        if not await self.owner_check(interaction):
+            return
+
+        summary = profiler.summary()
+        if reset:
+            profiler.reset()
+        await interaction.response.send_message(f"```\n{summary[:1900]}\n```", ephemeral=True)
+
+    @app_commands.command(name='shards', description="Show totals from every server's database")
+    @profiler.profiled("/admin shards")
+    async def show_shards(self, interaction: discord.Interaction):
+        """Totals per database shard, queried in parallel. Covers every server, so it's for the bot's owner only."""
+        if not await self.bot.is_owner(interaction.user):
+            await interaction.response.send_message("❌ Only the bot's owner can see every server's totals.", ephemeral=True)
+            return
+
+        await interaction.response.defer(thinking=True, ephemeral=True)
+        totals = await asyncio.to_thread(fan_out, shard_totals)
+        # Busiest first
+        ranked = sorted(totals.items(), key=lambda item: item[1][1], reverse=True)
+        lines = [f"**{shard}**: {users} users, {checks} drink checks, {chains} chains ({active} active)"
+                 for shard, (users, checks, chains, active) in ranked[:SHARDS_SHOWN]]
+        if len(ranked) > SHARDS_SHOWN:
+            lines.append(f"...and {len(ranked) - SHARDS_SHOWN} more")
+        if shards is None:
+            lines.append("Sharding is off (DB_SHARD_DIR isn't set), every server is in the main database.")
+        else:
+            lines.append(f"{len(shards.open_shards())}/{shards.max_open} shards open, "
+                         f"{shards.opened} opened and {shards.evicted} closed since startup.")
+        await interaction.followup.send("\n".join(lines)[:2000], ephemeral=True)
+
+    @app_commands.command(name='backup', description="Back up the database now")
+    @profiler.profiled("/admin backup")
+    async def backup(self, interaction: discord.Interaction):
+        """Take an online backup, editing the reply with progress until it's done."""
+        if not await self.owner_check(interaction):
+            return
+
+        backups = get_backup_manager(self.bot)
+        if backups is None:
+            await interaction.response.send_message("❌ Backups are only supported for SQLite databases.", ephemeral=True)
+            return
+
+        waiting = backups.running
+        await interaction.response.send_message(
+            "⏳ Waiting for the backup already in progress..." if waiting else "⏳ Starting backup...",
+            ephemeral=True
+        )
+        task = asyncio.create_task(backups.backup())
+        while not task.done():
+            await asyncio.wait({task}, timeout=BACKUP_PROGRESS_INTERVAL)
+            copied, total = backups.progress
+            if not task.done() and total:
+                await interaction.edit_original_response(content=f"⏳ Backing up... {copied * 100 // total}% ({copied}/{total} pages)")
+
+        try:
+            result = task.result()
+        except Exception as e:
+            logger.error(f"Backup requested by {interaction.user} failed: {e}", exc_info=True)
+            await interaction.edit_original_response(content=f"❌ Backup failed: {e}")
+            return
+        logger.info(f"Admin {interaction.user} backed up the database to {result.path}")
+        shards = ""
+        if backups.shards is not None:
+            shards = f" Also backed up {result.shards} shards"
+            shards += f", {result.shard_failures} failed (see the logs)." if result.shard_failures else "."
+        await interaction.edit_original_response(
+            content=f"✅ Backed up {result.pages} pages to `{result.path}` "
+                    f"({result.size / 1024 / 1024:.1f} MiB, {result.seconds:.1f}s). Keeping the newest {backups.keep}.{shards}"
+        )
+
+    async def _update_config(self, interaction: discord.Interaction, changes: dict = None, reset: list = None):
+        """Apply a settings change (in a worker thread, it writes to the DB) and show the result"""
+        store = get_config_store(self.bot)
+        try:
+            if reset:
+                config = await asyncio.to_thread(store.reset, interaction.guild.id, reset)
+            else:
+                config = await asyncio.to_thread(store.update, interaction.guild.id, changes, interaction.user.id)
+        except ValueError as e:
+            await interaction.response.send_message(f"❌ {e}", ephemeral=True)
+            return
+        logger.info(f"Admin {interaction.user} changed settings for guild {interaction.guild.id}: {changes or reset}")
+        await interaction.response.send_message(
+            f"✅ Settings updated\n{describe_config(config, store.overrides(interaction.guild.id))}",
+            ephemeral=True
+        )
+
+    @config.command(name='show', description="Show this server's settings")
+    async def config_show(self, interaction: discord.Interaction):
+        if not await self.owner_check(interaction):
+            return
+        store = get_config_store(self.bot)
+        config = store.get(interaction.guild.id)
+        await interaction.response.send_message(
+            describe_config(config, store.overrides(interaction.guild.id)), ephemeral=True
+        )
+
+    @config.command(name='channels', description="Add or remove a tracked channel")
+    @app_commands.describe(action="What to do with the channel", channel="The channel (not needed for clear)")
+    @app_commands.choices(action=[
+        app_commands.Choice(name="add", value="add"),
+        app_commands.Choice(name="remove", value="remove"),
+        app_commands.Choice(name="clear (track all channels)", value="clear"),
+    ])
+    async def config_channels(self, interaction: discord.Interaction, action: app_commands.Choice[str],
+                              channel: discord.TextChannel = None):
+        if not await self.owner_check(interaction):
+            return
+        channels = set(get_config_store(self.bot).get(interaction.guild.id).tracked_channels)
+        if action.value == 'clear':
+            channels = set()
+        elif channel is None:
+            await interaction.response.send_message("❌ Pick a channel to add or remove.", ephemeral=True)
+            return
+        elif action.value == 'add':
+            channels.add(channel.id)
+        else:
+            channels.discard(channel.id)
+        await self._update_config(interaction, {'tracked_channels': channels})
+
+    @config.command(name='keywords', description="Set the words that start a chain")
+    @app_commands.describe(keywords="Comma-separated, e.g. \"drink check, dc\"")
+    async def config_keywords(self, interaction: discord.Interaction, keywords: str):
+        if not await self.owner_check(interaction):
+            return
+        await self._update_config(interaction, {'keywords': keywords.split(',')})
+
+    @config.command(name='timeout', description="Set how long a chain lasts without a drink check")
+    @app_commands.describe(minutes="Minutes of inactivity before a chain ends")
+    async def config_timeout(self, interaction: discord.Interaction,
+                             minutes: app_commands.Range[int, 1, MAX_TIMEOUT_MINUTES]):
+        if not await self.owner_check(interaction):
+            return
+        await self._update_config(interaction, {'chain_timeout_minutes': minutes})
+
+    @config.command(name='reset', description="Go back to the default for a setting")
+    @app_commands.choices(setting=[app_commands.Choice(name=key, value=key) for key in PARSERS])
+    async def config_reset(self, interaction: discord.Interaction, setting: app_commands.Choice[str]):
+        if not await self.owner_check(interaction):
+            return
+        await self._update_config(interaction, reset=[setting.value])
+
+    @config.command(name='reload', description="Reload every server's settings from the database")
+    async def config_reload(self, interaction: discord.Interaction):
+        if not await self.owner_check(interaction):
+            return
+        count = await asyncio.to_thread(get_config_store(self.bot).load)
+        await interaction.response.send_message(f"✅ Reloaded settings ({count} servers with overrides)", ephemeral=True)
+
 async def setup(bot):
     await bot.add_cog(AdminCommands(bot))
     return True 
\ No newline at end of file
@@ -3,9 +3,9 @@ import discord
 from discord.ext import commands
 from discord import app_commands
 import logging
+from bot.guild_config import get_config_store
 
 # Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class HelpCommands(commands.Cog):
@@ -16,6 +16,7 @@ class HelpCommands(commands.Cog):
     async def help(self, interaction: discord.Interaction):
         """Display help information for all non-admin commands"""
         try:
+            timeout = get_config_store(self.bot).get(interaction.guild_id).chain_timeout_minutes
             embed = discord.Embed(
                 title="🍺 Drink Check Bot Commands",
                 description="Here are all the available commands you can use!",
@@ -44,6 +45,13 @@ class HelpCommands(commands.Cog):
                 inline=False
             )
 
+            # Recent Command
+            embed.add_field(
+                name="/recent [count]",
+                value="See the latest drink checks: who, when (CT) and which chain",
+                inline=False
+            )
+
             # Timer Command
             embed.add_field(
                 name="/timer",
@@ -51,7 +59,7 @@ class HelpCommands(commands.Cog):
                 "• Time remaining in the current chain\n"
                 "• Who started the chain\n"
                 "• Last person to participate\n"
-                "• Chain starts expire after 30 minutes of inactivity",
+                f"• Chain starts expire after {timeout} minutes of inactivity",
                 inline=False
             )
 
@@ -60,7 +68,7 @@ class HelpCommands(commands.Cog):
                 name="Starting a Chain",
                 value="To start or join a drink check chain:\n"
                 "• Type 'drink check' in any tracked channel\n"
-                "• Chains last for 30 minutes after the last drink check\n"
+                f"• Chains last for {timeout} minutes after the last drink check\n"
                 "• Anyone can join an active chain by saying 'drink check'\n"
                 "• Replying to your own active chain will not reset the timer",
                 inline=False
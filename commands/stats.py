@@ -2,23 +2,26 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-from database.models import User, DrinkCheck, Credit, ActiveChain
-from database.connection import DatabaseSession
-from sqlalchemy import func, text
-from datetime import datetime, timedelta
+from database.models import chain_is_expired
+from database.profiler import profiler
+from bot.cache import LeaderboardEntry
+from bot.chain_engine import ChainState, normalize_timestamp
+from bot.stats import StatsManager, get_stats_manager
+from bot.deferred import CommandTimeout, get_command_runner
+from bot.guild_config import get_config_store
+from datetime import datetime
 import pytz
 import logging
 from typing import List, Optional
 
 # Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Set up Central timezone
 central = pytz.timezone('America/Chicago')
 
 class LeaderboardView(discord.ui.View):
-    def __init__(self, users: List[User], server_record: Optional[ActiveChain], starter_name: Optional[str]):
+    def __init__(self, users: List[LeaderboardEntry], server_record: Optional[ChainState], starter_name: Optional[str]):
         super().__init__(timeout=None)  # No timeout to keep buttons always active
         self.users = users
         self.server_record = server_record
@@ -82,8 +85,8 @@ class LeaderboardView(discord.ui.View):
         
         await interaction.response.edit_message(embed=self.get_embed(), view=self)
 
-    async def start(self, interaction: discord.Interaction):
-        """Initial setup of the view"""
+    async def start(self, interaction: discord.Interaction, send=None):
+        """Initial setup of the view. ``send`` replaces the initial response (e.g. a followup)"""
         # Set initial button states
         prev_button = [x for x in self.children if x.label == "Previous"][0]
         next_button = [x for x in self.children if x.label == "Next"][0]
@@ -91,235 +94,231 @@ class LeaderboardView(discord.ui.View):
         prev_button.disabled = self.current_page == 0
         next_button.disabled = self.max_pages == 0
         
-        await interaction.response.send_message(embed=self.get_embed(), view=self)
+        send = send or interaction.response.send_message
+        await send(embed=self.get_embed(), view=self)
 
 class StatsCommands(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        # Every stat below is read through a StatsManager, the guild's one if it has a database shard
+        self.stats = get_stats_manager(bot)
+        # Chain timeout per guild
+        self.config = get_config_store(bot)
+        # Heavy commands are deferred and their queries shared between identical requests
+        self.runner = get_command_runner(bot)
         
+    @profiler.profiled("warm_up")
+    async def warm_up(self):
+        """Load the top of the leaderboard and the recent drink checks before the first command"""
+        await self.stats.warm_up()
+        logger.info(f"Warmed leaderboard with {len(self.stats.cache.leaderboard)} users "
+                    f"and {len(self.stats.recent)} recent drink checks")
+
+    def _stats_for(self, interaction: discord.Interaction) -> StatsManager:
+        return get_stats_manager(self.bot, interaction.guild_id)
+
     @app_commands.command(name="test", description="Test command to verify slash commands work")
     async def test(self, interaction: discord.Interaction):
         """Simple test command"""
         await interaction.response.send_message("Test command works! Slash commands are functioning.", ephemeral=True)
         
     @app_commands.command(name="profile", description="View your drink check profile")
+    @profiler.profiled("/profile")
     async def profile(self, interaction: discord.Interaction, user: discord.Member = None):
         """View detailed drink check profile for a user"""
         try:
             target_user = user or interaction.user
             logger.info(f"Getting profile for user: {target_user.name}")
             
-            with DatabaseSession() as db:
-                # Get user data
-                db_user = db.query(User).filter_by(user_id=target_user.id).first()
-                if not db_user:
-                    logger.info(f"No profile found for user: {target_user.name}")
-                    await interaction.response.send_message(f"{target_user.name} hasn't participated in any drink checks yet!", ephemeral=True)
-                    return
-
-                logger.info(f"Found user profile with {db_user.total_credits} total credits")
-
-                # Get total drink check count (no distinction between types)
-                total_dcs = db.query(func.count(Credit.credit_id))\
-                    .filter_by(user_id=target_user.id)\
-                    .scalar() or 0
-
-                # Get current time in Central Time
-                now = datetime.utcnow().replace(tzinfo=pytz.UTC).astimezone(central)
-                today = now.date()
-                yesterday = today - timedelta(days=1)
-                
-                # Create datetime ranges in Central Time
-                today_start = central.localize(datetime.combine(today, datetime.min.time()))
-                today_end = central.localize(datetime.combine(today, datetime.max.time()))
-                yesterday_start = central.localize(datetime.combine(yesterday, datetime.min.time()))
-                yesterday_end = central.localize(datetime.combine(yesterday, datetime.max.time()))
-                
-                # Convert to UTC for database queries
-                today_start_utc = today_start.astimezone(pytz.UTC)
-                today_end_utc = today_end.astimezone(pytz.UTC)
-                yesterday_start_utc = yesterday_start.astimezone(pytz.UTC)
-                yesterday_end_utc = yesterday_end.astimezone(pytz.UTC)
-                
-                # Get today's and yesterday's stats
-                today_dcs = db.query(func.count(Credit.credit_id))\
-                    .filter(Credit.user_id == target_user.id,
-                           Credit.timestamp >= today_start_utc,
-                           Credit.timestamp <= today_end_utc)\
-                    .scalar() or 0
+            manager = self._stats_for(interaction)
+            stats = await self.runner.run(interaction, ('profile', interaction.guild_id, target_user.id),
+                                          manager.get_user_stats, target_user.id)
+            if not stats:
+                logger.info(f"No profile found for user: {target_user.name}")
+                # Public, like the profile would have been; the command was deferred publicly
+                await self.runner.send(interaction, f"{target_user.name} hasn't participated in any drink checks yet!")
+                return
 
-                yesterday_dcs = db.query(func.count(Credit.credit_id))\
-                    .filter(Credit.user_id == target_user.id,
-                           Credit.timestamp >= yesterday_start_utc,
-                           Credit.timestamp <= yesterday_end_utc)\
-                    .scalar() or 0
+            logger.info(f"Found user profile with {stats.total_drink_checks} total drink checks")
 
-                # Get most active day
-                daily_counts = db.query(
-                    func.strftime('%Y-%m-%d', Credit.timestamp).label('date'),
-                    func.count(Credit.credit_id).label('count')
-                ).filter(
-                    Credit.user_id == target_user.id
-                ).group_by(
-                    func.strftime('%Y-%m-%d', Credit.timestamp)
-                ).order_by(
-                    text('count DESC')
-                ).first()
+            # Create embed
+            embed = discord.Embed(
+                title=f"🍺 Drink Check Profile: {target_user.name}",
+                color=discord.Color.dark_theme()
+            )
+            
+            # Add main stats with emojis
+            embed.add_field(
+                name="Total Drink Checks",
+                value=f"🍺 {stats.total_drink_checks}",
+                inline=False
+            )
+            
+            # Add today's and yesterday's stats
+            embed.add_field(
+                name="Today's Drink Checks (CT)",
+                value=f"📅 {stats.today}",
+                inline=True
+            )
+            embed.add_field(
+                name="Yesterday's Drink Checks (CT)",
+                value=f"📅 {stats.yesterday}",
+                inline=True
+            )
 
-                # Create embed
-                embed = discord.Embed(
-                    title=f"🍺 Drink Check Profile: {target_user.name}",
-                    color=discord.Color.dark_theme()
-                )
-                
-                # Add main stats with emojis
+            # Add most active day if available
+            if stats.most_active_count > 0:
                 embed.add_field(
-                    name="Total Drink Checks",
-                    value=f"🍺 {total_dcs}",
+                    name="Most Active Day (CT)",
+                    value=f"🏆 {stats.most_active_count} checks on {stats.most_active_day}",
                     inline=False
                 )
-                
-                # Add today's and yesterday's stats
-                embed.add_field(
-                    name="Today's Drink Checks (CT)",
-                    value=f"📅 {today_dcs}",
-                    inline=True
-                )
-                embed.add_field(
-                    name="Yesterday's Drink Checks (CT)",
-                    value=f"📅 {yesterday_dcs}",
-                    inline=True
-                )
-
-                # Add most active day if available
-                if daily_counts and daily_counts.count > 0:
-                    embed.add_field(
-                        name="Most Active Day (CT)",
-                        value=f"🏆 {daily_counts.count} checks on {daily_counts.date}",
-                        inline=False
-                    )
-
 
-
-                # Add user avatar
-                embed.set_thumbnail(url=target_user.display_avatar.url)
-                
-                await interaction.response.send_message(embed=embed)
+            # Add user avatar
+            embed.set_thumbnail(url=target_user.display_avatar.url)
+            
+            await self.runner.send(interaction, embed=embed)
                 
+        except CommandTimeout:
+            return
         except Exception as e:
             logger.error(f"Error in profile command: {e}")
-            await interaction.response.send_message("Error getting profile information.", ephemeral=True)
+            await self.runner.send(interaction, "Error getting profile information.", ephemeral=True)
             raise
     
     @app_commands.command(name="leaderboard", description="View the drink check leaderboard")
+    @profiler.profiled("/leaderboard")
     async def leaderboard(self, interaction: discord.Interaction):
         """Display the drink check leaderboard"""
         try:
             logger.info("Fetching leaderboard data")
-            with DatabaseSession() as db:
-                # Get all users ordered by total credits
-                users = db.query(User)\
-                    .order_by(User.total_credits.desc())\
-                    .all()
-                
-                if not users:
-                    await interaction.response.send_message("No leaderboard data available yet!", ephemeral=True)
-                    return
+            # Top users ordered by total credits (kept warm by the message handler),
+            # the server record and its starter's username
+            users, server_record, starter_name = await self.runner.run(
+                interaction, ('leaderboard', interaction.guild_id), self._leaderboard_data, self._stats_for(interaction)
+            )
+            
+            if not users:
+                await self.runner.send(interaction, "No leaderboard data available yet!")
+                return
+
+            # Create and start the view; every caller gets their own pages
+            view = LeaderboardView(users, server_record, starter_name)
+            await view.start(interaction, lambda **kwargs: self.runner.send(interaction, **kwargs))
+
+        except CommandTimeout:
+            return
+        except Exception as e:
+            logger.error(f"Error in leaderboard command: {e}")
+            await self.runner.send(interaction, "Error fetching leaderboard data.", ephemeral=True)
+            raise
 
-                # Get server record
-                server_record = db.query(ActiveChain)\
-                    .filter_by(is_server_record=True)\
-                    .first()
+    @staticmethod
+    async def _leaderboard_data(manager: StatsManager):
+        users = await manager.get_leaderboard('credits')
+        if not users:
+            return users, None, None
+        server_record, starter_name = await manager.get_server_record()
+        return users, server_record, starter_name
 
-                # Get the starter's username if server record exists
-                starter_name = "Unknown"
-                if server_record:
-                    starter = db.query(User).filter_by(user_id=server_record.starter_id).first()
-                    starter_name = starter.username if starter else "Unknown"
+    @app_commands.command(name="recent", description="View the latest drink checks")
+    @profiler.profiled("/recent")
+    @app_commands.describe(count="How many drink checks to show (up to 25)")
+    async def recent(self, interaction: discord.Interaction, count: app_commands.Range[int, 1, 25] = 10):
+        """Show the most recent drink checks. Served from memory once the guild's shard has been read"""
+        try:
+            activity = await self._stats_for(interaction).get_recent_activity(count)
+            if not activity:
+                await interaction.response.send_message("🍺 No drink checks yet! Start a chain with a drink check.", ephemeral=True)
+                return
+
+            lines = []
+            for entry in activity:
+                time_ct = normalize_timestamp(entry.timestamp).astimezone(central)
+                action = "started a chain" if entry.credit_type == 'initial' else "joined the chain"
+                lines.append(f"`{time_ct.strftime('%I:%M %p')}` 🍺 **{entry.username}** {action} (#{entry.chain_id})")
 
-                # Create and start the view
-                view = LeaderboardView(users, server_record, starter_name)
-                await view.start(interaction)
+            embed = discord.Embed(
+                title="🕒 Recent Drink Checks",
+                description="\n".join(lines),
+                color=discord.Color.blue()
+            )
+            embed.set_footer(text="Times shown in Central Time")
+            await interaction.response.send_message(embed=embed)
 
         except Exception as e:
-            logger.error(f"Error in leaderboard command: {e}")
-            await interaction.response.send_message("Error fetching leaderboard data.", ephemeral=True)
+            logger.error(f"Error in recent command: {e}")
+            await interaction.response.send_message("Error fetching recent drink checks.", ephemeral=True)
             raise
 
     @app_commands.command(name="timer", description="Check how much time is left in the current drink check chain")
+    @profiler.profiled("/timer")
     async def timer(self, interaction: discord.Interaction):
         """Check the status of the current chain and how much time is left"""
         try:
             logger.info("Checking chain timer")
-            with DatabaseSession() as db:
-                # Get active chain
-                active_chain = db.query(ActiveChain)\
-                    .filter_by(is_active=True)\
-                    .order_by(ActiveChain.start_time.desc())\
-                    .first()
-                
-                if not active_chain:
-                    await interaction.response.send_message("🕒 No active chain right now! Start one with a drink check.", ephemeral=True)
-                    return
-                
-                # Get current time in UTC since our timestamps are in UTC
-                now = datetime.utcnow().replace(tzinfo=pytz.UTC)
-                
-                # Convert chain timestamps to Central Time for display
-                start_time_ct = active_chain.start_time.astimezone(central)
-                last_activity_ct = active_chain.last_activity.astimezone(central)
-                
-                # Calculate time difference
-                last_activity_utc = active_chain.last_activity.replace(tzinfo=pytz.UTC)
-                time_diff = now - last_activity_utc
-                minutes_left = 30 - (time_diff.total_seconds() / 60)
-                
-                # Get starter's username
-                starter = db.query(User).filter_by(user_id=active_chain.starter_id).first()
-                starter_name = starter.username if starter else "Unknown"
-                
-                # Get last message author's username
-                last_author = db.query(User).filter_by(user_id=active_chain.last_message_author_id).first()
-                last_author_name = last_author.username if last_author else "Unknown"
-                
-                # Create embed
-                embed = discord.Embed(
-                    title="⏱️ Chain Timer Status",
-                    color=discord.Color.blue() if minutes_left > 5 else discord.Color.red()
-                )
-                
-                # Add chain info
-                embed.add_field(
-                    name="Chain Starter",
-                    value=f"👑 {starter_name}",
-                    inline=True
-                )
-                
-                embed.add_field(
-                    name="Last Activity By",
-                    value=f"🎯 {last_author_name}",
-                    inline=True
-                )
-                
-                embed.add_field(
-                    name="Time Left",
-                    value=f"⏰ {minutes_left:.1f} minutes" if minutes_left > 0 else "⚠️ Chain expired!",
-                    inline=False
-                )
-                
-                embed.add_field(
-                    name="Chain Started (CT)",
-                    value=f"📅 {start_time_ct.strftime('%I:%M:%S %p')}",
-                    inline=True
-                )
-                
-                embed.add_field(
-                    name="Last Activity (CT)",
-                    value=f"📅 {last_activity_ct.strftime('%I:%M:%S %p')}",
-                    inline=True
-                )
-                
-                await interaction.response.send_message(embed=embed)
+            # Get active chain
+            manager = self._stats_for(interaction)
+            active_chain, _ = await manager.get_current_chain()
+            
+            if not active_chain:
+                await interaction.response.send_message("🕒 No active chain right now! Start one with a drink check.", ephemeral=True)
+                return
+            
+            # Get current time in UTC since our timestamps are in UTC
+            now = datetime.utcnow().replace(tzinfo=pytz.UTC)
+            
+            # Convert chain timestamps to Central Time for display
+            start_time_ct = normalize_timestamp(active_chain.start_time).astimezone(central)
+            last_activity_ct = normalize_timestamp(active_chain.last_activity).astimezone(central)
+            
+            # Calculate time difference
+            timeout = self.config.get(interaction.guild_id).timeout
+            time_diff = now - normalize_timestamp(active_chain.last_activity)
+            minutes_left = (timeout - time_diff).total_seconds() / 60
+            
+            # Get starter's and last message author's usernames
+            starter_name = await manager.get_username(active_chain.starter_id)
+            last_author_name = await manager.get_username(active_chain.last_message_author_id)
+            
+            # Create embed
+            embed = discord.Embed(
+                title="⏱️ Chain Timer Status",
+                color=discord.Color.blue() if minutes_left > 5 else discord.Color.red()
+            )
+            
+            # Add chain info
+            embed.add_field(
+                name="Chain Starter",
+                value=f"👑 {starter_name}",
+                inline=True
+            )
+            
+            embed.add_field(
+                name="Last Activity By",
+                value=f"🎯 {last_author_name}",
+                inline=True
+            )
+            
+            embed.add_field(
+                name="Time Left",
+                value=f"⏰ {minutes_left:.1f} minutes" if minutes_left > 0 else "⚠️ Chain expired!",
+                inline=False
+            )
+            
+            embed.add_field(
+                name="Chain Started (CT)",
+                value=f"📅 {start_time_ct.strftime('%I:%M:%S %p')}",
+                inline=True
+            )
+            
+            embed.add_field(
+                name="Last Activity (CT)",
+                value=f"📅 {last_activity_ct.strftime('%I:%M:%S %p')}",
+                inline=True
+            )
+            
+            await interaction.response.send_message(embed=embed)
                 
         except Exception as e:
             logger.error(f"Error in timer command: {e}")
@@ -327,125 +326,120 @@ class StatsCommands(commands.Cog):
             raise
 
     @app_commands.command(name="chain", description="Display information about the current drink check chain")
+    @profiler.profiled("/chain")
     async def chain(self, interaction: discord.Interaction):
         """Display detailed information about the current drink check chain"""
         try:
             logger.info("Fetching chain information")
-            with DatabaseSession() as db:
-                # Get the most recent chain (active or inactive)
-                current_chain = db.query(ActiveChain)\
-                    .order_by(ActiveChain.start_time.desc())\
-                    .first()
-                
-                if not current_chain:
-                    await interaction.response.send_message("🔗 No chains have been started yet! Start one with a drink check.", ephemeral=True)
-                    return
-                
-                # Get current time in UTC since our timestamps are in UTC
-                now = datetime.utcnow().replace(tzinfo=pytz.UTC)
-                
-                # Check if chain is expired
-                is_expired = current_chain.is_expired()
-                
-                # Convert chain timestamps to Central Time for display
-                start_time_ct = current_chain.start_time.astimezone(central)
-                last_activity_ct = current_chain.last_activity.astimezone(central)
-                
-                # Get starter's username
-                starter = db.query(User).filter_by(user_id=current_chain.starter_id).first()
-                starter_name = starter.username if starter else "Unknown"
-                
-                # Get last message author's username
-                last_author = db.query(User).filter_by(user_id=current_chain.last_message_author_id).first()
-                last_author_name = last_author.username if last_author else "Unknown"
-                
-                # Determine chain status and color
-                if current_chain.is_active and not is_expired:
-                    status = "🟢 Active"
-                    color = discord.Color.green()
-                elif current_chain.is_active and is_expired:
-                    status = "🟡 Expired (but not yet closed)"
-                    color = discord.Color.yellow()
-                else:
-                    status = "🔴 Closed"
-                    color = discord.Color.red()
-                
-                # Create embed
-                embed = discord.Embed(
-                    title="🔗 Current Chain Status",
-                    color=color
-                )
+            # Get the most recent chain (active or inactive)
+            manager = self._stats_for(interaction)
+            current_chain, is_active = await manager.get_current_chain(active_only=False)
+            
+            if not current_chain:
+                await interaction.response.send_message("🔗 No chains have been started yet! Start one with a drink check.", ephemeral=True)
+                return
+            
+            # Get current time in UTC since our timestamps are in UTC
+            now = datetime.utcnow().replace(tzinfo=pytz.UTC)
+            
+            # Check if chain is expired
+            timeout = self.config.get(interaction.guild_id).timeout
+            is_expired = chain_is_expired(current_chain.last_activity, now, timeout)
+            
+            # Convert chain timestamps to Central Time for display
+            start_time_ct = normalize_timestamp(current_chain.start_time).astimezone(central)
+            last_activity_ct = normalize_timestamp(current_chain.last_activity).astimezone(central)
+            
+            # Get starter's and last participant's usernames
+            starter_name = await manager.get_username(current_chain.starter_id)
+            last_author_name = await manager.get_username(current_chain.last_message_author_id)
+            
+            # Determine chain status and color
+            if is_active and not is_expired:
+                status = "🟢 Active"
+                color = discord.Color.green()
+            elif is_active and is_expired:
+                status = "🟡 Expired (but not yet closed)"
+                color = discord.Color.yellow()
+            else:
+                status = "🔴 Closed"
+                color = discord.Color.red()
+            
+            # Create embed
+            embed = discord.Embed(
+                title="🔗 Current Chain Status",
+                color=color
+            )
+            
+            # Add main chain info
+            embed.add_field(
+                name="Chain Length",
+                value=f"🍺 {current_chain.total_messages} drink checks",
+                inline=False
+            )
+            
+            embed.add_field(
+                name="Chain Starter",
+                value=f"👑 {starter_name}",
+                inline=True
+            )
+            
+            embed.add_field(
+                name="Last Participant",
+                value=f"🎯 {last_author_name}",
+                inline=True
+            )
+            
+            embed.add_field(
+                name="Status",
+                value=status,
+                inline=False
+            )
+            
+            # Add timing information
+            embed.add_field(
+                name="Started (CT)",
+                value=f"📅 {start_time_ct.strftime('%m/%d/%Y at %I:%M:%S %p')}",
+                inline=True
+            )
+            
+            embed.add_field(
+                name="Last Activity (CT)",
+                value=f"📅 {last_activity_ct.strftime('%m/%d/%Y at %I:%M:%S %p')}",
+                inline=True
+            )
+            
+            # Add time remaining if active
+            if is_active and not is_expired:
+                time_diff = now - normalize_timestamp(current_chain.last_activity)
+                minutes_left = (timeout - time_diff).total_seconds() / 60
                 
-                # Add main chain info
                 embed.add_field(
-                    name="Chain Length",
-                    value=f"🍺 {current_chain.total_messages} drink checks",
+                    name="Time Remaining",
+                    value=f"⏰ {minutes_left:.1f} minutes",
                     inline=False
                 )
-                
-                embed.add_field(
-                    name="Chain Starter",
-                    value=f"👑 {starter_name}",
-                    inline=True
-                )
-                
-                embed.add_field(
-                    name="Last Participant",
-                    value=f"🎯 {last_author_name}",
-                    inline=True
-                )
-                
+            
+            # Add server record indicator if applicable
+            if current_chain.is_server_record:
                 embed.add_field(
-                    name="Status",
-                    value=status,
+                    name="🏆 Server Record",
+                    value="This chain set a new server record!",
                     inline=False
                 )
-                
-                # Add timing information
-                embed.add_field(
-                    name="Started (CT)",
-                    value=f"📅 {start_time_ct.strftime('%m/%d/%Y at %I:%M:%S %p')}",
-                    inline=True
-                )
-                
-                embed.add_field(
-                    name="Last Activity (CT)",
-                    value=f"📅 {last_activity_ct.strftime('%m/%d/%Y at %I:%M:%S %p')}",
-                    inline=True
-                )
-                
-                # Add time remaining if active
-                if current_chain.is_active and not is_expired:
-                    last_activity_utc = current_chain.last_activity.replace(tzinfo=pytz.UTC)
-                    time_diff = now - last_activity_utc
-                    minutes_left = 30 - (time_diff.total_seconds() / 60)
-                    
-                    embed.add_field(
-                        name="Time Remaining",
-                        value=f"⏰ {minutes_left:.1f} minutes",
-                        inline=False
-                    )
-                
-                # Add server record indicator if applicable
-                if current_chain.is_server_record:
-                    embed.add_field(
-                        name="🏆 Server Record",
-                        value="This chain set a new server record!",
-                        inline=False
-                    )
-                
-                # Calculate chain duration
-                # duration = current_chain.last_activity - current_chain.start_time
-                # hours = int(duration.total_seconds() // 3600)
-                # minutes = int((duration.total_seconds() % 3600) // 60)
-                
-                # embed.add_field(
-                #     name="Chain Duration",
-                #     value=f"⏱️ {hours}h {minutes}m",
-                #     inline=True
-                # )
-                
-                await interaction.response.send_message(embed=embed)
+            
+            # Calculate chain duration
+            # duration = current_chain.last_activity - current_chain.start_time
+            # hours = int(duration.total_seconds() // 3600)
+            # minutes = int((duration.total_seconds() % 3600) // 60)
+            
+            # embed.add_field(
+            #     name="Chain Duration",
+            #     value=f"⏱️ {hours}h {minutes}m",
+            #     inline=True
+            # )
+            
+            await interaction.response.send_message(embed=embed)
                 
         except Exception as e:
             logger.error(f"Error in chain command: {e}")
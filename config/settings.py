@@ -6,9 +6,8 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # Discord Bot Configuration
+# Checked when the bot is started rather than at import, so tools and cogs can import settings without one
 DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
-if not DISCORD_TOKEN:
-    raise ValueError("DISCORD_TOKEN not found in environment variables. Please set it in your .env file.")
 
 # Database Configuration
 DATABASE_PATH = os.getenv('DATABASE_PATH', 'drink_check_bot.db')
@@ -21,6 +20,116 @@ BOT_PREFIX = os.getenv('BOT_PREFIX', '!')
 TRACKED_CHANNELS_STR = os.getenv('TRACKED_CHANNELS', '')
 TRACKED_CHANNELS = [int(channel_id.strip()) for channel_id in TRACKED_CHANNELS_STR.split(',') if channel_id.strip()]
 
+# Slash command syncing
+# Hash of the last synced command tree is stored here so restarts skip unchanged syncs
+COMMAND_SYNC_STATE_PATH = os.getenv('COMMAND_SYNC_STATE_PATH', '.command_sync.json')
+# Optional guild to sync commands to directly (instant updates while developing)
+COMMAND_SYNC_GUILD_ID = int(os.getenv('COMMAND_SYNC_GUILD_ID')) if os.getenv('COMMAND_SYNC_GUILD_ID') else None
+# Set to 1 to sync even when the command tree hash is unchanged
+FORCE_COMMAND_SYNC = os.getenv('FORCE_COMMAND_SYNC', '0') == '1'
+
+# Metrics
+# Per-stage latency histograms for the message pipeline, shown by /admin metrics
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+# Serve Prometheus text format on this local port if set
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT')) if os.getenv('METRICS_PORT') else None
+
+# SQL query profiling
+QUERY_PROFILER_ENABLED = os.getenv('QUERY_PROFILER_ENABLED', '1') == '1'
+# Statements slower than this are logged together with their query plan
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '100'))
+# A SELECT repeated this many times in one command or event is flagged as N+1
+N_PLUS_ONE_THRESHOLD = int(os.getenv('N_PLUS_ONE_THRESHOLD', '5'))
+
+# Traffic recording
+# If set, every message seen by on_message is logged here for replay_traffic.py (.gz to compress)
+TRAFFIC_LOG_PATH = os.getenv('TRAFFIC_LOG_PATH') or None
+
+# Background Discord calls (reactions and chain notices)
+DISPATCH_CONCURRENCY = int(os.getenv('DISPATCH_CONCURRENCY', '4'))
+# Calls beyond this many waiting are dropped rather than queued
+DISPATCH_MAX_PENDING = int(os.getenv('DISPATCH_MAX_PENDING', '1000'))
+DISPATCH_RETRIES = int(os.getenv('DISPATCH_RETRIES', '3'))
+# How long shutdown waits for pending calls
+SHUTDOWN_DRAIN_SECONDS = float(os.getenv('SHUTDOWN_DRAIN_SECONDS', '10'))
+
+# Reply lookups
+# Drink checks stored within this many hours are matched in memory
+MESSAGE_INDEX_MAX_AGE_HOURS = float(os.getenv('MESSAGE_INDEX_MAX_AGE_HOURS', '24'))
+MESSAGE_INDEX_MAX_SIZE = int(os.getenv('MESSAGE_INDEX_MAX_SIZE', '50000'))
+# Bloom filter over every drink check, so reply lookups (DrinkCheckTracker) for other messages skip the
+# database. Building it reads every drink check id at startup, and the chain rules don't look up replies,
+# so it's off by default; with it off, replies_total counts older replies as 'unknown'
+BLOOM_FILTER_ENABLED = os.getenv('BLOOM_FILTER_ENABLED', '0').lower() in ('1', 'true', 'yes')
+BLOOM_FILTER_CAPACITY = int(os.getenv('BLOOM_FILTER_CAPACITY', '1000000'))
+BLOOM_FILTER_ERROR_RATE = float(os.getenv('BLOOM_FILTER_ERROR_RATE', '0.01'))
+
+# Stats commands
+# Per-user stats and the streak leaderboard are cached this long between writes
+STATS_CACHE_TTL_SECONDS = float(os.getenv('STATS_CACHE_TTL_SECONDS', '60'))
+# Drink checks kept in memory for /recent
+RECENT_ACTIVITY_SIZE = int(os.getenv('RECENT_ACTIVITY_SIZE', '50'))
+# Threads for the stats queries (matches the read-only connection pool by default)
+STATS_QUERY_WORKERS = int(os.getenv('STATS_QUERY_WORKERS', os.getenv('DB_READ_POOL_SIZE', '4')))
+# Display names kept in memory (looked up from the database, or Discord for unknown users)
+NAME_CACHE_SIZE = int(os.getenv('NAME_CACHE_SIZE', '1000'))
+# /profile and /leaderboard are deferred, then give up with an apology after this long
+COMMAND_TIMEOUT_SECONDS = float(os.getenv('COMMAND_TIMEOUT_SECONDS', '10'))
+
+# Flood guard
+# Each user may post RATE_LIMIT_BURST messages with attachments per channel at once,
+# then RATE_LIMIT_PER_MINUTE a minute; the rest are ignored before any database work
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', '1').lower() in ('1', 'true', 'yes')
+RATE_LIMIT_BURST = int(os.getenv('RATE_LIMIT_BURST', '5'))
+RATE_LIMIT_PER_MINUTE = float(os.getenv('RATE_LIMIT_PER_MINUTE', '10'))
+
+# Duplicate photo detection
+# Reject drink checks whose photos were all used before (needs Pillow). Off by default:
+# every image attachment on a drink check is downloaded (up to PHOTO_MAX_BYTES) to hash it
+PHOTO_DEDUP_ENABLED = os.getenv('PHOTO_DEDUP_ENABLED', '0').lower() in ('1', 'true', 'yes')
+# Photos whose perceptual hashes differ in at most this many of 64 bits count as the same
+PHOTO_HASH_DISTANCE = int(os.getenv('PHOTO_HASH_DISTANCE', '6'))
+# Larger attachments aren't downloaded or checked
+PHOTO_MAX_BYTES = int(os.getenv('PHOTO_MAX_BYTES', str(25 * 1024 * 1024)))
+PHOTO_FETCH_CONCURRENCY = int(os.getenv('PHOTO_FETCH_CONCURRENCY', '4'))
+# Worker processes for hashing
+PHOTO_HASH_WORKERS = int(os.getenv('PHOTO_HASH_WORKERS', '2'))
+
+# Backups
+# Online copies of the SQLite database, gzipped; 0 hours disables the schedule (/admin backup still works).
+# With DB_SHARD_DIR, every shard file is backed up too, into BACKUP_DIR/shards/<shard>
+BACKUP_DIR = os.getenv('BACKUP_DIR', 'backups')
+BACKUP_INTERVAL_HOURS = float(os.getenv('BACKUP_INTERVAL_HOURS', '24'))
+BACKUP_KEEP = int(os.getenv('BACKUP_KEEP', '7'))
+# Pages copied per step (4 KiB each by default) and the pause after each, while the database is free
+BACKUP_PAGES_PER_STEP = int(os.getenv('BACKUP_PAGES_PER_STEP', '256'))
+BACKUP_STEP_PAUSE_MS = float(os.getenv('BACKUP_STEP_PAUSE_MS', '5'))
+
+# Event log
+# Every committed chain and credit change is appended here; replay_events.py rebuilds the tables from it.
+# With DB_SHARD_DIR, each shard has its own log in EVENT_LOG_DIR/shards/<shard>. Empty disables the log
+EVENT_LOG_DIR = os.getenv('EVENT_LOG_DIR', 'event_log')
+EVENT_LOG_SEGMENT_MB = int(os.getenv('EVENT_LOG_SEGMENT_MB', '64'))
+# A snapshot of every table is folded from the log after this many events (0 never)
+EVENT_LOG_SNAPSHOT_EVERY = int(os.getenv('EVENT_LOG_SNAPSHOT_EVERY', '10000'))
+# fsync each record rather than leaving it to the OS; survives power loss, costs a disk flush per drink check
+EVENT_LOG_FSYNC = os.getenv('EVENT_LOG_FSYNC', '0').lower() in ('1', 'true', 'yes')
+
+# Logging
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+# 'text' or 'json' (one object per line)
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+# Per-module levels, e.g. "bot.events=DEBUG,discord=WARNING"
+LOG_LEVELS = os.getenv('LOG_LEVELS', 'discord.gateway=WARNING,discord.client=WARNING')
+# Keep one in N sub-warning records from noisy modules, e.g. "bot.trackers=100"
+LOG_SAMPLE = os.getenv('LOG_SAMPLE', '')
+
+# Gateway memory
+# Skip downloading every guild's member list at startup and don't keep members or messages
+# after the event that carried them. Names come from the database instead (see NAME_CACHE_SIZE)
+LOW_MEMORY_MODE = os.getenv('LOW_MEMORY_MODE', '0').lower() in ('1', 'true', 'yes')
+
 # Bot permissions and intents
 REQUIRED_PERMISSIONS = [
     'send_messages',
@@ -30,4 +139,7 @@ REQUIRED_PERMISSIONS = [
 ]
 
 # Chain settings
-CHAIN_TIMEOUT_MINUTES = 30  # How long until a chain expires
\ No newline at end of file
+# Defaults for every guild; /admin config overrides them per guild at runtime
+CHAIN_TIMEOUT_MINUTES = int(os.getenv('CHAIN_TIMEOUT_MINUTES', '30'))  # How long until a chain expires
+# Comma-separated words that start a chain
+CHAIN_KEYWORDS = [keyword.strip() for keyword in os.getenv('CHAIN_KEYWORDS', 'drink check,dc').split(',') if keyword.strip()]
\ No newline at end of file
@@ -1,23 +1,81 @@
 #database connection handling
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy.ext.declarative import declarative_base
 from .models import Base
+from .profiler import profiler
 import os
+from typing import Optional
 
 # Use environment variable for database URL or default to SQLite
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///drink_check.db')
+# Read-only connections for commands and other lookups (SQLite files only)
+READ_POOL_SIZE = int(os.getenv('DB_READ_POOL_SIZE', '4'))
+# Seconds a connection waits on a lock held by another one before giving up
+BUSY_TIMEOUT_SECONDS = float(os.getenv('DB_BUSY_TIMEOUT_SECONDS', '5'))
 
-# Create engine
-engine = create_engine(DATABASE_URL)
+def _sqlite_file(url) -> Optional[str]:
+    """Path of the database if it's a SQLite file (not in memory)"""
+    if url.get_backend_name() != 'sqlite' or not url.database or url.database == ':memory:' \
+            or url.database.startswith('file:'):
+        return None
+    return url.database
 
-# Create session factory
+def _set_pragmas(journal_mode: Optional[str]):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if journal_mode:
+            cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+        cursor.execute(f"PRAGMA busy_timeout={int(BUSY_TIMEOUT_SECONDS * 1000)}")
+        cursor.close()
+    return on_connect
+
+def create_engines(url: str, read_pool_size: int = READ_POOL_SIZE):
+    """
+    Write and read engines for a database. For a SQLite file every change goes
+    through one connection, so writers queue in the pool rather than fail on
+    SQLite's lock, and WAL lets the read pool keep reading while it writes.
+    In memory or on another database server, one engine serves both.
+    """
+    database_file = _sqlite_file(make_url(url))
+    if not database_file:
+        engine = create_engine(url)
+        profiler.install(engine)
+        return engine, engine
+
+    write_engine = create_engine(url, pool_size=1, max_overflow=0)
+    event.listen(write_engine, 'connect', _set_pragmas('WAL'))
+    # Opened read-only, so a read session can never take the write lock
+    read_engine = create_engine(
+        f"sqlite:///file:{os.path.abspath(database_file)}?mode=ro&uri=true",
+        pool_size=read_pool_size, max_overflow=read_pool_size,
+    )
+    event.listen(read_engine, 'connect', _set_pragmas(None))
+    # Attribute queries to the running command or event handler
+    profiler.install(write_engine)
+    profiler.install(read_engine)
+    return write_engine, read_engine
+
+engine, read_engine = create_engines(DATABASE_URL)
+
+# Create session factories, one session per thread for each
 session_factory = sessionmaker(bind=engine)
 SessionLocal = scoped_session(session_factory)
+ReadSessionLocal = scoped_session(sessionmaker(bind=read_engine, autoflush=False))
+
+_initialized = False
 
 def init_db():
-    """Initialize the database, creating all tables."""
-    Base.metadata.create_all(bind=engine)
+    """Create the tables and apply pending migrations, so the schema matches the models.
+    Only does work once per process."""
+    global _initialized
+    if _initialized:
+        return
+    # create_all doesn't add columns to existing tables; the migrations do
+    from .migrations import run_migrations
+    run_migrations(engine)
+    _initialized = True
 
 def get_db():
     """Get a database session."""
@@ -27,10 +85,20 @@ def get_db():
     finally:
         db.close()
 
-# Database session context manager
+# Database session context managers
 class DatabaseSession:
-    def __init__(self):
-        self.db = SessionLocal()
+    """Session on the write connection. Use it for anything that changes data, and
+    for reads that must see the transaction's own writes (read, decide, update).
+    With ``guild_id`` the session is on that guild's shard (see database.sharding)"""
+    factory = SessionLocal
+    read_only = False
+
+    def __init__(self, guild_id: Optional[int] = None):
+        factory = self.factory
+        if guild_id is not None:
+            from .sharding import session_factory
+            factory = session_factory(guild_id, self.read_only) or factory
+        self.db = factory()
     
     def __enter__(self):
         return self.db
@@ -38,5 +106,7 @@ class DatabaseSession:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.db.close()
 
-# Initialize database on import if tables don't exist
-init_db()
\ No newline at end of file
+class ReadSession(DatabaseSession):
+    """Session on the read-only pool. Never waits for the writer and fails if it tries to write"""
+    factory = ReadSessionLocal
+    read_only = True
@@ -0,0 +1,298 @@
+"""
+Versioned schema migrations.
+
+Migrations are applied in order and recorded in the ``schema_version`` table,
+so running the migrator again only applies what is still missing. Data
+backfills run in bounded chunks keyed on the table's primary key and commit a
+checkpoint after every chunk, which keeps each write transaction short enough
+for the bot to stay online and lets an interrupted migration resume where it
+stopped.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, List, Optional
+import logging
+import time
+
+import pytz
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+from .models import Base
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_PAUSE_SECONDS = 0.05
+
+
+class MigrationContext:
+    """Helpers handed to each migration for idempotent DDL and chunked backfills."""
+
+    def __init__(self, engine: Engine, version: int, batch_size: int, pause: float):
+        self.engine = engine
+        self.version = version
+        self.batch_size = batch_size
+        self.pause = pause
+
+    def has_column(self, table: str, column: str) -> bool:
+        """Check whether a column already exists on a table."""
+        columns = inspect(self.engine).get_columns(table)
+        return any(col['name'] == column for col in columns)
+
+    def has_index(self, table: str, index: str) -> bool:
+        """Check whether a named index already exists on a table."""
+        return any(idx['name'] == index for idx in inspect(self.engine).get_indexes(table))
+
+    def execute(self, sql: str, **params):
+        """Run a single statement in its own short transaction."""
+        with self.engine.begin() as conn:
+            conn.execute(text(sql), params)
+
+    def add_column(self, table: str, column: str, ddl: str):
+        """Add a column unless it is already there."""
+        if self.has_column(table, column):
+            logger.info(f"Column {table}.{column} already exists, skipping")
+            return
+        self.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+        logger.info(f"Added column {table}.{column}")
+
+    def drop_column(self, table: str, column: str):
+        """Drop a column if it still exists."""
+        if not self.has_column(table, column):
+            return
+        self.execute(f"ALTER TABLE {table} DROP COLUMN {column}")
+        logger.info(f"Dropped column {table}.{column}")
+
+    def rename_column(self, table: str, old: str, new: str) -> bool:
+        """Rename a column if the old name is present and the new one is not."""
+        if not self.has_column(table, old) or self.has_column(table, new):
+            return False
+        self.execute(f"ALTER TABLE {table} RENAME COLUMN {old} TO {new}")
+        logger.info(f"Renamed column {table}.{old} to {new}")
+        return True
+
+    def create_index(self, table: str, index: str, columns: str):
+        """Create an index unless one with the same name exists."""
+        if self.has_index(table, index):
+            return
+        self.execute(f"CREATE INDEX {index} ON {table} ({columns})")
+        logger.info(f"Created index {index} on {table}")
+
+    def backfill(self, step: str, table: str, key: str, assignments: str, where: Optional[str] = None):
+        """
+        Run ``UPDATE table SET assignments`` over the table in primary-key chunks,
+        only for rows matching ``where`` if given. Progress is checkpointed per
+        chunk under ``step`` so a rerun picks up after the last committed chunk
+        instead of starting over.
+        """
+        condition = f" AND ({where})" if where else ""
+        last_key = _load_checkpoint(self.engine, self.version, step)
+        updated = 0
+        while True:
+            with self.engine.begin() as conn:
+                upper = conn.execute(
+                    text(f"SELECT MAX({key}) FROM (SELECT {key} FROM {table} "
+                         f"WHERE {key} > :last ORDER BY {key} LIMIT :limit) AS chunk"),
+                    {"last": last_key, "limit": self.batch_size}
+                ).scalar()
+                if upper is None:
+                    break
+
+                result = conn.execute(
+                    text(f"UPDATE {table} SET {assignments} WHERE {key} > :last AND {key} <= :upper{condition}"),
+                    {"last": last_key, "upper": upper}
+                )
+                updated += result.rowcount or 0
+                _save_checkpoint(conn, self.version, step, upper)
+
+            last_key = upper
+            # Give the bot a chance to grab the write lock between chunks
+            if self.pause:
+                time.sleep(self.pause)
+
+        logger.info(f"Backfill {step} updated {updated} rows in {table}")
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    apply: Callable[[MigrationContext], None]
+    # True if the schema already has the change (a database created or migrated
+    # before versioning); the migration is then recorded without running
+    present: Callable[[MigrationContext], bool]
+
+
+def _add_chain_tracking_columns(ctx: MigrationContext):
+    """Columns introduced with server record tracking (formerly migrate_db.py)."""
+    ctx.add_column('active_chains', 'is_server_record', 'BOOLEAN DEFAULT 0')
+
+
+def _streak_system(ctx: MigrationContext):
+    """Switch from participant tracking to total message streaks (formerly migrate_streak.py)."""
+    if not ctx.rename_column('users', 'longest_chain_participation', 'longest_chain_streak'):
+        ctx.add_column('users', 'longest_chain_streak', 'INTEGER DEFAULT 0')
+    ctx.add_column('active_chains', 'total_messages', 'INTEGER DEFAULT 1')
+    ctx.drop_column('active_chains', 'unique_participants_count')
+    ctx.drop_column('active_chains', 'participant_ids')
+
+    # Recount chain lengths from the drink checks that belong to them. Only chains
+    # still at the column default, and never to less than they already have
+    chain_count = "(SELECT COUNT(*) FROM drink_checks WHERE drink_checks.chain_id = active_chains.chain_id)"
+    ctx.backfill(
+        'chain_totals', 'active_chains', 'chain_id',
+        f"total_messages = CASE WHEN {chain_count} > COALESCE(total_messages, 0) "
+        f"THEN {chain_count} ELSE COALESCE(total_messages, 1) END",
+        where="total_messages IS NULL OR total_messages <= 1"
+    )
+
+    # Longest chain each user took part in, for users who don't have one yet
+    ctx.backfill(
+        'user_streaks', 'users', 'user_id',
+        "longest_chain_streak = COALESCE((SELECT MAX(ac.total_messages) FROM active_chains ac "
+        "JOIN drink_checks dc ON dc.chain_id = ac.chain_id "
+        "WHERE dc.user_id = users.user_id), 0)",
+        where="longest_chain_streak IS NULL OR longest_chain_streak = 0"
+    )
+
+
+def _has_streak_system(ctx: MigrationContext) -> bool:
+    return ctx.has_column('users', 'longest_chain_streak') and ctx.has_column('active_chains', 'total_messages') \
+        and not ctx.has_column('active_chains', 'unique_participants_count') \
+        and not ctx.has_column('active_chains', 'participant_ids')
+
+
+def _chain_version(ctx: MigrationContext):
+    """Row version for optimistic locking of chain updates."""
+    ctx.add_column('active_chains', 'version', 'INTEGER NOT NULL DEFAULT 0')
+
+
+def _chain_expiry_index(ctx: MigrationContext):
+    """Index for finding and closing expired chains in SQL."""
+    ctx.create_index('active_chains', 'ix_active_chains_active_last_activity', 'is_active, last_activity')
+
+
+# Ordered list of every schema change. Append new migrations to the end.
+MIGRATIONS: List[Migration] = [
+    Migration(1, 'chain_tracking_columns', _add_chain_tracking_columns,
+              lambda ctx: ctx.has_column('active_chains', 'is_server_record')),
+    Migration(2, 'streak_system', _streak_system, _has_streak_system),
+    Migration(3, 'chain_version', _chain_version,
+              lambda ctx: ctx.has_column('active_chains', 'version')),
+    Migration(4, 'chain_expiry_index', _chain_expiry_index,
+              lambda ctx: ctx.has_index('active_chains', 'ix_active_chains_active_last_activity')),
+]
+
+
+def _ensure_version_tables(engine: Engine):
+    """Create the bookkeeping tables used by the migrator."""
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                applied_at VARCHAR(64) NOT NULL
+            )
+        """))
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS migration_checkpoints (
+                version INTEGER NOT NULL,
+                step VARCHAR(255) NOT NULL,
+                last_key BIGINT NOT NULL,
+                PRIMARY KEY (version, step)
+            )
+        """))
+
+
+def _load_checkpoint(engine: Engine, version: int, step: str) -> int:
+    with engine.connect() as conn:
+        last_key = conn.execute(
+            text("SELECT last_key FROM migration_checkpoints WHERE version = :version AND step = :step"),
+            {"version": version, "step": step}
+        ).scalar()
+    if last_key is not None:
+        logger.info(f"Resuming {step} of migration {version} after key {last_key}")
+    return last_key if last_key is not None else -1
+
+
+def _has_checkpoint(engine: Engine, version: int) -> bool:
+    with engine.connect() as conn:
+        return conn.execute(
+            text("SELECT 1 FROM migration_checkpoints WHERE version = :version"), {"version": version}
+        ).first() is not None
+
+
+def _save_checkpoint(conn, version: int, step: str, last_key: int):
+    updated = conn.execute(
+        text("UPDATE migration_checkpoints SET last_key = :last_key WHERE version = :version AND step = :step"),
+        {"version": version, "step": step, "last_key": last_key}
+    )
+    if not updated.rowcount:
+        conn.execute(
+            text("INSERT INTO migration_checkpoints (version, step, last_key) VALUES (:version, :step, :last_key)"),
+            {"version": version, "step": step, "last_key": last_key}
+        )
+
+
+def applied_versions(engine: Engine) -> List[int]:
+    """Versions already recorded in the schema_version table."""
+    _ensure_version_tables(engine)
+    with engine.connect() as conn:
+        return [row[0] for row in conn.execute(text("SELECT version FROM schema_version ORDER BY version"))]
+
+
+def current_version(engine: Engine) -> int:
+    """Highest applied migration version, or 0 for an unmigrated database."""
+    versions = applied_versions(engine)
+    return versions[-1] if versions else 0
+
+
+def pending_migrations(engine: Engine, target: Optional[int] = None) -> List[Migration]:
+    """Migrations that have not been applied yet, up to ``target`` if given."""
+    applied = set(applied_versions(engine))
+    return [
+        migration for migration in MIGRATIONS
+        if migration.version not in applied and (target is None or migration.version <= target)
+    ]
+
+
+def run_migrations(engine: Optional[Engine] = None, target: Optional[int] = None,
+                   batch_size: int = DEFAULT_BATCH_SIZE,
+                   pause: float = DEFAULT_PAUSE_SECONDS) -> List[int]:
+    """Apply pending migrations in order and return the versions that ran or were recorded."""
+    if engine is None:
+        from .connection import engine
+
+    # Fresh databases get the current schema; migrations then only record themselves
+    Base.metadata.create_all(bind=engine)
+
+    ran = []
+    for migration in pending_migrations(engine, target):
+        ctx = MigrationContext(engine, migration.version, batch_size, pause)
+        # A schema that already has the change is only recorded, so its backfills never
+        # overwrite live data. One with a checkpoint was interrupted and carries on
+        if migration.present(ctx) and not _has_checkpoint(engine, migration.version):
+            logger.info(f"Schema already has migration {migration.version}: {migration.name}, recording it")
+        else:
+            logger.info(f"Applying migration {migration.version}: {migration.name}")
+            migration.apply(ctx)
+
+        with engine.begin() as conn:
+            conn.execute(
+                text("INSERT INTO schema_version (version, name, applied_at) VALUES (:version, :name, :applied_at)"),
+                {
+                    "version": migration.version,
+                    "name": migration.name,
+                    "applied_at": datetime.utcnow().replace(tzinfo=pytz.UTC).isoformat()
+                }
+            )
+            conn.execute(
+                text("DELETE FROM migration_checkpoints WHERE version = :version"),
+                {"version": migration.version}
+            )
+        ran.append(migration.version)
+        logger.info(f"Migration {migration.version} applied")
+
+    return ran
@@ -1,5 +1,5 @@
 #database models/schema
-from sqlalchemy import Column, Integer, BigInteger, String, Boolean, DateTime, ForeignKey, create_engine, Enum as SQLEnum
+from sqlalchemy import Column, Integer, BigInteger, String, Text, Boolean, DateTime, ForeignKey, Index, create_engine, or_, update, Enum as SQLEnum
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime, timedelta
@@ -11,6 +11,38 @@ Base = declarative_base()
 # Set up Central timezone
 central = pytz.timezone('America/Chicago')
 
+def default_chain_timeout() -> timedelta:
+    """Timeout for guilds that haven't set their own (CHAIN_TIMEOUT_MINUTES)"""
+    from config.settings import CHAIN_TIMEOUT_MINUTES
+    return timedelta(minutes=CHAIN_TIMEOUT_MINUTES)
+
+def chain_is_expired(last_activity, now=None, timeout: timedelta = None) -> bool:
+    """Check if a chain with this last activity has expired (``timeout`` of inactivity, CHAIN_TIMEOUT_MINUTES by default)"""
+    if not last_activity:
+        return True
+        
+    # Get current time in UTC since our timestamps are in UTC
+    now = now or datetime.utcnow().replace(tzinfo=pytz.UTC)
+    
+    # Convert last_activity to UTC for comparison (if it's not already)
+    last_activity_utc = last_activity.replace(tzinfo=pytz.UTC) if last_activity.tzinfo is None else last_activity
+    
+    return (now - last_activity_utc) > (timeout or default_chain_timeout())
+
+def close_expired_chains(db, now=None, timeout: timedelta = None) -> int:
+    """
+    Close every active chain that has expired with a single UPDATE (no rows are
+    loaded). Returns how many were closed; the caller commits.
+    """
+    now = now or datetime.utcnow().replace(tzinfo=pytz.UTC)
+    result = db.execute(
+        update(ActiveChain)
+        .where(ActiveChain.is_active.is_(True), ActiveChain.expired_clause(now, timeout))
+        .values(is_active=False, version=ActiveChain.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount or 0
+
 class CreditType(enum.Enum):
     initial = 'initial'
     chain = 'chain'
@@ -77,6 +109,12 @@ class ActiveChain(Base):
     is_active = Column(Boolean, default=True)
     total_messages = Column(Integer, default=1)  # Total messages in chain
     is_server_record = Column(Boolean, default=False)  # Whether this chain set a server record
+    version = Column(Integer, default=0, server_default="0", nullable=False)  # Incremented on every update, for optimistic locking
+
+    __table_args__ = (
+        # Expiry checks and bulk closes filter on these two columns
+        Index('ix_active_chains_active_last_activity', 'is_active', 'last_activity'),
+    )
 
     # Relationships
     drink_checks = relationship("DrinkCheck", back_populates="chain")
@@ -84,16 +122,40 @@ class ActiveChain(Base):
     def __repr__(self):
         return f"<ActiveChain(chain_id={self.chain_id}, starter_id={self.starter_id}, is_active={self.is_active})>"
 
-    def is_expired(self):
-        """Check if the chain has expired (30 minutes of inactivity)"""
-        if not self.last_activity:
-            return True
-            
-        # Get current time in UTC since our timestamps are in UTC
-        now = datetime.utcnow().replace(tzinfo=pytz.UTC)
-        
-        # Convert last_activity to UTC for comparison (if it's not already)
-        last_activity_utc = self.last_activity.replace(tzinfo=pytz.UTC) if self.last_activity.tzinfo is None else self.last_activity
-        
-        # Chain expires after 30 minutes of inactivity
-        return (now - last_activity_utc) > timedelta(minutes=30)
\ No newline at end of file
+    def is_expired(self, now=None, timeout: timedelta = None):
+        """Check if the chain has expired (``timeout`` of inactivity). ``now`` defaults to the current UTC time"""
+        return chain_is_expired(self.last_activity, now, timeout)
+
+    @classmethod
+    def expired_clause(cls, now, timeout: timedelta = None):
+        """is_expired as a SQL condition, so expired chains can be filtered or closed in the database"""
+        cutoff = now - (timeout or default_chain_timeout())
+        # Timestamps are stored as UTC
+        cutoff = cutoff.astimezone(pytz.UTC) if cutoff.tzinfo else cutoff
+        return or_(cls.last_activity.is_(None), cls.last_activity < cutoff)
+
+class PhotoHash(Base):
+    __tablename__ = 'photo_hashes'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    sha256 = Column(String(64), unique=True, nullable=False)  # Exact bytes
+    dhash = Column(BigInteger, nullable=False)  # 64-bit perceptual hash, stored signed
+    message_id = Column(BigInteger, ForeignKey('drink_checks.message_id'))  # Drink check that first used the photo
+    user_id = Column(BigInteger, ForeignKey('users.user_id'))
+    created_at = Column(DateTime(timezone=True))
+
+    def __repr__(self):
+        return f"<PhotoHash(sha256='{self.sha256[:12]}', message_id={self.message_id})>"
+
+
+class GuildSetting(Base):
+    __tablename__ = 'guild_config'
+
+    guild_id = Column(BigInteger, primary_key=True)
+    key = Column(String(64), primary_key=True)  # Setting name, see bot.guild_config.PARSERS
+    value = Column(Text, nullable=False)  # JSON
+    updated_at = Column(DateTime(timezone=True))
+    updated_by = Column(BigInteger, nullable=True)  # Admin who last changed it
+
+    def __repr__(self):
+        return f"<GuildSetting(guild_id={self.guild_id}, key='{self.key}', value={self.value})>"
@@ -0,0 +1,180 @@
+"""
+SQL query profiler.
+
+Hooks SQLAlchemy's cursor events and attributes every statement to the slash
+command or event handler that is running (tracked in a context variable, so
+it follows the work into ``asyncio.to_thread``). For each operation it keeps
+the number of invocations, queries and time spent. Statements slower than
+the threshold are logged with their query plan, and a SELECT repeated many
+times in one invocation is flagged as a likely N+1 pattern.
+"""
+
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+import functools
+import logging
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class QueryScope:
+    """Queries issued during one invocation of an operation."""
+    name: str
+    count: int = 0
+    total_time: float = 0.0
+    statements: Counter = field(default_factory=Counter)
+    flagged: set = field(default_factory=set)
+
+@dataclass
+class OperationStats:
+    """Totals for every invocation of one operation."""
+    invocations: int = 0
+    queries: int = 0
+    total_time: float = 0.0
+    max_queries: int = 0
+    n_plus_one: int = 0
+
+    @property
+    def queries_per_invocation(self) -> float:
+        return self.queries / self.invocations if self.invocations else 0.0
+
+_current_scope: ContextVar[Optional[QueryScope]] = ContextVar('query_scope', default=None)
+
+class QueryProfiler:
+    def __init__(self, enabled: bool = True, slow_query_ms: float = 100.0, n_plus_one_threshold: int = 5):
+        self.enabled = enabled
+        self.slow_query_seconds = slow_query_ms / 1000
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.operations: Dict[str, OperationStats] = {}
+
+    def install(self, engine: Engine):
+        """Attach the cursor event hooks to an engine (once per engine)."""
+        # Asks the engine rather than remembering ids, which are reused once a shard's engine is closed
+        if event.contains(engine, 'before_cursor_execute', self._before_execute):
+            return
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.enabled:
+            conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not self.enabled:
+            return
+        starts = conn.info.get('query_start')
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+
+        scope = _current_scope.get()
+        if scope is not None:
+            scope.count += 1
+            scope.total_time += elapsed
+            scope.statements[statement] += 1
+            repeats = scope.statements[statement]
+            if repeats == self.n_plus_one_threshold and statement.lstrip().upper().startswith('SELECT'):
+                scope.flagged.add(statement)
+                logger.warning(
+                    f"Possible N+1 in {scope.name}: statement ran {repeats} times in one invocation: "
+                    f"{_shorten(statement)}"
+                )
+
+        if elapsed >= self.slow_query_seconds:
+            operation = scope.name if scope else "unattributed"
+            plan = "" if executemany else self._query_plan(conn, statement, parameters)
+            logger.warning(
+                f"Slow query ({elapsed * 1000:.1f}ms) in {operation}: {_shorten(statement)}"
+                + (f"\nPlan:\n{plan}" if plan else "")
+            )
+
+    def _query_plan(self, conn, statement: str, parameters) -> str:
+        """EXPLAIN the statement on the raw DBAPI connection so no events fire."""
+        prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == 'sqlite' else "EXPLAIN "
+        try:
+            cursor = conn.connection.dbapi_connection.cursor()
+            try:
+                cursor.execute(prefix + statement, parameters or ())
+                return "\n".join(" | ".join(str(col) for col in row) for row in cursor.fetchall())
+            finally:
+                cursor.close()
+        except Exception as e:
+            return f"(plan unavailable: {e})"
+
+    @contextmanager
+    def scope(self, name: str):
+        """Attribute every query issued inside the block to ``name``."""
+        if not self.enabled or _current_scope.get() is not None:
+            # Nested scopes count towards the outermost operation
+            yield
+            return
+
+        query_scope = QueryScope(name)
+        token = _current_scope.set(query_scope)
+        try:
+            yield query_scope
+        finally:
+            _current_scope.reset(token)
+            self._record(query_scope)
+
+    def _record(self, query_scope: QueryScope):
+        stats = self.operations.get(query_scope.name)
+        if stats is None:
+            stats = self.operations[query_scope.name] = OperationStats()
+        stats.invocations += 1
+        stats.queries += query_scope.count
+        stats.total_time += query_scope.total_time
+        stats.max_queries = max(stats.max_queries, query_scope.count)
+        stats.n_plus_one += len(query_scope.flagged)
+        if query_scope.count:
+            logger.debug(
+                f"{query_scope.name}: {query_scope.count} queries in {query_scope.total_time * 1000:.1f}ms"
+            )
+
+    def profiled(self, name: str):
+        """Decorator form of scope() for async handlers. Keeps the signature for discord.py."""
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.scope(name):
+                    return await func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def reset(self):
+        self.operations.clear()
+
+    def summary(self) -> str:
+        """Per-operation table for the /admin queries command."""
+        if not self.enabled:
+            return "Query profiler is disabled (set QUERY_PROFILER_ENABLED=1 to turn it on)."
+        if not self.operations:
+            return "No queries recorded yet."
+
+        lines = [f"{'operation':<20}{'calls':>7}{'q/call':>8}{'max':>6}{'ms/call':>9}{'n+1':>5}"]
+        ordered = sorted(self.operations.items(), key=lambda item: item[1].total_time, reverse=True)
+        for name, stats in ordered:
+            ms_per_call = stats.total_time * 1000 / stats.invocations if stats.invocations else 0.0
+            lines.append(
+                f"{name:<20}{stats.invocations:>7}{stats.queries_per_invocation:>8.1f}"
+                f"{stats.max_queries:>6}{ms_per_call:>9.2f}{stats.n_plus_one:>5}"
+            )
+        return "\n".join(lines)
+
+def _shorten(statement: str, limit: int = 300) -> str:
+    flat = " ".join(statement.split())
+    return flat if len(flat) <= limit else flat[:limit] + "..."
+
+def _profiler_from_settings() -> QueryProfiler:
+    from config.settings import QUERY_PROFILER_ENABLED, SLOW_QUERY_MS, N_PLUS_ONE_THRESHOLD
+    return QueryProfiler(QUERY_PROFILER_ENABLED, SLOW_QUERY_MS, N_PLUS_ONE_THRESHOLD)
+
+# Process-wide profiler, installed on the engine in database.connection
+profiler = _profiler_from_settings()
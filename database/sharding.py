@@ -0,0 +1,242 @@
+#per-guild database shards
+import contextvars
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TypeVar
+
+from sqlalchemy.orm import Session, sessionmaker
+
+from .connection import SessionLocal, ReadSessionLocal, create_engines
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Directory of per-guild SQLite files. Unset keeps every guild in DATABASE_URL.
+# Each shard is backed up into BACKUP_DIR/shards/<shard> and logged into EVENT_LOG_DIR/shards/<shard>
+SHARD_DIR = os.getenv('DB_SHARD_DIR') or None
+# Guilds that share a shard rather than getting their own file, e.g. "1234=main,5678=small,9012=small".
+# The shard "main" is DATABASE_URL itself, so a server that was there before sharding keeps its data
+SHARD_MAP = os.getenv('DB_SHARD_MAP', '')
+# Shards with open engines at once; the least recently used one is closed beyond this
+SHARD_POOL_SIZE = int(os.getenv('DB_SHARD_POOL_SIZE', '32'))
+# Read connections per shard (the main database uses DB_READ_POOL_SIZE)
+SHARD_READ_POOL_SIZE = int(os.getenv('DB_SHARD_READ_POOL_SIZE', '2'))
+# Shards queried at the same time by fan_out
+SHARD_FANOUT_WORKERS = int(os.getenv('DB_SHARD_FANOUT_WORKERS', '8'))
+
+# Name of DATABASE_URL among the shards
+MAIN_SHARD = 'main'
+
+def parse_shard_map(value: str) -> Dict[int, str]:
+    """"guild=shard,guild=shard" -> {guild: shard}"""
+    mapping = {}
+    for item in value.split(','):
+        if not item.strip():
+            continue
+        guild_id, _, shard = item.partition('=')
+        shard = shard.strip()
+        # Shard names become file names
+        if not guild_id.strip().isdigit() or not re.fullmatch(r'[\w-]+', shard):
+            raise ValueError(f"Invalid DB_SHARD_MAP entry: {item!r}")
+        mapping[int(guild_id)] = shard
+    return mapping
+
+class Shard:
+    """Write and read engines for one shard file, opened like the main database"""
+
+    def __init__(self, name: str, path: str, read_pool_size: int):
+        self.name = name
+        self.path = path
+        url = f"sqlite:///{path}"
+        self.engine, self.read_engine = create_engines(url, read_pool_size)
+        self.Session = sessionmaker(bind=self.engine)
+        self.ReadSession = sessionmaker(bind=self.read_engine, autoflush=False)
+
+    def dispose(self):
+        # Sessions still holding a connection keep it until they close
+        self.engine.dispose()
+        if self.read_engine is not self.engine:
+            self.read_engine.dispose()
+
+class EnginePool:
+    """
+    Routes each guild to a SQLite file of its own (``<directory>/guild-<id>.db``)
+    or to the shard DB_SHARD_MAP gives it. Every shard has its own single
+    writer, so guilds don't queue behind each other's writes.
+
+    Engines are opened on first use, with the schema created or migrated then,
+    and at most ``max_open`` stay open: the least recently used shard is
+    closed to make room. A shard that's closed while a session is using it
+    finishes that session normally and is reopened by the next one.
+    """
+
+    def __init__(self, directory: str, mapping: Optional[Dict[int, str]] = None, max_open: int = 32,
+                 read_pool_size: int = 2, workers: int = 8):
+        self.directory = directory
+        self.mapping = mapping or {}
+        self.max_open = max(1, max_open)
+        self.read_pool_size = read_pool_size
+        self.workers = workers
+        self._open: 'OrderedDict[str, Shard]' = OrderedDict()
+        # Shards whose schema is known to be current, so reopening skips the migration check
+        self._migrated = set()
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.opened = 0
+        self.evicted = 0
+
+    def shard_for(self, guild_id: int) -> Optional[str]:
+        """Name of the shard holding a guild's data, None for the main database"""
+        shard = self.mapping.get(guild_id, f"guild-{guild_id}")
+        return None if shard == MAIN_SHARD else shard
+
+    def path(self, shard: str) -> str:
+        return os.path.join(self.directory, f"{shard}.db")
+
+    def shards(self) -> List[str]:
+        """Every shard with a file on disk, plus mapped ones that haven't been written yet"""
+        names = set(shard for shard in self.mapping.values() if shard != MAIN_SHARD)
+        if os.path.isdir(self.directory):
+            names.update(name[:-len('.db')] for name in os.listdir(self.directory) if name.endswith('.db'))
+        names.discard(MAIN_SHARD)
+        return sorted(names)
+
+    def get(self, shard: str) -> Shard:
+        """The shard's engines, opening them (and closing the least recently used) if needed"""
+        evicted = None
+        with self._lock:
+            found = self._open.get(shard)
+            if found is not None:
+                self._open.move_to_end(shard)
+                return found
+            # Opening is rare and quick (a schema check at most), so other lookups just wait for it
+            found = self._open_shard(shard)
+            self._open[shard] = found
+            if len(self._open) > self.max_open:
+                _, evicted = self._open.popitem(last=False)
+                self.evicted += 1
+        if evicted is not None:
+            logger.debug(f"Closing shard {evicted.name} to stay within {self.max_open} open shards")
+            evicted.dispose()
+        return found
+
+    def _open_shard(self, shard: str) -> Shard:
+        from .migrations import run_migrations
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(shard)
+        is_new = not os.path.exists(path)
+        opened = Shard(shard, path, self.read_pool_size)
+        if shard not in self._migrated:
+            # Creates the file, so the read-only engine can open it
+            run_migrations(opened.engine)
+            self._migrated.add(shard)
+        self.opened += 1
+        if is_new:
+            logger.info(f"Created database shard {path}")
+        return opened
+
+    def is_ready(self, shard: str) -> bool:
+        """True once the shard's schema is current, so opening it again is only creating engines"""
+        return shard in self._migrated
+
+    def open_shards(self) -> List[str]:
+        with self._lock:
+            return list(self._open)
+
+    def fan_out(self, work: Callable[[Session], T], write: bool = False,
+                shards: Optional[Iterable[str]] = None) -> Dict[str, T]:
+        """
+        Run ``work(db)`` against the main database and every shard at the same
+        time, on up to ``workers`` threads, and return the results by shard name
+        (MAIN_SHARD for the main database). Sessions are read-only unless
+        ``write``, in which case ``work`` commits. The first failure is raised.
+        """
+        names = [MAIN_SHARD] + self.shards() if shards is None else list(shards)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='shard')
+        # Carry the profiler's scope into the workers
+        futures = [self._executor.submit(contextvars.copy_context().run, self._run, name, work, write)
+                   for name in names]
+        return {name: future.result() for name, future in zip(names, futures)}
+
+    def session(self, shard: str, write: bool = False) -> Session:
+        """A new session on the shard (MAIN_SHARD for the main database); the caller closes it"""
+        if shard == MAIN_SHARD:
+            return SessionLocal() if write else ReadSessionLocal()
+        opened = self.get(shard)
+        return opened.Session() if write else opened.ReadSession()
+
+    def _run(self, shard: str, work: Callable[[Session], T], write: bool) -> T:
+        db = self.session(shard, write)
+        try:
+            return work(db)
+        finally:
+            db.close()
+
+    def close(self):
+        """Close every open shard and the fan-out threads"""
+        with self._lock:
+            opened, self._open = list(self._open.values()), OrderedDict()
+        for shard in opened:
+            shard.dispose()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+shards: Optional[EnginePool] = EnginePool(
+    SHARD_DIR, parse_shard_map(SHARD_MAP), SHARD_POOL_SIZE, SHARD_READ_POOL_SIZE, SHARD_FANOUT_WORKERS
+) if SHARD_DIR else None
+
+def shard_for(guild_id: Optional[int]) -> Optional[str]:
+    """Shard holding a guild's data; None for the main database (always, without DB_SHARD_DIR)"""
+    if shards is None or guild_id is None:
+        return None
+    return shards.shard_for(guild_id)
+
+def needs_opening(guild_id: Optional[int]) -> bool:
+    """True if the guild's shard hasn't been created or migrated yet in this process.
+    Opening it then may take a while, so handlers do it on a worker thread first"""
+    shard = shard_for(guild_id)
+    return shard is not None and not shards.is_ready(shard)
+
+def open_shard(guild_id: int):
+    """Open the guild's shard, creating or migrating it. Blocking"""
+    shard = shard_for(guild_id)
+    if shard is not None:
+        shards.get(shard)
+
+def session_factory(guild_id: int, read_only: bool = False) -> Optional[Callable[[], Session]]:
+    """Session factory for a guild's shard, or None if its data is in the main database"""
+    shard = shard_for(guild_id)
+    if shard is None:
+        return None
+    opened = shards.get(shard)
+    return opened.ReadSession if read_only else opened.Session
+
+def fan_out(work: Callable[[Session], T], write: bool = False) -> Dict[str, T]:
+    """``work(db)`` against every database, by shard name; just the main one without sharding"""
+    if shards is None:
+        db = SessionLocal() if write else ReadSessionLocal()
+        try:
+            return {MAIN_SHARD: work(db)}
+        finally:
+            db.close()
+    return shards.fan_out(work, write)
+
+def each_shard(work: Callable[[Session], Iterable[T]]) -> Iterator[T]:
+    """
+    Everything ``work(db)`` yields from each database in turn, for reads too
+    large to hold at once (fan_out collects every result before returning)
+    """
+    for shard in [MAIN_SHARD] + (shards.shards() if shards is not None else []):
+        db = shards.session(shard) if shards is not None else ReadSessionLocal()
+        try:
+            yield from work(db)
+        finally:
+            db.close()
@@ -1,35 +1,60 @@
 #entry point for the application
+import time
 
+# Taken before anything else is imported so the startup breakdown covers imports too
+PROCESS_START = time.perf_counter()
+
+import asyncio
 import discord
 from discord.ext import commands
-from bot.trackers import DrinkCheckTracker
-from bot.stats import StatsManager
-from bot.database import Database
-from commands.stats import StatsCommands
-from commands.admin import AdminCommands
-from commands.help import HelpCommands
-from config.settings import DISCORD_TOKEN, TRACKED_CHANNELS
+from bot.backup import get_backup_manager
+from bot.cache import get_state_cache
+from bot.command_sync import sync_command_tree
+from bot.dispatch import get_dispatcher
+from bot.stats import get_stats_manager
+from bot.log_config import setup_logging, parse_mapping
+from bot.metrics import metrics, start_metrics_server
+from bot.startup import StartupTimer, run_concurrently
+from config.settings import (
+    DISCORD_TOKEN,
+    COMMAND_SYNC_STATE_PATH, COMMAND_SYNC_GUILD_ID, FORCE_COMMAND_SYNC,
+    METRICS_HOST, METRICS_PORT,
+    LOG_LEVEL, LOG_FORMAT, LOG_LEVELS, LOG_SAMPLE,
+    SHUTDOWN_DRAIN_SECONDS, BACKUP_INTERVAL_HOURS, LOW_MEMORY_MODE
+)
 import os
 import logging
 from database.connection import init_db
+from database import sharding
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler()  # Console handler
-    ]
-)
 logger = logging.getLogger(__name__)
 
-# Reduce logging from frequently triggered events
-logging.getLogger('discord.gateway').setLevel(logging.WARNING)
-logging.getLogger('discord.client').setLevel(logging.WARNING)
+# Extensions are independent of each other and are loaded concurrently
+EXTENSIONS = [
+    'bot.events.message_events',
+    'commands.stats',
+    'commands.admin',
+    'commands.help',
+]
+
+def gateway_cache_options(low_memory: bool) -> dict:
+    """
+    discord.py cache settings. By default every guild's member list is
+    downloaded at startup and kept. Commands get the members they need in the
+    interaction payload and names come from the database, so the low memory
+    mode keeps neither members nor messages around.
+    """
+    if not low_memory:
+        return {}
+    return {
+        'chunk_guilds_at_startup': False,
+        'member_cache_flags': discord.MemberCacheFlags.none(),
+        'max_messages': None,
+    }
 
 class DrinkCheckBot(commands.Bot):
     def __init__(self):
@@ -40,46 +65,100 @@ class DrinkCheckBot(commands.Bot):
         super().__init__(
             command_prefix='',  # Empty prefix since we only use slash commands
             intents=intents,
-            help_command=None  # We'll implement our own help command
+            help_command=None,  # We'll implement our own help command
+            **gateway_cache_options(LOW_MEMORY_MODE)
         )
+        self.startup_timer = StartupTimer(PROCESS_START)
+        self.metrics_runner = None
     
     async def setup_hook(self):
         """This is called when the bot starts up"""
         logger.info("Starting bot setup...")
+        timer = self.startup_timer
+        
+        # Pending migrations run in a worker thread while the cogs load; cog setup doesn't touch the DB.
+        # A failed migration stops the bot before any handler sees an outdated schema
+        stages = {'database': asyncio.to_thread(init_db)}
+        stages.update({f'extension:{name}': self.load_extension(name) for name in EXTENSIONS})
+        await run_concurrently(timer, stages)
+        logger.info("Database initialized and extensions loaded")
+        
+        # Warm caches now that the schema exists
+        await timer.timed('warm_up', self.warm_up())
         
-        # Initialize database
-        init_db()
-        logger.info("Database initialized")
+        # Sync slash commands once per process, and only if they changed.
+        # on_ready fires again on every reconnect, so syncing there is wasteful.
+        await timer.timed('command_sync', sync_command_tree(
+            self.tree,
+            COMMAND_SYNC_STATE_PATH,
+            guild_id=COMMAND_SYNC_GUILD_ID,
+            force=FORCE_COMMAND_SYNC
+        ))
         
-        # Load all cogs
-        await self.load_extension('bot.events.message_events')
-        await self.load_extension('commands.stats')
-        await self.load_extension('commands.admin')  # Load admin commands
-        await self.load_extension('commands.help')  # Load help commands
-        logger.info("Extensions loaded")
+        # Local Prometheus endpoint, if configured
+        if METRICS_PORT and metrics.enabled:
+            self.metrics_runner = await start_metrics_server(metrics, METRICS_HOST, METRICS_PORT)
+        
+        # Scheduled online backups
+        backups = get_backup_manager(self)
+        if backups and BACKUP_INTERVAL_HOURS > 0:
+            backups.start_schedule(BACKUP_INTERVAL_HOURS)
+        
+        logger.info(timer.summary())
+    
+    async def warm_up(self):
+        """Run every cog's warm_up() concurrently, then let message handlers through"""
+        warmers = [cog.warm_up() for cog in self.cogs.values() if hasattr(cog, 'warm_up')]
+        try:
+            await asyncio.gather(*warmers)
+        except Exception as e:
+            # Cold caches fall back to the database, so a failed warm-up isn't fatal
+            logger.error(f"Cache warm-up failed: {e}", exc_info=True)
+        finally:
+            get_state_cache(self).ready.set()
+    
+    async def close(self):
+        """Finish pending Discord calls and stop the metrics endpoint along with the bot"""
+        # Reactions and notices still need the connection, so they're drained first
+        await get_dispatcher(self).drain(SHUTDOWN_DRAIN_SECONDS)
+        get_stats_manager(self).close()
+        if sharding.shards is not None:
+            sharding.shards.close()
+        backups = get_backup_manager(self)
+        if backups:
+            await backups.stop()
+        if self.metrics_runner:
+            await self.metrics_runner.cleanup()
+            self.metrics_runner = None
+        await super().close()
     
     async def on_ready(self):
         """Called when the bot is ready to start working"""
         logger.info(f'Logged in as {self.user.name} ({self.user.id})')
-        
-        # Sync slash commands
-        logger.info("Syncing slash commands...")
-        await self.tree.sync()
-        logger.info("Slash commands synced")
+        self.startup_timer.mark('ready')
 
 def run_bot():
     """Run the bot with the token from environment"""
+    # Handlers run on a background thread; frequently triggered loggers are quietened via LOG_LEVELS
+    log_listener = setup_logging(
+        LOG_LEVEL, LOG_FORMAT, parse_mapping(LOG_LEVELS),
+        {name: int(rate) for name, rate in parse_mapping(LOG_SAMPLE).items()}
+    )
+    
     # Create bot instance
     bot = DrinkCheckBot()
     
     # Get token from environment
-    token = os.getenv('DISCORD_TOKEN')
+    token = DISCORD_TOKEN or os.getenv('DISCORD_TOKEN')
     if not token:
-        raise ValueError("No Discord token found in environment variables!")
+        raise ValueError("No Discord token found in environment variables! Please set DISCORD_TOKEN in your .env file.")
     
     # Run the bot
     logger.info("Starting bot...")
-    bot.run(token, log_handler=None)  # Disable default discord.py logging
+    try:
+        bot.run(token, log_handler=None)  # Disable default discord.py logging
+    finally:
+        log_listener.stop()  # Flush anything still queued
 
 if __name__ == "__main__":
     run_bot()
\ No newline at end of file
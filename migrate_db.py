@@ -1,58 +1,69 @@
 """
-Migration script to add new chain tracking columns to the database.
-Run this script once after updating the code to add the new columns.
+Apply pending database migrations.
+
+Migrations are versioned (see database/migrations.py), so this script is safe
+to run repeatedly and against a live database: already applied migrations are
+skipped and data backfills resume from their last checkpoint.
+
+Usage:
+    python migrate_db.py                 # apply everything pending
+    python migrate_db.py --status        # show applied and pending migrations
+    python migrate_db.py --target 2      # stop after migration 2
 """
 
-from sqlalchemy import create_engine, text
+import argparse
 import logging
 
+from database.migrations import (
+    DEFAULT_BATCH_SIZE, DEFAULT_PAUSE_SECONDS,
+    applied_versions, pending_migrations, run_migrations
+)
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def migrate_database():
-    """Add new columns for chain tracking."""
+def migrate_database(target=None, batch_size=DEFAULT_BATCH_SIZE, pause=DEFAULT_PAUSE_SECONDS):
+    """Apply pending migrations up to target (or all of them)."""
     try:
-        # Create engine
-        engine = create_engine('sqlite:///drink_check.db')
-        
-        # Add new columns if they don't exist
-        with engine.connect() as conn:
-            # Add columns to users table
-            conn.execute(text("""
-                ALTER TABLE users 
-                ADD COLUMN longest_chain_participation INTEGER DEFAULT 0;
-            """))
-            
-            # Add columns to active_chains table
-            conn.execute(text("""
-                ALTER TABLE active_chains 
-                ADD COLUMN unique_participants_count INTEGER DEFAULT 1;
-            """))
-            
-            conn.execute(text("""
-                ALTER TABLE active_chains 
-                ADD COLUMN participant_ids TEXT DEFAULT '';
-            """))
-            
-            conn.execute(text("""
-                ALTER TABLE active_chains 
-                ADD COLUMN is_server_record BOOLEAN DEFAULT 0;
-            """))
-            
-            # Commit the changes
-            conn.commit()
-            
-        logger.info("Successfully added new columns to database")
+        ran = run_migrations(target=target, batch_size=batch_size, pause=pause)
+        if ran:
+            logger.info(f"Applied migrations: {', '.join(str(v) for v in ran)}")
+        else:
+            logger.info("Database is already up to date")
         return True
-        
+
     except Exception as e:
         logger.error(f"Error during migration: {e}")
         return False
 
+def print_status():
+    """Print applied and pending migrations."""
+    from database.connection import engine
+
+    print(f"Applied: {applied_versions(engine) or 'none'}")
+    pending = pending_migrations(engine)
+    print("Pending:" if pending else "Pending: none")
+    for migration in pending:
+        print(f"  {migration.version}: {migration.name}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Apply pending database migrations")
+    parser.add_argument('--status', action='store_true', help="Show migration status and exit")
+    parser.add_argument('--target', type=int, default=None, help="Highest migration version to apply")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Rows updated per backfill transaction")
+    parser.add_argument('--pause', type=float, default=DEFAULT_PAUSE_SECONDS,
+                        help="Seconds to sleep between backfill chunks")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    success = migrate_database()
-    if success:
-        print("Migration completed successfully!")
+    args = parse_args()
+    if args.status:
+        print_status()
     else:
-        print("Migration failed. Check the logs for details.") 
\ No newline at end of file
+        success = migrate_database(args.target, args.batch_size, args.pause)
+        if success:
+            print("Migration completed successfully!")
+        else:
+            print("Migration failed. Check the logs for details.")
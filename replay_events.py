@@ -0,0 +1,148 @@
+"""
+Rebuild the database from the event log.
+
+Loads the newest snapshot in the log directory, applies the records logged
+after it in memory and writes every table to a new SQLite file in bulk
+inserts. --until-seq stops at an earlier point in the history (the nearest
+older snapshot is used); --no-snapshot replays from the first snapshot.
+
+--rederive ignores the logged effects and runs the chain rules again over the
+logged messages, optionally with a different --timeout-minutes, to see what
+the tables would look like under other settings.
+
+Usage:
+    python replay_events.py event_log --db rebuilt.db
+    python replay_events.py event_log --db before.db --until-seq 120000
+    python replay_events.py event_log --db what_if.db --rederive --timeout-minutes 60
+    python replay_events.py event_log/shards/guild-1234 --db guild-1234.db   # one shard's log
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from datetime import timedelta
+
+# Rows per INSERT batch
+INSERT_BATCH = 10000
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Rebuild the database from the event log")
+    parser.add_argument('log_dir', help="Event log directory (EVENT_LOG_DIR)")
+    parser.add_argument('--db', required=True, help="SQLite file to write; must not exist")
+    parser.add_argument('--until-seq', type=int, default=None, help="Stop after this sequence number")
+    parser.add_argument('--no-snapshot', action='store_true',
+                        help="Start from the oldest snapshot rather than the newest")
+    parser.add_argument('--rederive', action='store_true', help="Run the chain rules again instead of using logged effects")
+    parser.add_argument('--timeout-minutes', type=float, default=None,
+                        help="Chain timeout for --rederive (default: whatever each message was logged with)")
+    return parser.parse_args()
+
+def load(args):
+    from bot import event_log
+
+    if not args.no_snapshot and not args.rederive:
+        return event_log.load_state(args.log_dir, args.until_seq)
+
+    found = event_log.snapshots(args.log_dir)
+    if not found:
+        raise SystemExit(f"No snapshot in {args.log_dir}")
+    state = event_log.read_snapshot(found[0][1])
+    records = event_log.read_records(args.log_dir, state.seq, args.until_seq)
+    if not args.rederive:
+        for record in records:
+            state.apply(record)
+        return state
+    return rederive(state, records, args.timeout_minutes)
+
+def rederive(state, records, timeout_minutes):
+    """Apply each logged message through a ChainEngine rather than its logged effects"""
+    from bot.chain_engine import ChainEngine, ManualClock, MessageEvent
+    from bot.event_log import record_time
+
+    # Only whether a message held a keyword was logged, so any one keyword stands in
+    keyword = 'drink check'
+    clock = ManualClock()
+    engines = {}
+    engine_state = state.engine_state()
+    for record in records:
+        if record['kind'] != 'drink_check':
+            # Admin changes don't go through the chain rules
+            state.apply(record)
+            engine_state = state.engine_state()
+            continue
+        timeout = timeout_minutes * 60 if timeout_minutes is not None else record['timeout']
+        engine = engines.get(timeout)
+        if engine is None:
+            engine = engines[timeout] = ChainEngine(clock=clock, timeout=timedelta(seconds=timeout),
+                                                    keywords=[keyword])
+        logged = record['event']
+        event = MessageEvent(
+            message_id=logged['message_id'],
+            author_id=logged['author_id'],
+            content=keyword if logged['has_keyword'] else '',
+            attachment_count=logged['attachment_count'],
+            is_reply=logged['is_reply'],
+            replied_to_message_id=logged['replied_to_message_id'],
+        )
+        clock.set(record_time(record))
+        engine_state, effects = engine.step(engine_state, event)
+        state.user(event.author_id, record.get('username'))
+        for effect in effects:
+            state.apply_effect(effect)
+        state.seq = record['seq']
+    return state
+
+def write(state, db_path):
+    from sqlalchemy import create_engine, event
+    from database.models import Base
+    from database.migrations import run_migrations
+    from bot.event_log import SNAPSHOT_TABLES
+
+    engine = create_engine(f"sqlite:///{db_path}")
+
+    @event.listens_for(engine, "connect")
+    def fast_writes(dbapi_connection, connection_record):
+        # A half-written file is thrown away, not recovered, so skip the journal and syncs
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=OFF")
+        cursor.execute("PRAGMA synchronous=OFF")
+        cursor.close()
+
+    run_migrations(engine)
+    counts = {}
+    with engine.begin() as conn:
+        for name in SNAPSHOT_TABLES:
+            table, columns = Base.metadata.tables[name], SNAPSHOT_TABLES[name]
+            rows = state.rows(name)
+            for start in range(0, len(rows), INSERT_BATCH):
+                batch = [{column: row.get(column) for column in columns} for row in rows[start:start + INSERT_BATCH]]
+                conn.execute(table.insert(), batch)
+            counts[name] = len(rows)
+    engine.dispose()
+    return counts
+
+def main():
+    args = parse_args()
+    if os.path.exists(args.db):
+        raise SystemExit(f"{args.db} already exists")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    logging.basicConfig(level=logging.WARNING)
+
+    started = time.perf_counter()
+    state = load(args)
+    loaded = time.perf_counter()
+    try:
+        counts = write(state, args.db)
+    except BaseException:
+        if os.path.exists(args.db):
+            os.remove(args.db)
+        raise
+    finished = time.perf_counter()
+
+    print(f"Rebuilt {args.db} at seq {state.seq}: " + ', '.join(f"{count} {name}" for name, count in counts.items()))
+    print(f"Replayed in {loaded - started:.2f}s, written in {finished - loaded:.2f}s")
+
+if __name__ == "__main__":
+    main()
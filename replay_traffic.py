@@ -0,0 +1,140 @@
+"""
+Replay recorded gateway traffic through the message pipeline.
+
+Reads a log written with TRAFFIC_LOG_PATH set and feeds each message to
+MessageEvents.on_message against a scratch database, preserving the recorded
+inter-arrival times divided by --speed. The bot's clock is scaled by the same
+factor, so a 30 minute chain timeout lasts 30 seconds at --speed 60. With
+--speed 0 messages are replayed back to back and the clock jumps straight to
+each recorded timestamp.
+
+Usage:
+    python replay_traffic.py traffic.log.gz --speed 60
+    python replay_traffic.py traffic.log --speed 0 --db replay.db
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay recorded message traffic")
+    parser.add_argument('log', help="Traffic log written by the bot (TRAFFIC_LOG_PATH)")
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="Time compression factor; 0 replays as fast as possible")
+    parser.add_argument('--db', default=None, help="Database to replay into (default: a temporary file)")
+    parser.add_argument('--channels', default=None,
+                        help="Comma-separated channel ids to replay (default: every recorded channel)")
+    parser.add_argument('--discord-latency-ms', type=float, default=0, help="Simulated REST latency for sends and reactions")
+    parser.add_argument('--verbose', action='store_true', help="Keep the bot's INFO logging")
+    return parser.parse_args()
+
+def to_message(record, channels):
+    from benchmarks.fakes import FakeMessage, FakeUser
+
+    channel = channels[record.channel_id]
+    message = FakeMessage(
+        FakeUser(record.author_id, bot=record.author_bot), channel,
+        # Only whether the content held a keyword was recorded
+        content='drink check' if record.has_keyword else '',
+        attachments=record.attachments,
+        reply_to=record.reply_to,
+        guild_id=record.guild_id,
+    )
+    message.id = record.message_id
+    return message
+
+async def replay(args):
+    import main as app
+    from benchmarks.fakes import FakeChannel
+    from bot.chain_engine import ManualClock
+    from bot.metrics import metrics
+    from bot.traffic import ScaledClock, read_traffic, record_time
+    from database.connection import init_db
+    from database.profiler import profiler
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    wanted = {int(c) for c in args.channels.split(',')} if args.channels else None
+    records = [r for r in read_traffic(args.log) if wanted is None or r.channel_id in wanted]
+    if not records:
+        print("No traffic to replay")
+        return
+    records.sort(key=lambda r: r.timestamp)
+    origin = record_time(records[0])
+
+    bot = app.DrinkCheckBot()
+    # The cogs pick the clock up when they're created
+    bot.clock = ScaledClock(origin, args.speed) if args.speed > 0 else ManualClock(origin)
+    init_db()
+    for extension in app.EXTENSIONS:
+        await bot.load_extension(extension)
+    await bot.warm_up()
+
+    cog = bot.get_cog('MessageEvents')
+    latency = args.discord_latency_ms / 1000
+    channels = {cid: FakeChannel(cid, latency) for cid in {r.channel_id for r in records}}
+
+    lags = []
+    metrics.reset()
+    profiler.reset()
+    started = time.perf_counter()
+    if args.speed > 0:
+        bot.clock.restart()
+        tasks = []
+        for record in records:
+            due = started + (record.timestamp - records[0].timestamp) / args.speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            lags.append(max(0.0, time.perf_counter() - due))
+            tasks.append(asyncio.create_task(cog.on_message(to_message(record, channels))))
+        await asyncio.gather(*tasks)
+    else:
+        for record in records:
+            bot.clock.set(record_time(record))
+            await cog.on_message(to_message(record, channels))
+    elapsed = time.perf_counter() - started
+    # Let the background reactions and notices finish before counting them
+    await bot.dispatcher.drain()
+
+    span = records[-1].timestamp - records[0].timestamp
+    print(f"Replayed {len(records)} messages ({span / 60:.1f} recorded minutes) in {elapsed:.2f}s "
+          f"({len(records) / elapsed if elapsed else 0:.1f} msg/s)")
+    if lags:
+        lags.sort()
+        print(f"Dispatch lag: p50 {lags[len(lags) // 2] * 1000:.2f}ms, "
+              f"p99 {lags[min(len(lags) - 1, int(len(lags) * 0.99))] * 1000:.2f}ms, max {lags[-1] * 1000:.2f}ms")
+    print(f"Messages sent: {sum(len(c.sent) for c in channels.values())}")
+    print()
+    print(metrics.summary())
+    print()
+    print(profiler.summary())
+    await bot.close()
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        # Point the app at the replay database before anything imports database.connection
+        db_path = os.path.abspath(args.db) if args.db else os.path.join(tmp, 'replay.db')
+        os.environ['DATABASE_URL'] = f"sqlite:///{db_path}"
+        os.environ['COMMAND_SYNC_STATE_PATH'] = os.path.join(tmp, 'command_sync.json')
+        # Don't record the replay itself
+        os.environ['TRAFFIC_LOG_PATH'] = ''
+        # Nor log its changes next to the live bot's
+        os.environ['EVENT_LOG_DIR'] = os.path.join(tmp, 'event_log')
+        # Every guild goes into the replay database, never into the live shard files
+        os.environ['DB_SHARD_DIR'] = ''
+        os.environ['DB_SHARD_MAP'] = ''
+        # Replay everything that was recorded, whatever TRACKED_CHANNELS says now
+        os.environ['TRACKED_CHANNELS'] = ''
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        asyncio.run(replay(args))
+
+if __name__ == "__main__":
+    main()
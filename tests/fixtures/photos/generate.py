@@ -0,0 +1,44 @@
+"""
+Regenerate the photo fixtures used by tests/test_attachments.py.
+
+Usage:
+    python tests/fixtures/photos/generate.py
+"""
+
+import os
+import random
+
+from PIL import Image, ImageDraw
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SIZE = 64
+
+def scene(seed: int) -> Image.Image:
+    """A small "photo": a gradient with a few coloured shapes, different for every seed"""
+    rng = random.Random(seed)
+    image = Image.new('RGB', (SIZE, SIZE))
+    draw = ImageDraw.Draw(image)
+    for y in range(SIZE):
+        shade = 40 + y * 3
+        draw.line([(0, y), (SIZE, y)], fill=(shade, shade // 2, 255 - shade))
+    for _ in range(6):
+        x, y = rng.randrange(SIZE - 16), rng.randrange(SIZE - 16)
+        w, h = rng.randrange(8, 24), rng.randrange(8, 24)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        (draw.ellipse if rng.random() < 0.5 else draw.rectangle)([x, y, x + w, y + h], fill=color)
+    return image
+
+def main():
+    photo = scene(1)
+    photo.save(os.path.join(HERE, 'photo.png'))
+    # The same photo posted again after a trip through another app
+    photo.save(os.path.join(HERE, 'photo_reencoded.jpg'), quality=70)
+    photo.resize((48, 48), Image.LANCZOS).save(os.path.join(HERE, 'photo_resized.png'))
+    scene(2).save(os.path.join(HERE, 'other.png'))
+    # Featureless shots: evenly lit, and two different near-black ones
+    Image.new('RGB', (SIZE, SIZE), (200, 180, 160)).save(os.path.join(HERE, 'flat.png'))
+    Image.new('RGB', (SIZE, SIZE), (4, 4, 4)).save(os.path.join(HERE, 'dark.png'))
+    Image.new('RGB', (SIZE, SIZE), (7, 5, 9)).save(os.path.join(HERE, 'dark_other.png'))
+
+if __name__ == "__main__":
+    main()
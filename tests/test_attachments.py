@@ -0,0 +1,75 @@
+#duplicate drink photo detection against the images in fixtures/photos
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip('PIL')
+
+from benchmarks.fakes import FakeAttachment, FakeChannel, FakeMessage, FakeUser
+from bot.attachments import AttachmentValidator, MIN_HASH_BITS, fingerprint_bytes, is_distinctive
+
+PHOTOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'photos')
+
+def photo_bytes(name: str) -> bytes:
+    with open(os.path.join(PHOTOS, name), 'rb') as f:
+        return f.read()
+
+def fingerprint(name: str):
+    result = fingerprint_bytes(photo_bytes(name))
+    assert result is not None
+    return result
+
+@pytest.fixture
+def validator():
+    validator = AttachmentValidator(executor=ThreadPoolExecutor(max_workers=1))
+    yield validator
+    validator.close()
+
+def test_unreadable_bytes_have_no_fingerprint():
+    assert fingerprint_bytes(b'not an image') is None
+
+@pytest.mark.parametrize('name', ['photo_reencoded.jpg', 'photo_resized.png'])
+def test_reposted_photo_matches(validator, name):
+    validator.remember([fingerprint('photo.png')], message_id=1)
+    repost = fingerprint(name)
+    assert repost.sha256 != fingerprint('photo.png').sha256
+    assert validator.find_duplicates([repost]) == [1]
+    assert validator.is_repost([repost])
+
+def test_different_photo_does_not_match(validator):
+    validator.remember([fingerprint('photo.png')], message_id=1)
+    assert validator.find_duplicates([fingerprint('other.png')]) == [None]
+    assert not validator.is_repost([fingerprint('other.png')])
+
+@pytest.mark.parametrize('name', ['flat.png', 'dark.png', 'dark_other.png'])
+def test_featureless_photo_is_not_distinctive(name):
+    value_hash = fingerprint(name).dhash
+    assert not is_distinctive(value_hash)
+    assert bin(value_hash).count('1') < MIN_HASH_BITS
+
+def test_featureless_photos_never_match_each_other(validator):
+    validator.remember([fingerprint('dark.png')], message_id=1)
+    validator.remember([fingerprint('flat.png')], message_id=2)
+    assert validator.find_duplicates([fingerprint('dark_other.png')]) == [None]
+    assert not validator.is_repost([fingerprint('dark_other.png')])
+
+def test_identical_featureless_photo_still_matches(validator):
+    # The exact same file is caught by its checksum even though its hash is ignored
+    validator.remember([fingerprint('dark.png')], message_id=1)
+    assert validator.find_duplicates([fingerprint('dark.png')]) == [1]
+
+def test_fingerprint_message_reads_image_attachments(validator):
+    message = FakeMessage(FakeUser(1), FakeChannel(1), attachments=0)
+    message.attachments = [
+        FakeAttachment('photo.png', data=photo_bytes('photo.png')),
+        FakeAttachment('copy.png', data=photo_bytes('photo.png')),
+        FakeAttachment('notes.txt', content_type='text/plain', data=b'hello'),
+        FakeAttachment('repost.jpg', content_type='image/jpeg', data=photo_bytes('photo_reencoded.jpg')),
+    ]
+    fingerprints = asyncio.run(validator.fingerprint_message(message))
+    # The two copies of the same file are one photo, the text file isn't checked
+    assert len(fingerprints) == 2
+    validator.remember(fingerprints[:1], message_id=1)
+    assert validator.find_duplicates(fingerprints[1:]) == [1]